@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+from . import db
+from .schemas import StoryPrompt
+
+# Generation cache configuration
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+# Max prompt keys held in the in-process LRU tier
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "1024"))
+# Seconds a cached story stays servable (both tiers)
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+# Distinct stories kept per key; requests rotate among them once all exist
+GENERATION_CACHE_VARIANTS = int(os.getenv("GENERATION_CACHE_VARIANTS", "3"))
+# Max rows kept in the generation_cache table
+GENERATION_CACHE_DB_MAX_ROWS = int(os.getenv("GENERATION_CACHE_DB_MAX_ROWS", "10000"))
+# Run table eviction once every this many stores
+GENERATION_CACHE_EVICT_EVERY = int(os.getenv("GENERATION_CACHE_EVICT_EVERY", "100"))
+
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).lower()
+
+
+def generation_cache_key(prompt: StoryPrompt, model: str, temperature: float) -> str:
+    """Hash the normalized prompt fields plus the model settings"""
+    parts = [
+        _normalize(prompt.character_type),
+        _normalize(prompt.setting_type),
+        _normalize(prompt.theme_type),
+        _normalize(prompt.age_group),
+        _normalize(prompt.language),
+        _normalize(prompt.story_length),
+        _normalize(prompt.style),
+        _normalize(prompt.custom_prompt),
+        model,
+        f"{temperature:.3f}",
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Two-tier cache of generated stories keyed on the normalized prompt.
+
+    The in-process LRU tier answers repeated preset combinations without a
+    round-trip; the Postgres tier (``generation_cache`` table) is shared by
+    all workers and survives restarts. Each key holds up to ``variants``
+    stories. A key only counts as a hit once all variants exist, so the
+    first ``variants`` requests generate fresh stories and later ones rotate
+    among them.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = GENERATION_CACHE_ENABLED,
+        max_entries: int = GENERATION_CACHE_SIZE,
+        ttl: float = GENERATION_CACHE_TTL,
+        variants: int = GENERATION_CACHE_VARIANTS,
+        db_max_rows: int = GENERATION_CACHE_DB_MAX_ROWS,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.db_max_rows = db_max_rows
+        # key -> {"stories": [...], "next": int, "expires": float}
+        self._entries = OrderedDict()
+        self._stores_since_evict = 0
+        self.stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "db_evictions": 0,
+            "errors": 0,
+        }
+
+    def _remember(self, key: str, stories: list):
+        self._entries[key] = {
+            "stories": stories,
+            "next": self._entries.get(key, {}).get("next", 0),
+            "expires": time.monotonic() + self.ttl,
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def _rotate(self, key: str) -> dict:
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        story = entry["stories"][entry["next"] % len(entry["stories"])]
+        entry["next"] += 1
+        return dict(story)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return a cached {"title", "content"} dict, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry["expires"] < time.monotonic():
+                del self._entries[key]
+            elif len(entry["stories"]) >= self.variants:
+                self.stats["memory_hits"] += 1
+                return self._rotate(key)
+
+        try:
+            async with db.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT story FROM generation_cache
+                    WHERE cache_key = $1
+                      AND created_at > NOW() - make_interval(secs => $2)
+                    ORDER BY variant
+                    LIMIT $3
+                    """,
+                    key, self.ttl, self.variants
+                )
+                if len(rows) >= self.variants:
+                    await conn.execute(
+                        "UPDATE generation_cache SET last_used_at = NOW(), hits = hits + 1 WHERE cache_key = $1",
+                        key
+                    )
+        except Exception as e:
+            print(f"Generation cache lookup failed: {type(e).__name__}: {str(e)}")
+            self.stats["errors"] += 1
+            rows = []
+
+        if rows:
+            self._remember(key, [json.loads(row["story"]) for row in rows])
+            if len(rows) >= self.variants:
+                self.stats["db_hits"] += 1
+                return self._rotate(key)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def warm(self, limit: int):
+        """Load the most recently used complete keys into the memory tier"""
+        if not self.enabled or limit <= 0:
+            return 0
+        async with db.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT cache_key, array_agg(story ORDER BY variant) AS stories
+                FROM generation_cache
+                WHERE created_at > NOW() - make_interval(secs => $1)
+                GROUP BY cache_key
+                HAVING COUNT(*) >= $2
+                ORDER BY MAX(last_used_at) DESC
+                LIMIT $3
+                """,
+                self.ttl, self.variants, min(limit, self.max_entries)
+            )
+        # Oldest first, so the most recently used keys end up hottest in the LRU
+        for row in reversed(rows):
+            self._remember(row["cache_key"], [json.loads(story) for story in row["stories"][:self.variants]])
+        return len(rows)
+
+    async def put(self, key: str, title: str, content: str):
+        """Store a freshly generated story as another variant of key"""
+        if not self.enabled:
+            return
+
+        story = {"title": title, "content": content}
+        entry = self._entries.get(key)
+        stories = list(entry["stories"]) if entry else []
+        if len(stories) < self.variants:
+            stories.append(story)
+        self._remember(key, stories)
+        self.stats["stores"] += 1
+
+        try:
+            async with db.acquire() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO generation_cache (cache_key, variant, story)
+                    SELECT $1, COALESCE(MAX(variant) + 1, 0), $2::jsonb
+                    FROM generation_cache WHERE cache_key = $1
+                    HAVING COUNT(*) < $3
+                    ON CONFLICT (cache_key, variant) DO NOTHING
+                    """,
+                    key, json.dumps(story), self.variants
+                )
+                self._stores_since_evict += 1
+                if self._stores_since_evict >= GENERATION_CACHE_EVICT_EVERY:
+                    self._stores_since_evict = 0
+                    await self._evict(conn)
+        except Exception as e:
+            print(f"Generation cache store failed: {type(e).__name__}: {str(e)}")
+            self.stats["errors"] += 1
+
+    async def _evict(self, conn):
+        """Drop expired rows, then the least recently used beyond the size cap"""
+        expired = await conn.execute(
+            "DELETE FROM generation_cache WHERE created_at <= NOW() - make_interval(secs => $1)",
+            self.ttl
+        )
+        overflow = await conn.execute(
+            """
+            DELETE FROM generation_cache WHERE (cache_key, variant) IN (
+                SELECT cache_key, variant FROM generation_cache
+                ORDER BY last_used_at DESC
+                OFFSET $1
+            )
+            """,
+            self.db_max_rows
+        )
+        self.stats["db_evictions"] += int(expired.split()[-1]) + int(overflow.split()[-1])
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["memory_hits"] + self.stats["db_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["db_hits"]
+        return {
+            **self.stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "variants": self.variants,
+            "enabled": self.enabled,
+        }
+
+
+# Shared cache for this worker process
+generation_cache = GenerationCache()
@@ -0,0 +1,172 @@
+import os
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import asyncpg
+
+from . import db
+from .schemas import StoryPromptResponse
+from .story_cache import make_etag
+
+# Prompt catalog configuration
+# Seconds between version checks; catches changes whose NOTIFY was missed
+CATALOG_POLL_INTERVAL = float(os.getenv("CATALOG_POLL_INTERVAL", "30"))
+# max-age sent with /api/story-prompts responses
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "60"))
+
+CATALOG_CHANNEL = "story_prompts_changed"
+
+
+def _combo(prompt) -> Tuple[str, ...]:
+    return tuple(
+        (value or "").strip().lower()
+        for value in (prompt.character_type, prompt.setting_type, prompt.theme_type,
+                      prompt.age_group, prompt.language)
+    )
+
+
+class CatalogEntry:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = make_etag(body)
+
+    @property
+    def cache_control(self) -> str:
+        return f"public, max-age={CATALOG_MAX_AGE}"
+
+
+class PromptCatalog:
+    """The story_prompts table held in memory as pre-serialized responses.
+
+    Every (language, age_group) filter combination, including the
+    unfiltered ones, maps to a ready JSON body with its ETag, so a request
+    is a dict lookup. setup.py installs a trigger that bumps the
+    ``catalog_versions`` counter and sends a NOTIFY on every change; the
+    catalog reloads on the notification, and a periodic version check
+    covers notifications lost while the listener was disconnected.
+    """
+
+    def __init__(self, poll_interval: float = CATALOG_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.version: Optional[int] = None
+        self._entries: Dict[Tuple[Optional[str], Optional[str]], CatalogEntry] = {}
+        self._empty = CatalogEntry(b"[]")
+        # Normalized (character, setting, theme, age group, language) of every prompt
+        self._combos: frozenset = frozenset()
+        self._listener: Optional[asyncpg.Connection] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._reload_lock: Optional[asyncio.Lock] = None
+        # Reloads started by notifications; referenced so they are not collected mid-run
+        self._reloads = set()
+        self.stats = {"reloads": 0, "notifications": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def has_combo(self, prompt) -> bool:
+        """Whether a story prompt picks one of the catalog's preset combinations"""
+        return _combo(prompt) in self._combos
+
+    def get(self, language: Optional[str], age_group: Optional[str]) -> CatalogEntry:
+        """Response for a filter combination (an empty list if nothing matches)"""
+        return self._entries.get((language or None, age_group or None), self._empty)
+
+    async def reload(self):
+        """Rebuild every response from the story_prompts table"""
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            async with db.acquire() as conn:
+                async with conn.transaction(isolation="repeatable_read", readonly=True):
+                    version = await conn.fetchval(
+                        "SELECT version FROM catalog_versions WHERE name = 'story_prompts'"
+                    )
+                    rows = await conn.fetch("SELECT * FROM story_prompts ORDER BY id")
+
+            prompts = [StoryPromptResponse(**dict(row)) for row in rows]
+            groups: Dict[Tuple[Optional[str], Optional[str]], list] = {}
+            for prompt in prompts:
+                for key in ((None, None), (prompt.language, None), (None, prompt.age_group),
+                            (prompt.language, prompt.age_group)):
+                    groups.setdefault(key, []).append(prompt)
+
+            entries = {}
+            for key, group in groups.items():
+                body = b"[" + b",".join(prompt.model_dump_json().encode() for prompt in group) + b"]"
+                entries[key] = CatalogEntry(body)
+
+            # Swap in the new index in one assignment
+            self._entries = entries
+            self._combos = frozenset(_combo(prompt) for prompt in prompts)
+            self.version = version or 0
+            self.stats["reloads"] += 1
+            print(f"Prompt catalog loaded: {len(prompts)} prompts, version {self.version}")
+
+    async def _current_version(self) -> Optional[int]:
+        async with db.acquire() as conn:
+            return await conn.fetchval("SELECT version FROM catalog_versions WHERE name = 'story_prompts'")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.stats["notifications"] += 1
+        task = asyncio.get_running_loop().create_task(self._reload_logged())
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _reload_logged(self):
+        try:
+            await self.reload()
+        except Exception as e:
+            print(f"Prompt catalog reload failed: {type(e).__name__}: {str(e)}")
+
+    async def _listen(self):
+        if self._listener is not None and not self._listener.is_closed():
+            return
+        self._listener = await asyncpg.connect(os.getenv("DATABASE_URL"))
+        await self._listener.add_listener(CATALOG_CHANNEL, self._on_notify)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                # Re-establish LISTEN if the connection dropped, then catch up
+                await self._listen()
+                if await self._current_version() != self.version:
+                    await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Prompt catalog check failed: {type(e).__name__}: {str(e)}")
+
+    async def start(self):
+        """Load the catalog and follow changes (called from the startup hook)"""
+        try:
+            await self._listen()
+        except Exception as e:
+            print(f"Prompt catalog listener unavailable, polling only: {str(e)}")
+        await self._reload_logged()
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        tasks = [task for task in (self._poller, *self._reloads) if task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._poller = None
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "version": self.version, "entries": len(self._entries)}
+
+
+# Shared catalog for this worker process
+prompt_catalog = PromptCatalog()
@@ -0,0 +1,141 @@
+import os
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .metrics import counter, histogram, FAST_BUCKETS
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Response compression configuration
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+# Supported encodings in order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/css", "application/javascript")
+
+COMPRESSION_DURATION = histogram(
+    "response_compression_seconds", "Time spent compressing response bodies", ("encoding",),
+    buckets=FAST_BUCKETS
+)
+COMPRESSION_BYTES = counter(
+    "response_compression_bytes_total", "Response bytes before and after compression", ("encoding", "stage")
+)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress body with the given content coding ('gzip' or 'br')"""
+    with COMPRESSION_DURATION.time(encoding=encoding):
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+    COMPRESSION_BYTES.inc(len(body), encoding=encoding, stage="in")
+    COMPRESSION_BYTES.inc(len(compressed), encoding=encoding, stage="out")
+    return compressed
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the preferred supported encoding allowed by an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def weak_etag(etag: str) -> str:
+    """A compressed body is not byte-identical, so its ETag becomes weak"""
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+def add_vary(headers: MutableHeaders, field: str):
+    """Add field to the Vary header unless it is listed there already"""
+    listed = [item.strip().lower() for item in headers.get("vary", "").split(",")]
+    if field.lower() not in listed:
+        headers.add_vary_header(field)
+
+
+def _is_compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").split(";")[0].strip()
+    return content_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with brotli or gzip.
+
+    Only complete bodies (a single body message) of COMPRESSION_MIN_SIZE
+    bytes or more are compressed; streaming responses such as Server-Sent
+    Events pass through untouched, and so do responses that already carry
+    a Content-Encoding (e.g. pre-compressed cached stories).
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold the headers until we know what the body looks like
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=list(start["headers"]))
+            if message.get("more_body") or len(body) < self.minimum_size or not _is_compressible(headers):
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            # Handlers serving cached story bodies already vary on Accept-Encoding
+            add_vary(headers, "Accept-Encoding")
+            if "etag" in headers:
+                headers["ETag"] = weak_etag(headers["etag"])
+            start["headers"] = headers.raw
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import asyncpg
+
+from .metrics import DB_ACQUIRE_DURATION, record_query, gauge_callback, counter_callback
+
+# Pool configuration (per worker process)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# Idle connections are closed after this many seconds
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+# Connections idle for longer than this are pinged before being handed out
+DB_HEALTH_CHECK_IDLE = float(os.getenv("DB_HEALTH_CHECK_IDLE", "30"))
+
+_pool: Optional[asyncpg.Pool] = None
+
+# Server PID -> monotonic time the connection was last released
+_last_used = {}
+
+# Pool saturation counters
+_waiting = 0
+_acquire_timeouts = 0
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when no healthy pooled connection can be acquired in time"""
+
+
+async def _init_connection(conn):
+    _last_used[conn.get_server_pid()] = time.monotonic()
+    conn.add_query_logger(record_query)
+
+
+async def init_pool(dsn: Optional[str] = None, min_size: int = DB_POOL_MIN_SIZE,
+                    max_size: int = DB_POOL_MAX_SIZE) -> asyncpg.Pool:
+    """Create the shared connection pool (called once from the startup hook)"""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            dsn or os.getenv("DATABASE_URL"),
+            min_size=min_size,
+            max_size=max_size,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+            init=_init_connection,
+        )
+    return _pool
+
+
+async def close_pool():
+    """Close every pooled connection"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        _last_used.clear()
+
+
+async def warm():
+    """Open and check min_size connections so the first requests don't pay for it"""
+    pool = get_pool()
+
+    async def ping():
+        async with acquire() as conn:
+            await conn.fetchval("SELECT 1")
+
+    await asyncio.gather(*[ping() for _ in range(pool.get_min_size())])
+
+
+async def ping(timeout: float = 1.0) -> bool:
+    """Quick readiness check: can a connection be borrowed and used in time?"""
+    if _pool is None:
+        return False
+    try:
+        async with _pool.acquire(timeout=timeout) as conn:
+            await conn.fetchval("SELECT 1", timeout=timeout)
+        return True
+    except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError):
+        return False
+
+
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise DatabaseUnavailable("Database pool is not initialized")
+    return _pool
+
+
+async def _is_healthy(conn) -> bool:
+    try:
+        await conn.fetchval("SELECT 1", timeout=DB_ACQUIRE_TIMEOUT)
+        return True
+    except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError):
+        return False
+
+
+@asynccontextmanager
+async def acquire():
+    """Borrow a connection from the pool.
+
+    Connections that sat idle longer than DB_HEALTH_CHECK_IDLE are checked
+    with a ``SELECT 1`` first; a broken one is discarded and another is
+    taken from the pool instead.
+    """
+    global _waiting, _acquire_timeouts
+    pool = get_pool()
+    conn = None
+    for _ in range(2):
+        _waiting += 1
+        start = time.perf_counter()
+        try:
+            conn = await pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            _acquire_timeouts += 1
+            raise DatabaseUnavailable(
+                f"Timed out after {DB_ACQUIRE_TIMEOUT}s waiting for a database connection"
+            )
+        finally:
+            _waiting -= 1
+            DB_ACQUIRE_DURATION.observe(time.perf_counter() - start)
+        idle = time.monotonic() - _last_used.get(conn.get_server_pid(), 0)
+        if idle <= DB_HEALTH_CHECK_IDLE or await _is_healthy(conn):
+            break
+        _last_used.pop(conn.get_server_pid(), None)
+        conn.terminate()
+        await pool.release(conn)
+        conn = None
+    if conn is None:
+        raise DatabaseUnavailable("No healthy database connection available")
+
+    try:
+        yield conn
+    finally:
+        _last_used[conn.get_server_pid()] = time.monotonic()
+        await pool.release(conn)
+
+
+def _pool_sizes():
+    if _pool is None:
+        return {}
+    return {
+        ("max",): _pool.get_max_size(),
+        ("open",): _pool.get_size(),
+        ("idle",): _pool.get_idle_size(),
+        ("in_use",): _pool.get_size() - _pool.get_idle_size(),
+        ("waiting",): _waiting,
+    }
+
+
+gauge_callback("db_pool_connections", "Database pool connections by state", _pool_sizes, ("state",))
+counter_callback(
+    "db_pool_acquire_timeouts_total", "Connection acquires that timed out",
+    lambda: {(): _acquire_timeouts}
+)
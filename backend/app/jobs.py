@@ -0,0 +1,182 @@
+import os
+import json
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+from . import db
+from .schemas import StoryPrompt
+
+# Job queue configuration
+# Generation workers per API process (0 disables processing in this process)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Queued jobs allowed before new submissions are rejected
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "200"))
+# Seconds an idle worker waits before polling the table again
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Seconds after which a running job is considered abandoned and retried
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Handler that generates and saves a story, returning the new story id
+JobHandler = Callable[[StoryPrompt, Optional[int]], Awaitable[int]]
+
+
+class QueueFull(Exception):
+    """Raised when JOB_MAX_QUEUED jobs are already waiting"""
+
+
+class JobQueue:
+    """Story generation queue backed by the ``story_jobs`` table.
+
+    Jobs are claimed with ``FOR UPDATE SKIP LOCKED``, so every API replica
+    can run workers against the same table without handing a job out
+    twice. The number of workers bounds LLM concurrency independently of
+    how many HTTP requests are open, and the queued-job cap gives
+    submitters backpressure.
+    """
+
+    def __init__(self, handler: JobHandler, workers: int = JOB_WORKERS,
+                 max_queued: int = JOB_MAX_QUEUED):
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.running = 0
+
+    async def submit(self, prompt: StoryPrompt, user_id: Optional[int]) -> dict:
+        """Insert a queued job and return its row"""
+        async with db.acquire() as conn:
+            queued = await conn.fetchval("SELECT COUNT(*) FROM story_jobs WHERE status = 'queued'")
+            if queued >= self.max_queued:
+                raise QueueFull(f"{queued} story jobs are already queued")
+            job = await conn.fetchrow(
+                """
+                INSERT INTO story_jobs (prompt, user_id)
+                VALUES ($1::jsonb, $2)
+                RETURNING id, status, error, story_id, created_at, started_at, finished_at
+                """,
+                prompt.model_dump_json(), user_id
+            )
+        self._wakeup.set()
+        return dict(job)
+
+    async def _claim(self):
+        async with db.acquire() as conn:
+            return await conn.fetchrow(
+                """
+                UPDATE story_jobs
+                SET status = 'running', started_at = NOW(), attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM story_jobs
+                    WHERE status = 'queued'
+                       OR (status = 'running'
+                           AND started_at < NOW() - make_interval(secs => $1)
+                           AND attempts < $2)
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, prompt, user_id
+                """,
+                JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+            )
+
+    async def _finish(self, job_id, story_id: Optional[int] = None, error: Optional[str] = None):
+        async with db.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE story_jobs
+                SET status = $2, story_id = $3, error = $4, finished_at = NOW()
+                WHERE id = $1
+                """,
+                job_id, "failed" if error else "done", story_id, error
+            )
+
+    async def _fail_abandoned(self):
+        """Give up on jobs that exhausted their attempts without finishing"""
+        async with db.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE story_jobs
+                SET status = 'failed', error = 'Job did not finish in time', finished_at = NOW()
+                WHERE status = 'running'
+                  AND started_at < NOW() - make_interval(secs => $1)
+                  AND attempts >= $2
+                """,
+                JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+            )
+
+    async def _run_job(self, job):
+        self.running += 1
+        try:
+            prompt = StoryPrompt(**json.loads(job["prompt"]))
+            story_id = await self.handler(prompt, job["user_id"])
+            await self._finish(job["id"], story_id=story_id)
+        except Exception as e:
+            print(f"Story job {job['id']} failed: {type(e).__name__}: {str(e)}")
+            await self._finish(job["id"], error=str(e))
+        finally:
+            self.running -= 1
+
+    async def _worker(self):
+        while not self._stopping:
+            try:
+                job = await self._claim()
+                if job is None:
+                    await self._fail_abandoned()
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Story job worker error: {type(e).__name__}: {str(e)}")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    def start(self):
+        """Start the worker tasks (called from the app startup hook)"""
+        self._stopping = False
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, drain_timeout: float = 0):
+        """Stop the workers.
+
+        Workers stop claiming jobs at once; jobs already running get up to
+        drain_timeout seconds to finish before they are cancelled.
+        Interrupted jobs are retried after their lease.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks and drain_timeout > 0:
+            await asyncio.wait(self._tasks, timeout=drain_timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+async def get_job(job_id) -> Optional[dict]:
+    """Fetch a job together with its finished story, if any"""
+    async with db.acquire() as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT j.id, j.status, j.error, j.story_id, j.created_at, j.started_at, j.finished_at,
+                   to_jsonb(s) - 'search_vector' AS story
+            FROM story_jobs j
+            LEFT JOIN stories s ON s.id = j.story_id
+            WHERE j.id = $1
+            """,
+            job_id
+        )
+    if row is None:
+        return None
+    job = dict(row)
+    job["story"] = json.loads(job["story"]) if job["story"] else None
+    return job
@@ -0,0 +1,454 @@
+import os
+import time
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from .metrics import LLM_TIME_TO_FIRST_BYTE, LLM_REQUEST_DURATION, counter, gauge_callback, counter_callback
+from .resilience import (
+    CircuitBreaker, RetryBudget, AdaptiveLimiter, backoff_delay, parse_retry_after, CLOSED, HALF_OPEN, OPEN
+)
+
+# LLM upstream configuration. OPENAI_BASE_URL can point at a local fake
+# completion server for testing and benchmarking.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
+
+# Connection pool and concurrency limits (per worker process)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "48"))
+# The concurrency limit adapts (AIMD) between these bounds; it is halved on
+# 429s, timeouts and slow calls and grows back by one per round of successes
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "2"))
+
+# Timeouts in seconds. The read timeout applies between bytes received,
+# so it bounds stalls rather than total generation time.
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))
+LLM_TOTAL_TIMEOUT = float(os.getenv("LLM_TOTAL_TIMEOUT", "90"))
+
+# Retries for 429/5xx and connection errors, with full-jitter backoff.
+# Retries across all calls are capped at LLM_RETRY_BUDGET_RATIO of recent
+# calls, and a Retry-After longer than LLM_RETRY_MAX_DELAY is not waited for.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+
+# Circuit breaker: opens when, over the last LLM_BREAKER_WINDOW seconds, at
+# least LLM_BREAKER_ERROR_RATE of calls failed or LLM_BREAKER_SLOW_RATE were
+# slow. While open, calls fail at once. A call is slow when the upstream took
+# longer than LLM_BREAKER_SLOW_CALL seconds to its first byte; a non-streaming
+# completion only sends its first byte when it is done, so it gets
+# LLM_BREAKER_SLOW_TOKEN_SECONDS more per completion token.
+LLM_BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", "30"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_SLOW_CALL = float(os.getenv("LLM_BREAKER_SLOW_CALL", "15"))
+LLM_BREAKER_SLOW_TOKEN_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_TOKEN_SECONDS", "0.05"))
+LLM_BREAKER_SLOW_RATE = float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.5"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# Upstream statuses worth retrying, and those signalling overload
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+OVERLOAD_STATUSES = (429, 503)
+
+LLM_RETRIES = counter("llm_retries_total", "Completion calls retried, by reason", ("reason",))
+
+
+class LLMError(Exception):
+    """Raised when the completion API fails or returns an unusable response"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class LLMUnavailable(LLMError):
+    """Raised without calling the upstream while the circuit breaker is open"""
+
+
+class LLMClient:
+    """Async chat completion client sharing one keep-alive connection pool.
+
+    A single instance is created per worker process. The underlying
+    ``httpx.AsyncClient`` keeps TLS connections open between calls, and a
+    concurrency limit caps the number of generations in flight so a burst of
+    requests queues here instead of opening unbounded upstream connections.
+
+    Calls go through a circuit breaker, an adaptive (AIMD) concurrency
+    limit and, for non-streaming completions, bounded retries, so an
+    upstream incident turns into fast failures instead of full timeouts.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENAI_BASE_URL,
+        api_key: Optional[str] = None,
+        model: str = OPENAI_MODEL,
+        temperature: float = OPENAI_TEMPERATURE,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive: int = LLM_MAX_KEEPALIVE,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        read_timeout: float = LLM_READ_TIMEOUT,
+        pool_timeout: float = LLM_POOL_TIMEOUT,
+        total_timeout: float = LLM_TOTAL_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.total_timeout = total_timeout
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        self._timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=connect_timeout,
+            pool=pool_timeout,
+        )
+        self.limiter = AdaptiveLimiter(max_concurrency, min_limit=min(min_concurrency, max_concurrency))
+        self.breaker = CircuitBreaker(
+            window=LLM_BREAKER_WINDOW,
+            min_calls=LLM_BREAKER_MIN_CALLS,
+            error_rate=LLM_BREAKER_ERROR_RATE,
+            slow_call_seconds=LLM_BREAKER_SLOW_CALL,
+            slow_rate=LLM_BREAKER_SLOW_RATE,
+            open_seconds=LLM_BREAKER_OPEN_SECONDS,
+        )
+        self.slow_token_seconds = LLM_BREAKER_SLOW_TOKEN_SECONDS
+        self.retry_budget = RetryBudget(ratio=LLM_RETRY_BUDGET_RATIO)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self._limits,
+                timeout=self._timeout,
+            )
+        return self._client
+
+    def _headers(self) -> dict:
+        api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OpenAI API key is not set")
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+        }
+
+    def _payload(self, messages: List[dict], max_tokens: int, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": self.temperature,
+            "n": 1,
+            "stream": stream,
+        }
+
+    async def start(self):
+        """Open the connection pool (called from the app startup hook)"""
+        self._get_client()
+
+    async def warm(self, connections: int):
+        """Open keep-alive connections ahead of the first generation.
+
+        Sends cheap concurrent ``GET /v1/models`` requests; only the
+        established connections matter, so failures are ignored.
+        """
+        if connections <= 0:
+            return
+        client = self._get_client()
+
+        async def connect():
+            try:
+                await client.get("/v1/models", headers=self._headers())
+            except (httpx.HTTPError, ValueError):
+                pass
+
+        await asyncio.gather(*[connect() for _ in range(connections)])
+
+    async def drain(self, timeout: float):
+        """Wait up to timeout seconds for calls in flight to finish"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def in_flight(self) -> int:
+        return self.limiter.in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self.limiter.waiting
+
+    def has_spare_capacity(self, max_utilization: float) -> bool:
+        """Whether optional work may start: circuit closed, nobody queued, limiter below the share"""
+        return (
+            self.breaker.state == CLOSED
+            and self.limiter.waiting == 0
+            and self.limiter.in_flight < self.limiter.limit * max_utilization
+        )
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Pass the circuit breaker and hold a concurrency slot for one attempt.
+
+        The yielded dict is filled in by the caller with the attempt's
+        ``outcome`` ('ok', 'http_error', 'timeout', 'error'), ``status_code``,
+        ``first_byte`` (seconds until the upstream answered), ``tokens``
+        (completion tokens generated before that) and ``paused`` (seconds
+        spent waiting on the caller's consumer), which feed the breaker and
+        the limiter.
+        """
+        ticket = self.breaker.allow()
+        if ticket is None:
+            raise LLMUnavailable(
+                f"OpenAI API circuit breaker is open (retry in {self.breaker.retry_after:.0f}s)"
+            )
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            # Cancelled while queued for a slot: give back a half-open probe
+            self.breaker.cancel(ticket)
+            raise
+        attempt = {"outcome": "error", "status_code": None, "first_byte": None, "tokens": 0, "paused": 0.0}
+        start = time.perf_counter()
+        try:
+            yield attempt
+        except (asyncio.CancelledError, GeneratorExit):
+            # The caller went away; this says nothing about the upstream
+            attempt["outcome"] = "cancelled"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start - attempt["paused"]
+            outcome, status_code = attempt["outcome"], attempt["status_code"]
+            if outcome == "cancelled":
+                self.breaker.cancel(ticket)
+                await self.limiter.release(overloaded=False, success=False)
+            else:
+                # Client errors (bad request, auth) mean the upstream itself is up
+                healthy = outcome == "ok" or (
+                    outcome == "http_error" and status_code not in RETRYABLE_STATUSES
+                )
+                # Slowness is judged on how long the upstream took to answer,
+                # not on how long it took to write a long story
+                latency = elapsed if attempt["first_byte"] is None else attempt["first_byte"]
+                latency = max(0.0, latency - attempt["tokens"] * self.slow_token_seconds)
+                overloaded = (
+                    outcome == "timeout" or status_code in OVERLOAD_STATUSES
+                    or latency >= self.breaker.slow_call_seconds
+                )
+                self.breaker.record(ticket, healthy, latency)
+                await self.limiter.release(overloaded=overloaded, success=outcome == "ok")
+
+    async def _post(self, payload: dict, headers: dict, attempt: dict) -> httpx.Response:
+        start = time.perf_counter()
+        async with self._get_client().stream(
+            "POST", "/v1/chat/completions", json=payload, headers=headers
+        ) as response:
+            attempt["first_byte"] = time.perf_counter() - start
+            LLM_TIME_TO_FIRST_BYTE.observe(attempt["first_byte"], mode="complete")
+            await response.aread()
+        return response
+
+    async def chat_completion(self, messages: List[dict], max_tokens: int = 2000) -> dict:
+        """Run a non-streaming chat completion and return the parsed JSON body.
+
+        Retryable failures are retried up to max_retries times with jittered
+        backoff (honouring Retry-After) while the retry budget allows and
+        the total timeout has not run out.
+        """
+        headers = self._headers()
+        payload = self._payload(messages, max_tokens, stream=False)
+        deadline = time.monotonic() + self.total_timeout
+        self.retry_budget.record_request()
+
+        retries = 0
+        while True:
+            try:
+                return await self._complete_once(payload, headers, deadline)
+            except LLMError as e:
+                if not e.retryable or retries >= self.max_retries:
+                    raise
+                if e.retry_after is not None and e.retry_after > LLM_RETRY_MAX_DELAY:
+                    raise
+                delay = backoff_delay(retries, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, e.retry_after)
+                if time.monotonic() + delay >= deadline or not self.retry_budget.try_retry():
+                    raise
+                retries += 1
+                LLM_RETRIES.inc(reason=str(e.status_code or "connection"))
+                print(f"Retrying OpenAI API call in {delay:.2f}s ({retries}/{self.max_retries}): {e}")
+                await asyncio.sleep(delay)
+
+    async def _complete_once(self, payload: dict, headers: dict, deadline: float) -> dict:
+        async with self._slot() as attempt:
+            start = time.perf_counter()
+            try:
+                timeout = max(0.0, deadline - time.monotonic())
+                response = await asyncio.wait_for(self._post(payload, headers, attempt), timeout=timeout)
+                attempt["status_code"] = response.status_code
+                attempt["outcome"] = "ok" if response.status_code == 200 else "http_error"
+                if response.status_code == 200:
+                    attempt["tokens"] = _completion_tokens(response.content)
+            except asyncio.TimeoutError:
+                attempt["outcome"] = "timeout"
+                raise LLMError(f"OpenAI API timed out after {self.total_timeout}s")
+            except httpx.HTTPError as e:
+                raise LLMError(
+                    f"OpenAI API request failed: {type(e).__name__}: {e}",
+                    retryable=isinstance(e, httpx.TransportError),
+                )
+            finally:
+                LLM_REQUEST_DURATION.observe(time.perf_counter() - start, mode="complete", outcome=attempt["outcome"])
+
+        if response.status_code != 200:
+            raise LLMError(
+                f"OpenAI API error: {_error_message(response.content)}",
+                status_code=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUSES,
+                retry_after=parse_retry_after(response.headers.get("retry-after")),
+            )
+
+        try:
+            return response.json()
+        except ValueError:
+            raise LLMError("OpenAI API returned invalid JSON")
+
+    async def stream_chat_completion(self, messages: List[dict], max_tokens: int = 2000) -> AsyncIterator[str]:
+        """Run a streaming chat completion, yielding content deltas as they arrive"""
+        headers = self._headers()
+        payload = self._payload(messages, max_tokens, stream=True)
+
+        async with self._slot() as attempt:
+            start = time.perf_counter()
+            first_token = True
+            try:
+                async with self._get_client().stream(
+                    "POST", "/v1/chat/completions", json=payload, headers=headers
+                ) as response:
+                    attempt["status_code"] = response.status_code
+                    if response.status_code != 200:
+                        attempt["outcome"] = "http_error"
+                        body = await response.aread()
+                        raise LLMError(
+                            f"OpenAI API error: {_error_message(body)}",
+                            status_code=response.status_code,
+                        )
+                    async for line in response.aiter_lines():
+                        delta = _parse_stream_line(line)
+                        if delta is None:
+                            continue
+                        if delta is _STREAM_DONE:
+                            break
+                        if first_token:
+                            first_token = False
+                            attempt["first_byte"] = time.perf_counter() - start
+                            LLM_TIME_TO_FIRST_BYTE.observe(attempt["first_byte"], mode="stream")
+                        # Time the consumer takes between tokens is not the upstream's
+                        paused = time.perf_counter()
+                        yield delta
+                        attempt["paused"] += time.perf_counter() - paused
+                attempt["outcome"] = "ok"
+            except httpx.TimeoutException as e:
+                attempt["outcome"] = "timeout"
+                raise LLMError(f"OpenAI API request failed: {type(e).__name__}: {e}")
+            except httpx.HTTPError as e:
+                raise LLMError(f"OpenAI API request failed: {type(e).__name__}: {e}")
+            finally:
+                LLM_REQUEST_DURATION.observe(
+                    time.perf_counter() - start - attempt["paused"], mode="stream", outcome=attempt["outcome"]
+                )
+
+
+_STREAM_DONE = object()
+
+
+def _parse_stream_line(line: str):
+    """Parse one server-sent event line from a streaming completion.
+
+    Returns the content delta, ``_STREAM_DONE`` for the terminating event,
+    or None for lines that carry no content.
+    """
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return _STREAM_DONE
+    try:
+        choices = json.loads(data).get("choices") or []
+    except ValueError:
+        raise LLMError("OpenAI API returned an invalid stream event")
+    if not choices:
+        return None
+    return choices[0].get("delta", {}).get("content") or None
+
+
+def _completion_tokens(body: bytes) -> int:
+    """Completion tokens reported in a response body, estimated from its size if missing"""
+    try:
+        return int(json.loads(body)["usage"]["completion_tokens"])
+    except (ValueError, KeyError, TypeError):
+        # Roughly four bytes per token
+        return len(body) // 4
+
+
+def _error_message(body: bytes) -> str:
+    try:
+        return json.loads(body).get("error", {}).get("message", "Unknown error")
+    except (ValueError, AttributeError):
+        return "Unknown error"
+
+
+# Shared client for this worker process
+llm_client = LLMClient()
+
+gauge_callback(
+    "llm_requests", "Completion calls in flight or waiting for a concurrency slot",
+    lambda: {("in_flight",): llm_client.in_flight, ("waiting",): llm_client.waiting},
+    ("state",)
+)
+gauge_callback(
+    "llm_concurrency_limit", "Current adaptive limit on concurrent completion calls",
+    lambda: {(): llm_client.limiter.limit}
+)
+gauge_callback(
+    "llm_circuit_state", "1 for the circuit breaker's current state",
+    lambda: {(state,): int(llm_client.breaker.state == state) for state in (CLOSED, HALF_OPEN, OPEN)},
+    ("state",)
+)
+counter_callback(
+    "llm_circuit_events_total", "Circuit breaker openings and calls rejected while open",
+    lambda: {(event,): value for event, value in llm_client.breaker.stats.items()},
+    ("event",)
+)
+counter_callback(
+    "llm_retry_budget_exhausted_total", "Retries skipped because the retry budget was spent",
+    lambda: {(): llm_client.retry_budget.stats["exhausted"]}
+)
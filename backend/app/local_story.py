@@ -0,0 +1,402 @@
+import random
+from collections import ChainMap
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from .schemas import StoryPrompt
+
+# Offline story generator: a small story grammar per language. A story is
+# a fixed plot (opening, friend, discovery, one or more obstacle episodes,
+# insight, success, celebration, ending); each plot beat becomes one
+# paragraph made of a lead sentence plus a random, order-preserving pick
+# of follow-up sentences. Placeholders are filled from word banks, so
+# stories vary per call while staying gentle and on-topic. Needs no
+# network or database and renders a story in well under a millisecond.
+#
+# Placeholders: {name}, {names} (possessive), {character}, {setting},
+# {theme}, and article forms {a_X} / {the_X} for character, setting,
+# companion, object and obstacle (see STORY_FIELDS). Any other field draws
+# a fresh word from the bank of that name for each sentence; a trailing
+# digit ({adjective2}) draws a different word from the same bank.
+GRAMMAR = {
+    "en": {
+        "names": ["Milo", "Luna", "Finn", "Ella", "Oscar", "Nora", "Leo", "Maya", "Theo", "Ivy"],
+        "words": {
+            "adjective": ["brave", "curious", "kind", "clever", "cheerful", "gentle", "bold", "thoughtful"],
+            "feeling": ["excited", "a little nervous", "proud", "hopeful", "happy", "surprised"],
+            "weather": ["the sun was shining", "a soft breeze was blowing",
+                        "little clouds drifted across the sky", "the stars were twinkling"],
+            "sound": ["a tiny squeak", "a gentle whistle", "a soft rustle", "a cheerful hum", "a faraway bell"],
+            "quality": ["patience", "kindness", "courage", "teamwork", "honesty", "curiosity"],
+            "time": ["One morning", "Early the next day", "Later that afternoon", "When the moon came up",
+                     "After a short rest"],
+        },
+        # (indefinite, definite) forms
+        "companion": [("a little squirrel", "the little squirrel"), ("a wise old owl", "the wise old owl"),
+                      ("a friendly puppy", "the friendly puppy"), ("a shy turtle", "the shy turtle"),
+                      ("a chatty parrot", "the chatty parrot"), ("a small bunny", "the small bunny")],
+        "object": [("a shiny map", "the shiny map"), ("a golden key", "the golden key"),
+                   ("a glowing stone", "the glowing stone"), ("a tiny lantern", "the tiny lantern"),
+                   ("a magic feather", "the magic feather"), ("an old compass", "the old compass")],
+        "obstacle": [("a wide river", "the wide river"), ("a tall wall of thorny bushes", "the thorny bushes"),
+                     ("a deep, dark cave", "the dark cave"), ("a wobbly bridge", "the wobbly bridge"),
+                     ("a thick fog", "the thick fog"), ("a locked gate", "the locked gate"),
+                     ("a steep hill", "the steep hill")],
+        "titles": ["{name} the {character}", "The {character} of the {setting}",
+                   "{name} and {the_object}", "{names} Big Adventure"],
+        "beats": {
+            "opening": (
+                ["Once upon a time, in {a_setting} far away, there lived {a_character} named {name}.",
+                 "There was once {a_character} called {name}, who lived in {a_setting}.",
+                 "In {a_setting} where {weather}, there lived {a_character} named {name}."],
+                ["{name} was {adjective} and {adjective2}, and loved to explore.",
+                 "Every morning {name} looked around {the_setting} and wondered what the day would bring.",
+                 "Nobody in {the_setting} had ever met anyone quite like {name}.",
+                 "{name} liked to hum little songs as the day went by.",
+                 "Most days {weather}, and {name} felt {feeling}."],
+            ),
+            "friend": (
+                ["{names} best friend was {a_companion}.",
+                 "Wherever {name} went, {a_companion} came along too."],
+                ["Together they knew every corner of {the_setting}.",
+                 "{the_companion} was very good at noticing things.",
+                 "The two friends shared everything, even their last biscuit.",
+                 "In the evenings they sat together and told each other stories."],
+            ),
+            "discovery": (
+                ["{time}, {name} found {a_object} half hidden behind a stone.",
+                 "{time}, {sound} made {name} turn around, and there lay {a_object}."],
+                ["It seemed to whisper something about {theme}.",
+                 "\"I wonder where this came from,\" said {name}.",
+                 "{the_companion} leaned in close to have a look.",
+                 "{name} felt {feeling} and knew that an adventure was about to begin.",
+                 "Somewhere beyond {the_setting} there had to be an answer."],
+            ),
+            "problem": (
+                ["Before long, the friends came to {a_obstacle}.",
+                 "{time}, the way was blocked by {a_obstacle}.",
+                 "Soon {name} and {the_companion} stood in front of {a_obstacle}."],
+                ["\"How will we ever get past {the_obstacle}?\" asked {the_companion}.",
+                 "{name} felt {feeling}, but did not want to give up.",
+                 "Up close it looked much bigger.",
+                 "For a while, nobody said anything at all."],
+            ),
+            "attempt": (
+                ["First, {name} tried to rush ahead without a plan.",
+                 "{name} took a deep breath and looked for a way through.",
+                 "\"Let me try something,\" said {name}, and got to work."],
+                ["It did not work the first time, or the second time.",
+                 "{the_companion} cheered from the side.",
+                 "{name} remembered that {quality} can be stronger than speed.",
+                 "Step by step, a little plan began to grow."],
+            ),
+            "help": (
+                ["Then {the_companion} had an idea.",
+                 "Just then, {the_object} began to glow softly.",
+                 "Suddenly there was {sound}, and a friendly voice offered to help."],
+                ["Working together, they found a way past {the_obstacle}.",
+                 "\"We did it!\" cried {name}, feeling {feeling}.",
+                 "It turned out that everything was much easier when they helped each other.",
+                 "{name} thanked everyone who had helped.",
+                 "On the other side a new day was waiting, and {weather}."],
+            ),
+            "insight": (
+                ["That evening, {name} thought about everything that had happened.",
+                 "As they rested, {the_companion} asked {name} what the journey had taught them."],
+                ["Maybe {theme} was about more than {name} had first thought.",
+                 "{name} understood that {theme} gets easier when you keep trying, even when things are hard.",
+                 "Being {adjective} had helped, but listening to friends had helped even more.",
+                 "\"I think I understand {theme} a little better now,\" said {name}."],
+            ),
+            "success": (
+                ["At last, the friends reached the very heart of {the_setting}.",
+                 "{time}, they finally found what {the_object} had been pointing to."],
+                ["It was even more wonderful than {name} had imagined.",
+                 "Everyone gathered around to see.",
+                 "{the_companion} did a little happy dance.",
+                 "{name} smiled from ear to ear."],
+            ),
+            "celebration": (
+                ["That night there was a big party in {the_setting}.",
+                 "Everyone in {the_setting} came to celebrate."],
+                ["There was music, laughter and plenty of cake.",
+                 "{name} told the whole story from the beginning, and nobody got bored.",
+                 "{the_companion} was given the very best seat.",
+                 "Above them, the stars twinkled brightly."],
+            ),
+            "ending": (
+                ["From that day on, {name} always remembered how important {quality} is.",
+                 "And whenever a new adventure came along, {name} and {the_companion} were ready."],
+                ["And they all lived happily ever after.",
+                 "But that is another story."],
+            ),
+        },
+        "the_end": "The end.",
+    },
+    "sv": {
+        "names": ["Ebbe", "Saga", "Nils", "Alva", "Otto", "Ester", "Vilgot", "Tyra", "Melker", "Selma"],
+        "words": {
+            "adjective": ["modig", "nyfiken", "snäll", "klok", "glad", "varsam", "djärv", "omtänksam"],
+            "feeling": ["glad", "lite nervös", "stolt", "hoppfull", "förväntansfull", "förvånad"],
+            "weather": ["solen sken", "en mild bris blåste", "små moln seglade över himlen",
+                        "stjärnorna tindrade"],
+            "sound": ["ett litet pip", "en mjuk vissling", "ett svagt prassel", "ett glatt nynnande",
+                      "en klocka långt borta"],
+            "quality": ["tålamod", "vänlighet", "mod", "samarbete", "ärlighet", "nyfikenhet"],
+            "time": ["En morgon", "Tidigt nästa dag", "Senare samma eftermiddag", "När månen steg upp",
+                     "Efter en kort vila"],
+        },
+        "companion": [("en liten ekorre", "ekorren"), ("en klok gammal uggla", "ugglan"),
+                      ("en glad valp", "valpen"), ("en blyg sköldpadda", "sköldpaddan"),
+                      ("en pratsam papegoja", "papegojan"), ("en liten kanin", "kaninen")],
+        "object": [("en glänsande karta", "kartan"), ("en gyllene nyckel", "nyckeln"),
+                   ("en lysande sten", "stenen"), ("en liten lykta", "lyktan"),
+                   ("en magisk fjäder", "fjädern"), ("en gammal kompass", "kompassen")],
+        "obstacle": [("en bred flod", "floden"), ("en hög mur av taggiga buskar", "de taggiga buskarna"),
+                     ("en djup och mörk grotta", "grottan"), ("en vinglig bro", "bron"),
+                     ("en tjock dimma", "dimman"), ("en låst grind", "grinden"),
+                     ("en brant backe", "backen")],
+        "titles": ["Sagan om {name} och {the_object}", "{the_character} i {the_setting}",
+                   "{names} stora äventyr", "{name} och {the_companion}"],
+        "beats": {
+            "opening": (
+                ["Det var en gång {a_character} som hette {name} och bodde i {a_setting} långt borta.",
+                 "För länge sedan fanns det {a_character} som hette {name}.",
+                 "I {a_setting} där {weather} bodde det {a_character} som hette {name}."],
+                ["{name} var {adjective} och {adjective2} och älskade att utforska.",
+                 "Varje morgon tittade {name} ut över {the_setting} och undrade vad dagen skulle bjuda på.",
+                 "Ingen i {the_setting} hade någonsin träffat någon som {name}.",
+                 "{name} tyckte om att nynna små sånger medan dagen gick.",
+                 "Det var en sådan dag då {weather}, och {name} kände sig {feeling}."],
+            ),
+            "friend": (
+                ["{names} bästa vän var {a_companion}.",
+                 "Vart {name} än gick följde {a_companion} med."],
+                ["Tillsammans kände de till varenda vrå av {the_setting}.",
+                 "{the_companion} var väldigt bra på att lägga märke till saker.",
+                 "De två vännerna delade på allt, till och med det sista kexet.",
+                 "På kvällarna satt de tillsammans och berättade historier för varandra."],
+            ),
+            "discovery": (
+                ["{time} hittade {name} {a_object} som låg halvt gömd bakom en sten.",
+                 "{time} hördes {sound}, och när {name} vände sig om låg där {a_object}."],
+                ["Det kändes som om den viskade något om {theme}.",
+                 "\"Jag undrar var den här kommer ifrån\", sa {name}.",
+                 "{the_companion} lutade sig fram för att titta närmare.",
+                 "{name} kände sig {feeling} och förstod att ett äventyr skulle börja.",
+                 "Någonstans bortom {the_setting} måste svaret finnas."],
+            ),
+            "problem": (
+                ["Snart kom vännerna fram till {a_obstacle}.",
+                 "{time} blockerades vägen av {a_obstacle}.",
+                 "Snart stod {name} och {the_companion} framför {a_obstacle}."],
+                ["\"Hur ska vi någonsin ta oss förbi {the_obstacle}?\" frågade {the_companion}.",
+                 "{name} kände sig {feeling} men ville inte ge upp.",
+                 "På nära håll såg det mycket större ut.",
+                 "En stund sa ingen någonting alls."],
+            ),
+            "attempt": (
+                ["Först försökte {name} rusa iväg utan en plan.",
+                 "{name} tog ett djupt andetag och letade efter en väg igenom.",
+                 "\"Låt mig försöka en sak\", sa {name} och satte igång."],
+                ["Det gick inte första gången, och inte andra gången heller.",
+                 "{the_companion} hejade från sidan.",
+                 "{name} kom ihåg att {quality} kan vara starkare än snabbhet.",
+                 "Steg för steg började en liten plan växa fram."],
+            ),
+            "help": (
+                ["Då fick {the_companion} en idé.",
+                 "Just då började {the_object} att lysa svagt.",
+                 "Plötsligt hördes {sound}, och en vänlig röst erbjöd sig att hjälpa till."],
+                ["Tillsammans hittade de en väg förbi {the_obstacle}.",
+                 "\"Vi klarade det!\" ropade {name} och kände sig {feeling}.",
+                 "Det visade sig att allt blev mycket lättare när de hjälptes åt.",
+                 "{name} tackade alla som hade hjälpt till.",
+                 "På andra sidan väntade en ny dag, och {weather}."],
+            ),
+            "insight": (
+                ["Den kvällen tänkte {name} på allt som hade hänt.",
+                 "Medan de vilade frågade {the_companion} vad resan hade lärt {name}."],
+                ["Kanske handlade {theme} om mer än {name} först hade trott.",
+                 "{name} förstod att {theme} blir lättare när man fortsätter att försöka, även när det är svårt.",
+                 "Att vara {adjective} hade hjälpt, men att lyssna på vännerna hade hjälpt ännu mer.",
+                 "\"Jag tror att jag förstår {theme} lite bättre nu\", sa {name}."],
+            ),
+            "success": (
+                ["Till slut nådde vännerna själva hjärtat av {the_setting}.",
+                 "{time} hittade de äntligen det som {the_object} hade pekat mot."],
+                ["Det var ännu mer underbart än {name} hade föreställt sig.",
+                 "Alla samlades runt omkring för att titta.",
+                 "{the_companion} gjorde en liten glädjedans.",
+                 "{name} log från öra till öra."],
+            ),
+            "celebration": (
+                ["Den kvällen blev det stor fest i {the_setting}.",
+                 "Alla i {the_setting} kom för att fira."],
+                ["Det var musik, skratt och massor av tårta.",
+                 "{name} berättade hela historien från början, och ingen blev uttråkad.",
+                 "{the_companion} fick den allra bästa platsen.",
+                 "Ovanför dem tindrade stjärnorna."],
+            ),
+            "ending": (
+                ["Från den dagen kom {name} alltid ihåg hur viktigt {quality} är.",
+                 "Och när ett nytt äventyr dök upp var {name} och {the_companion} redo."],
+                ["Och så levde de lyckliga i alla sina dagar.",
+                 "Men det är en annan saga."],
+            ),
+        },
+        "the_end": "Slut.",
+    },
+}
+
+# Sentences per paragraph by age group; younger listeners get shorter paragraphs
+AGE_SENTENCES = {"3-5": 2, "6-8": 3, "9-12": 4}
+DEFAULT_SENTENCES = 3
+# Obstacle episodes per story length
+LENGTH_EPISODES = {"short": 1, "medium": 2, "long": 3}
+DEFAULT_EPISODES = 2
+
+PLOT_START = ("opening", "friend", "discovery")
+EPISODE = ("problem", "attempt", "help")
+PLOT_END = ("insight", "success", "celebration", "ending")
+
+# Swedish nouns of neuter gender (ett) and nouns that are already definite,
+# for the catalog's characters and settings and other common picks
+SV_NEUTER = {"slott", "skepp", "berg", "troll", "hus", "land", "träd", "hav", "rymdskepp", "tåg", "zoo"}
+SV_DEFINITE = {"rymden": "rymden", "havet": "havet", "skogen": "skogen"}
+
+
+# Values fixed for a whole story; every other field names a word bank
+STORY_FIELDS = {
+    "name", "names", "character", "setting", "theme",
+    "a_character", "the_character", "a_setting", "the_setting", "a_companion", "the_companion",
+    "a_object", "the_object", "a_obstacle", "the_obstacle",
+}
+
+
+class CompiledTemplate:
+    """A sentence template with its placeholder names parsed once"""
+    __slots__ = ("text", "fields")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.fields = tuple(name for _, name, _, _ in Formatter().parse(text) if name)
+
+
+def _compile(grammar: dict) -> dict:
+    """Parse every template and check that its fields can be filled"""
+    def template(text: str) -> CompiledTemplate:
+        compiled_template = CompiledTemplate(text)
+        for field in compiled_template.fields:
+            if field not in STORY_FIELDS and field.rstrip("0123456789") not in grammar["words"]:
+                raise ValueError(f"Unknown story field {{{field}}} in {text!r}")
+        return compiled_template
+
+    compiled = dict(grammar)
+    compiled["titles"] = [template(text) for text in grammar["titles"]]
+    compiled["beats"] = {
+        beat: ([template(text) for text in leads], [template(text) for text in more])
+        for beat, (leads, more) in grammar["beats"].items()
+    }
+    return compiled
+
+
+# Parsed once at import, so generating a story only fills templates
+COMPILED = {language: _compile(grammar) for language, grammar in GRAMMAR.items()}
+DEFAULT_LANGUAGE = "en"
+
+
+def _noun_forms(word: str, language: str) -> Tuple[str, str]:
+    """(indefinite with article, definite) forms of a catalog noun"""
+    word = " ".join(word.split()).lower()
+    if language == "sv":
+        if word in SV_DEFINITE:
+            return word, SV_DEFINITE[word]
+        if word in SV_NEUTER:
+            return f"ett {word}", word + "et"
+        if word.endswith(("a", "e")):
+            return f"en {word}", word + "n"
+        return f"en {word}", word + "en"
+    article = "an" if word[:1] in "aeiou" else "a"
+    return f"{article} {word}", f"the {word}"
+
+
+def _possessive(name: str, language: str) -> str:
+    if language == "sv":
+        return name if name.endswith(("s", "x", "z")) else name + "s"
+    return name + "'s"
+
+
+def _render(template: CompiledTemplate, values: dict, words: Dict[str, List[str]], rng: random.Random) -> str:
+    # Draw fresh bank words for this sentence, distinct within it
+    picked = {}
+    for field in template.fields:
+        if field not in values and field not in picked:
+            bank = words[field.rstrip("0123456789")]
+            choices = [word for word in bank if word not in picked.values()] or bank
+            picked[field] = rng.choice(choices)
+    sentence = template.text.format_map(ChainMap(picked, values))
+    return sentence[:1].upper() + sentence[1:]
+
+
+def _paragraph(beat, values: dict, words: Dict[str, List[str]], rng: random.Random, sentences: int,
+               used: set) -> str:
+    """One paragraph for a plot beat, avoiding sentences already used in the story"""
+    leads, more = beat
+    lead = rng.choice([template for template in leads if template not in used] or leads)
+    fresh = [index for index, template in enumerate(more) if template not in used]
+    count = min(len(more), sentences - 1)
+    picked = rng.sample(fresh, min(count, len(fresh)))
+    if len(picked) < count:
+        picked += rng.sample([index for index in range(len(more)) if index not in picked], count - len(picked))
+    templates = [lead] + [more[index] for index in sorted(picked)]
+    used.update(templates)
+    return " ".join(_render(template, values, words, rng) for template in templates)
+
+
+def generate_local_story(prompt: StoryPrompt, seed: Optional[int] = None) -> Tuple[str, str]:
+    """Render a (title, content) story for a prompt without calling the LLM"""
+    language = (prompt.language or "").lower()
+    if language not in COMPILED:
+        language = DEFAULT_LANGUAGE
+    grammar = COMPILED[language]
+    rng = random.Random(seed)
+
+    a_character, the_character = _noun_forms(prompt.character_type, language)
+    a_setting, the_setting = _noun_forms(prompt.setting_type, language)
+    a_companion, the_companion = rng.choice(grammar["companion"])
+    a_object, the_object = rng.choice(grammar["object"])
+    name = rng.choice(grammar["names"])
+    values = {
+        "name": name,
+        "names": _possessive(name, language),
+        "character": " ".join(prompt.character_type.split()).lower(),
+        "setting": " ".join(prompt.setting_type.split()).lower(),
+        "theme": " ".join(prompt.theme_type.split()).lower(),
+        "a_character": a_character, "the_character": the_character,
+        "a_setting": a_setting, "the_setting": the_setting,
+        "a_companion": a_companion, "the_companion": the_companion,
+        "a_object": a_object, "the_object": the_object,
+    }
+    words = grammar["words"]
+    sentences = AGE_SENTENCES.get(prompt.age_group, DEFAULT_SENTENCES)
+    episodes = LENGTH_EPISODES.get(prompt.story_length, DEFAULT_EPISODES)
+    beats = grammar["beats"]
+
+    used = set()
+    paragraphs = [_paragraph(beats[beat], values, words, rng, sentences, used) for beat in PLOT_START]
+    # Each episode faces a different obstacle
+    for a_obstacle, the_obstacle in rng.sample(grammar["obstacle"], min(episodes, len(grammar["obstacle"]))):
+        values["a_obstacle"], values["the_obstacle"] = a_obstacle, the_obstacle
+        paragraphs.extend(_paragraph(beats[beat], values, words, rng, sentences, used) for beat in EPISODE)
+    paragraphs.extend(_paragraph(beats[beat], values, words, rng, sentences, used) for beat in PLOT_END)
+    paragraphs.append(grammar["the_end"])
+
+    title = _render(rng.choice(grammar["titles"]), values, words, rng)
+    if language == "en":
+        # English titles capitalize every word but short function words
+        title = " ".join(
+            word if index and word in ("a", "an", "the", "and", "of") else word[:1].upper() + word[1:]
+            for index, word in enumerate(title.split())
+        )
+    return title, "\n\n".join(paragraphs)
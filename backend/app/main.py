@@ -1,24 +1,45 @@
 import os
-import hashlib
-import secrets
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks
+import math
+import time
+import re
+import base64
+import asyncio
+from typing import List, Optional, Union
+from uuid import UUID
+from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks, Query, Request, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import openai
-import http.client
 import json
 from datetime import datetime
 import random
 
 from .schemas import (
     UserCreate, UserLogin, UserResponse, 
-    StoryCreate, StoryResponse, StoryPrompt, 
-    StoryPromptResponse, SavedStoryCreate, SavedStoryResponse
+    StoryCreate, StoryResponse, StoryPrompt, StorySummary, StorySearchResult,
+    StoryPromptResponse, SavedStoryCreate, SavedStoryResponse, SavedStorySummary, StoryJobResponse,
+    StoryBatchRequest, StoryParagraphRange
 )
+from .llm import llm_client, LLMUnavailable
+from .cache import generation_cache, generation_cache_key
+from .story_cache import story_cache, etag_matches, STORY_CACHE_MAX_AGE
+from .catalog import prompt_catalog
+from .pregen import pregeneration_pool, PREGEN_MAX_UTILIZATION
+from .compression import CompressionMiddleware, choose_encoding, weak_etag
+from .prompts import render_messages, render_title
+from .local_story import generate_local_story
+from .security import password_hasher, DUMMY_PASSWORD_HASH
+from .singleflight import SingleFlight
+from .serialization import FastJSONResponse, dumps, records
+from .metrics import (
+    shared_metrics, MetricsMiddleware, TimedJSONResponse,
+    FALLBACK_STORIES, counter_callback, gauge_callback
+)
+from . import db
+from .jobs import JobQueue, QueueFull, get_job, JOB_POLL_INTERVAL
+from .ratelimit import generation_limiter, RateLimited, CostTooLarge, estimate_tokens, caller_key
 
-app = FastAPI(title="StoryTeller AI API")
+app = FastAPI(title="StoryTeller AI API", default_response_class=TimedJSONResponse)
 
 # Configure CORS
 origins = [
@@ -33,361 +54,779 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Next-Offset", "X-Total-Count", "ETag"],
 )
 
+# gzip/brotli for JSON responses above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency histograms, served at /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Configure OpenAI API
 openai.api_key = os.getenv("OPENAI_API_KEY")
 print(f"OpenAI API key loaded: {openai.api_key[:5]}...")  # Print first few chars for debug
 
-# Direct HTTP request function for more control
-def openai_chat_completion(messages, max_tokens=2000):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI API key is not set")
-    
-    print(f"Using API key: {api_key[:5]}...")
-    
-    # Correct headers according to OpenAI docs
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    
-    # Payload format according to docs
-    payload = json.dumps({
-        "model": "gpt-3.5-turbo",
-        "messages": messages,
-        "max_tokens": max_tokens,
-        "temperature": 0.7,
-        "n": 1,  # Number of completions to generate
-        "stream": False  # Don't stream the response
-    })
-    
+# Async chat completion through the shared keep-alive connection pool
+async def openai_chat_completion(messages, max_tokens=2000):
     try:
-        conn = http.client.HTTPSConnection("api.openai.com")
-        conn.request("POST", "/v1/chat/completions", payload, headers)
-        response = conn.getresponse()
-        
-        print(f"OpenAI API status: {response.status}")
-        
-        data = response.read().decode("utf-8")
-        conn.close()
-        
-        if response.status != 200:
-            print(f"OpenAI API error response: {data}")
-            error_data = json.loads(data)
-            error_message = error_data.get('error', {}).get('message', 'Unknown error')
-            raise Exception(f"OpenAI API error: {error_message}")
-        
-        # Parse and return the response
-        response_data = json.loads(data)
+        response_data = await llm_client.chat_completion(messages, max_tokens=max_tokens)
         print(f"API response received, model: {response_data.get('model')}")
         return response_data
     except Exception as e:
         print(f"Error calling OpenAI API: {str(e)}")
         raise
 
-# Database connection helper
-def get_db_connection():
-    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-    conn.autocommit = False
-    return conn
+# Shape generated text into the story dict used by the endpoints
+def build_story_data(prompt: StoryPrompt, title: str, content: str):
+    return {
+        "title": title,
+        "content": content,
+        "characters": [prompt.character_type],
+        "setting": prompt.setting_type,
+        "theme": prompt.theme_type,
+        "age_group": prompt.age_group,
+        "language": prompt.language,
+        "story_length": prompt.story_length,
+        "style": prompt.style
+    }
+
+# Story from the offline generator, returned when the LLM call fails
+def build_fallback_story(prompt: StoryPrompt):
+    story_data = build_story_data(prompt, *generate_local_story(prompt))
+    story_data["is_fallback"] = True  # Flag to indicate this is a fallback story
+    FALLBACK_STORIES.inc(language=prompt.language)
+    return story_data
+
+# Only ASCII whitespace separates words, as in the 0003 backfill SQL
+# (Python's default also splits on e.g. no-break spaces; Postgres depends on the locale)
+ASCII_WHITESPACE = " \t\r\f\v"
+WORD_SEPARATOR = re.compile(r"\s+", re.ASCII)
+
+# Split story content into the paragraphs readers see: one per non-empty
+# line, as the frontend renders it. Returns (text, word count) pairs.
+def split_paragraphs(content: str):
+    paragraphs = []
+    for line in content.split("\n"):
+        text = line.strip(ASCII_WHITESPACE)
+        if text:
+            paragraphs.append((text, len(WORD_SEPARATOR.split(text))))
+    return paragraphs
+
+# Cache key for a prompt under the current model settings
+def story_cache_key(prompt: StoryPrompt):
+    return generation_cache_key(prompt, llm_client.model, llm_client.temperature)
+
+# Identical prompts generated at the same time share one LLM call
+generation_flight = SingleFlight()
+
+# Story rendered locally for mode=instant, without calling the LLM
+def build_instant_story(prompt: StoryPrompt):
+    story_data = build_story_data(prompt, *generate_local_story(prompt))
+    story_data["is_instant"] = True
+    return story_data
 
 # Helper to generate a story with AI
 async def generate_story_with_ai(prompt: StoryPrompt):
-    # Define age-appropriate language
-    age_map = {
-        "3-5": "very simple language suitable for preschoolers",
-        "6-8": "simple language suitable for early elementary school children",
-        "9-12": "language suitable for upper elementary school children"
-    }
+    if prompt.mode == "instant":
+        return build_instant_story(prompt)
     
-    # Define length parameters
-    length_map = {
-        "short": "at least 1000 words",
-        "medium": "at least 1500 words",
-        "long": "at least 2500 words"
-    }
+    cache_key = story_cache_key(prompt)
+    # Serve repeated prompt combinations from the generation cache; a key
+    # that has all its variants needs no pre-generated stories
+    cached = await generation_cache.get(cache_key)
+    if cached:
+        pregeneration_pool.forget(cache_key)
+        return build_story_data(prompt, cached["title"], cached["content"])
     
-    age_language = age_map.get(prompt.age_group, "simple language suitable for children")
-    story_length = length_map.get(prompt.story_length, "at least 1500 words")
-    
-    # Build the base prompt
-    if prompt.language.lower() == 'sv':
-        system_message = f"""Du är en kreativ barnboksförfattare. 
-        Skriv en LÅNG saga på svenska med {age_language}.
-        Sagan ska vara {story_length} lång.
-        Sagan ska handla om en {prompt.character_type} i en {prompt.setting_type} med temat {prompt.theme_type}.
-        Sagan ska vara underhållande, lärorik och lämplig för barn i åldern {prompt.age_group}.
-        Dela upp berättelsen i korta stycken."""
-    else:
-        system_message = f"""You are a creative children's book author. 
-        Write a LONG story in English with {age_language}.
-        The story should be {story_length} long.
-        The story should be about a {prompt.character_type} in a {prompt.setting_type} with the theme of {prompt.theme_type}.
-        The story should be entertaining, educational, and appropriate for children aged {prompt.age_group}.
-        Break the story into short paragraphs."""
-    
-    # Add style instruction if provided
-    if prompt.style:
-        if prompt.language.lower() == 'sv':
-            system_message += f"\nSagan ska vara i en {prompt.style} stil."
-        else:
-            system_message += f"\nThe story should be in a {prompt.style} style."
+    # Preset combinations may have a fresh story generated ahead of time;
+    # it becomes one of the key's cache variants like a generated story
+    pooled = pregeneration_pool.take(cache_key, prompt)
+    if pooled:
+        await generation_cache.put(cache_key, *pooled)
+        return build_story_data(prompt, *pooled)
+    
+    # Join an identical generation already in flight, if there is one
+    shared = await generation_flight.do(cache_key, lambda: generate_uncached_story(prompt, cache_key))
+    story_data = build_story_data(prompt, shared["title"], shared["content"])
+    if shared.get("is_fallback"):
+        story_data["is_fallback"] = True
+    return story_data
+
+# Call the LLM for a prompt and return (title, story text); raises on failure
+async def complete_story(prompt: StoryPrompt):
+    messages = render_messages(prompt)
     
-    # Add custom prompt if provided
-    if prompt.custom_prompt:
-        system_message += f"\n{prompt.custom_prompt}"
+    # Call with more tokens for longer stories
+    response = await openai_chat_completion(messages, max_tokens=4000)
+    
+    print("OpenAI API response received successfully")
+    
+    # Extract story text from the JSON response according to docs
+    if "choices" in response and len(response["choices"]) > 0:
+        choice = response["choices"][0]
+        if "message" in choice and "content" in choice["message"]:
+            story_text = choice["message"]["content"].strip()
+            print(f"Story content extracted, length: {len(story_text)} characters")
+        else:
+            raise Exception("Unexpected response format: 'message' or 'content' not found in response")
+    else:
+        raise Exception("Unexpected response format: 'choices' not found or empty in response")
     
+    return render_title(prompt), story_text
+
+# Call the LLM for a prompt and store the result in the generation cache
+async def generate_uncached_story(prompt: StoryPrompt, cache_key: str):
     try:
         print(f"Starting story generation for {prompt.character_type} in {prompt.setting_type}")
         api_key = os.getenv("OPENAI_API_KEY")
         print(f"API Key exists: {bool(api_key)}, length: {len(api_key) if api_key else 0}")
         
         try:
-            # Use direct HTTP method for more control and better debugging
-            messages = [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"Write a story about a {prompt.character_type} in a {prompt.setting_type} with the theme of {prompt.theme_type}."}
-            ]
-            
-            # Call with more tokens for longer stories
-            response = openai_chat_completion(messages, max_tokens=4000)
-            
-            print("OpenAI API response received successfully")
-            
-            # Extract story text from the JSON response according to docs
-            if "choices" in response and len(response["choices"]) > 0:
-                choice = response["choices"][0]
-                if "message" in choice and "content" in choice["message"]:
-                    story_text = choice["message"]["content"].strip()
-                    print(f"Story content extracted, length: {len(story_text)} characters")
-                else:
-                    raise Exception("Unexpected response format: 'message' or 'content' not found in response")
-            else:
-                raise Exception("Unexpected response format: 'choices' not found or empty in response")
-            
-            # Generate a simple title
-            title = f"The {prompt.character_type} in the {prompt.setting_type}"
-            if prompt.language.lower() == 'sv':
-                title = f"{prompt.character_type}en i {prompt.setting_type}en"
-            
-            return {
-                "title": title,
-                "content": story_text,
-                "characters": [prompt.character_type],
-                "setting": prompt.setting_type,
-                "theme": prompt.theme_type,
-                "age_group": prompt.age_group,
-                "language": prompt.language,
-                "story_length": prompt.story_length,
-                "style": prompt.style
-            }
+            title, story_text = await complete_story(prompt)
+            await generation_cache.put(cache_key, title, story_text)
+            return build_story_data(prompt, title, story_text)
             
         except Exception as api_err:
             print(f"OpenAI API error details: {type(api_err).__name__}: {str(api_err)}")
             raise
             
+    except LLMUnavailable as e:
+        # The upstream is known to be down; answer with the fallback right away
+        print(f"Skipping story generation: {str(e)}")
+        return build_fallback_story(prompt)
     except Exception as e:
         print(f"Detailed error generating story: {type(e).__name__}: {str(e)}")
         import traceback
         traceback.print_exc()
         
-        # Create a more detailed fallback story based on the parameters
-        if prompt.language.lower() == 'sv':
-            fallback_title = f"{prompt.character_type}en i {prompt.setting_type}en"
-            fallback_story = f"""Det var en gång en modig {prompt.character_type} som bodde i en fantastisk {prompt.setting_type}. 
-            
-Varje dag utforskade {prompt.character_type}en nya platser och lärde sig nya saker.
+        return build_fallback_story(prompt)
 
-En dag upptäckte {prompt.character_type}en något speciellt som handlade om {prompt.theme_type}.
-
-Detta lärde {prompt.character_type}en något viktigt om världen och sig själv.
-
-Alla i {prompt.setting_type}en blev glada och firade tillsammans.
-
-Slut."""
-        else:
-            fallback_title = f"The {prompt.character_type} in the {prompt.setting_type}"
-            fallback_story = f"""Once upon a time, there was a brave {prompt.character_type} who lived in an amazing {prompt.setting_type}.
-            
-Every day, the {prompt.character_type} would explore new places and learn new things.
+# Get available story prompts
+@app.get("/api/story-prompts", response_model=List[StoryPromptResponse])
+async def get_story_prompts(
+    language: Optional[str] = None,
+    age_group: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    # Served from the in-memory catalog, which follows table changes
+    if not prompt_catalog.loaded:
+        try:
+            await prompt_catalog.reload()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    entry = prompt_catalog.get(language, age_group)
+    headers = {"ETag": entry.etag, "Cache-Control": entry.cache_control}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
-One day, the {prompt.character_type} discovered something special about {prompt.theme_type}.
+# Return user_id if that user exists, otherwise None
+async def verify_user_id(user_id: Optional[int]):
+    if user_id is None:
+        return None
+    async with db.acquire() as conn:
+        user = await conn.fetchrow("SELECT id FROM users WHERE id = $1", user_id)
+    return user_id if user else None
 
-This taught the {prompt.character_type} something important about the world and themselves.
+# Insert generated stories with one multi-row INSERT and return them in
+# StoryResponse shape, in the same order
+async def save_generated_stories(story_datas: List[dict], user_id: Optional[int]):
+    rows = []
+    params = []
+    paragraphs = []
+    for story_data in story_datas:
+        # Create story object
+        story = StoryCreate(
+            title=story_data["title"],
+            content=story_data["content"],
+            theme=story_data["theme"],
+            characters=story_data["characters"],
+            setting=story_data["setting"],
+            age_group=story_data["age_group"],
+            language=story_data["language"],
+            is_public=True if user_id is None else False  # Make stories public if no user
+        )
+        paragraphs.append(split_paragraphs(story.content))
+        values = (
+            story.title,
+            story.content,
+            story.theme,
+            story.characters,
+            story.setting,
+            story.age_group,
+            story.language,
+            user_id,
+            story.is_public,
+            len(paragraphs[-1]),
+            sum(words for _, words in paragraphs[-1])
+        )
+        rows.append("(" + ", ".join(f"${len(params) + n}" for n in range(1, len(values) + 1)) + ")")
+        params.extend(values)
+    
+    # Save stories and their paragraphs in one transaction
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            query = f"""
+            INSERT INTO stories 
+            (title, content, theme, characters, setting, age_group, language, user_id, is_public,
+             paragraph_count, word_count)
+            VALUES {", ".join(rows)}
+            RETURNING id, created_at, updated_at
+            """
+            results = await conn.fetch(query, *params)
 
-Everyone in the {prompt.setting_type} was happy and celebrated together.
+            # All paragraphs of the batch go in as parallel arrays
+            columns = ([], [], [], [])
+            for result, story_paragraphs in zip(results, paragraphs):
+                for position, (text, words) in enumerate(story_paragraphs):
+                    columns[0].append(result["id"])
+                    columns[1].append(position)
+                    columns[2].append(text)
+                    columns[3].append(words)
+            await conn.execute(
+                """
+                INSERT INTO story_paragraphs (story_id, position, content, word_count)
+                SELECT * FROM unnest($1::int[], $2::int[], $3::text[], $4::int[])
+                """,
+                *columns
+            )
+    
+    # Combine the results with the story data
+    return [
+        {**story_data, "id": result["id"], "user_id": user_id, "is_public": user_id is None,
+         "created_at": result["created_at"], "updated_at": result["updated_at"]}
+        for story_data, result in zip(story_datas, results)
+    ]
 
-The end."""
-            
-        return {
-            "title": fallback_title,
-            "content": fallback_story,
-            "characters": [prompt.character_type],
-            "setting": prompt.setting_type,
-            "theme": prompt.theme_type,
-            "age_group": prompt.age_group,
-            "language": prompt.language,
-            "story_length": prompt.story_length,
-            "style": prompt.style,
-            "is_fallback": True  # Flag to indicate this is a fallback story
-        }
+# Insert a generated story and return it in StoryResponse shape
+async def save_generated_story(story_data: dict, user_id: Optional[int]):
+    stories = await save_generated_stories([story_data], user_id)
+    return stories[0]
 
-# Get available story prompts
-@app.get("/api/story-prompts", response_model=List[StoryPromptResponse])
-async def get_story_prompts(language: Optional[str] = None, age_group: Optional[str] = None):
-    conn = get_db_connection()
+# Charge generations against the caller's and the global token budget.
+# user_id must already be verified, otherwise made-up ids would each get
+# a fresh bucket.
+async def charge_generation_budget(request: Request, prompts: List[StoryPrompt], user_id: Optional[int],
+                                   batch: bool = False):
+    costs = [estimate_tokens(prompt) for prompt in prompts]
+    caller = caller_key(user_id, request.client.host if request.client else None)
     try:
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                query = "SELECT * FROM story_prompts"
-                params = []
-                
-                if language or age_group:
-                    query += " WHERE"
-                    
-                    if language:
-                        query += " language = %s"
-                        params.append(language)
-                        
-                    if language and age_group:
-                        query += " AND"
-                        
-                    if age_group:
-                        query += " age_group = %s"
-                        params.append(age_group)
-                
-                cursor.execute(query, params)
-                result = cursor.fetchall()
-                return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+        await generation_limiter.charge(caller, sum(costs), batch=batch)
+    except CostTooLarge as e:
+        fit = int(e.capacity // max(costs))
+        raise HTTPException(
+            status_code=413,
+            detail=f"{e}; send at most {fit} stories like these per request"
+        )
+    except RateLimited as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
 
 # Generate a story
 @app.post("/api/generate-story", response_model=StoryResponse)
 async def generate_story(
     prompt: StoryPrompt,
+    request: Request,
     background_tasks: BackgroundTasks,
     user_id: Optional[int] = None
 ):
     # If user_id is not provided in the request body, extract it from the prompt dict
-    prompt_dict = prompt.dict()
-    if user_id is None and 'user_id' in prompt_dict:
-        user_id = prompt_dict.get('user_id')
+    if user_id is None:
+        user_id = prompt.user_id
+    
+    try:
+        # Verify user exists if user_id is provided. The connection goes
+        # back to the pool before the LLM call.
+        user_id = await verify_user_id(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    await charge_generation_budget(request, [prompt], user_id)
     
-    # Verify user exists if user_id is provided and not None
-    conn = get_db_connection()
     try:
-        if user_id is not None:
-            with conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-                    user = cursor.fetchone()
-                    if not user:
-                        user_id = None  # Reset to None if invalid user_id
-        
         # Generate story with AI
         story_data = await generate_story_with_ai(prompt)
         
-        # Create story object
-        story = StoryCreate(
-            title=story_data["title"],
-            content=story_data["content"],
-            theme=story_data["theme"],
-            characters=story_data["characters"],
-            setting=story_data["setting"],
-            age_group=story_data["age_group"],
-            language=story_data["language"],
-            is_public=True if user_id is None else False  # Make stories public if no user
+        return await save_generated_story(story_data, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Generate and save a story for a queued job
+async def run_generation_job(prompt: StoryPrompt, user_id: Optional[int]):
+    story_data = await generate_story_with_ai(prompt)
+    story = await save_generated_story(story_data, user_id)
+    return story["id"]
+
+job_queue = JobQueue(run_generation_job)
+
+# Queue a story generation and return the job right away
+@app.post("/api/generate-story/jobs", response_model=StoryJobResponse, status_code=202)
+async def create_story_job(prompt: StoryPrompt, request: Request, user_id: Optional[int] = None):
+    if user_id is None:
+        user_id = prompt.user_id
+    
+    try:
+        user_id = await verify_user_id(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    await charge_generation_budget(request, [prompt], user_id)
+    
+    try:
+        return await job_queue.submit(prompt, user_id)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(JOB_POLL_INTERVAL * 5)))}
         )
-        
-        # Save story to database
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                query = """
-                INSERT INTO stories 
-                (title, content, theme, characters, setting, age_group, language, user_id, is_public)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, created_at, updated_at
-                """
-                cursor.execute(
-                    query, 
-                    (
-                        story.title, 
-                        story.content, 
-                        story.theme, 
-                        story.characters, 
-                        story.setting, 
-                        story.age_group, 
-                        story.language, 
-                        user_id, 
-                        story.is_public
-                    )
-                )
-                result = cursor.fetchone()
-                
-                # Combine the result with the story data
-                response = {**story_data, "id": result["id"], "user_id": user_id, 
-                           "created_at": result["created_at"], "updated_at": result["updated_at"]}
-                return response
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
-# Get stories
-@app.get("/api/stories", response_model=List[StoryResponse])
-async def get_stories(user_id: Optional[int] = None, is_public: Optional[bool] = None):
-    conn = get_db_connection()
+# Poll a story generation job
+@app.get("/api/jobs/{job_id}", response_model=StoryJobResponse)
+async def get_story_job(job_id: UUID):
+    try:
+        job = await get_job(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Format one Server-Sent Event
+def sse_event(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Save a streamed story and emit the final event
+async def finish_story_stream(story_data: dict, user_id: Optional[int]):
+    try:
+        response = await save_generated_story(story_data, user_id)
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+        return
+    yield sse_event("story", StoryResponse(**response).model_dump(mode="json"))
+
+# Generate a story, streaming tokens to the client as Server-Sent Events
+@app.post("/api/generate-story/stream")
+async def generate_story_stream(prompt: StoryPrompt, request: Request, user_id: Optional[int] = None):
+    """Stream a story as it is generated.
+
+    Emits ``token`` events with ``{"text": ...}`` while the model is writing,
+    then a single ``story`` event carrying the saved story in StoryResponse
+    shape. The row is inserted once, after the last token. If generation
+    fails before any text was sent, the fallback story is streamed instead;
+    a failure mid-story ends the stream with an ``error`` event.
+    """
+    if user_id is None:
+        user_id = prompt.user_id
+    
+    try:
+        user_id = await verify_user_id(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    await charge_generation_budget(request, [prompt], user_id)
+    
+    async def event_stream():
+        # Instant and cached stories are sent as a single token event
+        cache_key = story_cache_key(prompt)
+        cached = None if prompt.mode == "instant" else await generation_cache.get(cache_key)
+        if prompt.mode == "instant" or cached:
+            if cached:
+                story_data = build_story_data(prompt, cached["title"], cached["content"])
+            else:
+                story_data = build_instant_story(prompt)
+            yield sse_event("token", {"text": story_data["content"]})
+            async for event in finish_story_stream(story_data, user_id):
+                yield event
+            return
+        
+        parts = []
+        try:
+            print(f"Starting streamed story generation for {prompt.character_type} in {prompt.setting_type}")
+            async for delta in llm_client.stream_chat_completion(render_messages(prompt), max_tokens=4000):
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+            
+            story_text = "".join(parts).strip()
+            if not story_text:
+                raise Exception("Unexpected response format: stream contained no content")
+            story_data = build_story_data(prompt, render_title(prompt), story_text)
+            await generation_cache.put(cache_key, story_data["title"], story_text)
+        except Exception as e:
+            print(f"Error streaming story: {type(e).__name__}: {str(e)}")
+            if parts:
+                yield sse_event("error", {"detail": str(e)})
+                return
+            story_data = build_fallback_story(prompt)
+            yield sse_event("token", {"text": story_data["content"]})
+        
+        async for event in finish_story_stream(story_data, user_id):
+            yield event
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Batch generation limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+# Generations of one batch running at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Generate many stories at once, streaming each result as Server-Sent Events
+@app.post("/api/generate-story/batch")
+async def generate_story_batch(batch: StoryBatchRequest, request: Request):
+    """Generate a story for every prompt in the batch.
+
+    Up to BATCH_CONCURRENCY generations run at a time. Stories that finish
+    together are written with a single multi-row INSERT, and each is then
+    sent as a ``story`` event with ``{"index": ..., "story": ...}`` (index
+    into ``prompts``). An item that fails produces an ``error`` event with
+    its index instead, without affecting the others. A final ``done`` event
+    carries the ``succeeded``/``failed`` counts.
+    """
+    if not batch.prompts:
+        raise HTTPException(status_code=400, detail="Batch contains no prompts")
+    if len(batch.prompts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch is limited to {BATCH_MAX_ITEMS} prompts")
+    
     try:
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                query = "SELECT * FROM stories"
-                params = []
+        user_id = await verify_user_id(batch.user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # The whole batch is charged up front, to the caller's batch budget
+    await charge_generation_budget(request, batch.prompts, user_id, batch=True)
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    # Returns (index, story_data, error) so a failure stays with its item
+    async def generate_item(index: int, prompt: StoryPrompt):
+        async with semaphore:
+            try:
+                return index, await generate_story_with_ai(prompt), None
+            except Exception as e:
+                print(f"Batch item {index} failed: {type(e).__name__}: {str(e)}")
+                return index, None, str(e)
+    
+    async def event_stream():
+        tasks = [asyncio.create_task(generate_item(i, prompt)) for i, prompt in enumerate(batch.prompts)]
+        pending = set(tasks)
+        succeeded = failed = 0
+        try:
+            while pending:
+                # Everything finished since the last write goes into the next INSERT
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                generated = []
+                for index, story_data, error in sorted((task.result() for task in done), key=lambda item: item[0]):
+                    if error is None:
+                        generated.append((index, story_data))
+                    else:
+                        failed += 1
+                        yield sse_event("error", {"index": index, "detail": error})
+                if not generated:
+                    continue
                 
-                if user_id is not None or is_public is not None:
-                    query += " WHERE"
-                    
-                    if user_id is not None:
-                        query += " user_id = %s"
-                        params.append(user_id)
-                        
-                    if user_id is not None and is_public is not None:
-                        query += " AND"
-                        
-                    if is_public is not None:
-                        query += " is_public = %s"
-                        params.append(is_public)
+                try:
+                    stories = await save_generated_stories([data for _, data in generated], user_id)
+                except Exception as e:
+                    print(f"Error saving batch stories: {type(e).__name__}: {str(e)}")
+                    failed += len(generated)
+                    for index, _ in generated:
+                        yield sse_event("error", {"index": index, "detail": str(e)})
+                    continue
                 
-                query += " ORDER BY created_at DESC"
-                cursor.execute(query, params)
-                result = cursor.fetchall()
-                return result
+                for (index, _), story in zip(generated, stories):
+                    succeeded += 1
+                    yield sse_event("story", {"index": index, "story": StoryResponse(**story).model_dump(mode="json")})
+            
+            yield sse_event("done", {"succeeded": succeeded, "failed": failed})
+        finally:
+            # The client went away; stop generating for it
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Columns of a full story (everything but the search index column)
+STORY_COLUMNS = """
+    id, title, content, theme, characters, setting, age_group, language, is_public, user_id,
+    created_at, updated_at
+"""
+
+# Columns returned by the summary projection of /api/stories
+STORY_SUMMARY_COLUMNS = """
+    id, title, theme, characters, setting, age_group, language, is_public, user_id, created_at,
+    left(content, 200) AS excerpt
+"""
+
+# Keyset cursors encode the (created_at, id) of the last row of a page
+def encode_story_cursor(created_at: datetime, story_id: int):
+    raw = f"{created_at.isoformat()},{story_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_story_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, story_id = raw.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(story_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Get stories
+@app.get("/api/stories", response_model=Union[List[StoryResponse], List[StorySummary]])
+async def get_stories(
+    user_id: Optional[int] = None,
+    is_public: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: str = Query("summary", pattern="^(summary|full)$")
+):
+    """List stories newest first, one page at a time.
+
+    Returns summaries with an ``excerpt`` unless ``fields=full`` is given.
+    When more stories exist, the ``X-Next-Cursor`` header holds the value to
+    pass as ``cursor`` for the next page.
+    """
+    conditions = []
+    params = []
+    
+    if user_id is not None:
+        params.append(user_id)
+        conditions.append(f"user_id = ${len(params)}")
+        
+    if is_public is not None:
+        params.append(is_public)
+        conditions.append(f"is_public = ${len(params)}")
+    
+    if cursor:
+        params.extend(decode_story_cursor(cursor))
+        conditions.append(f"(created_at, id) < (${len(params) - 1}, ${len(params)})")
+    
+    columns = STORY_COLUMNS if fields == "full" else STORY_SUMMARY_COLUMNS
+    query = f"SELECT {columns} FROM stories"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+    query += f" ORDER BY created_at DESC, id DESC LIMIT ${len(params)}"
+    
+    try:
+        async with db.acquire() as conn:
+            rows = await conn.fetch(query, *params)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+    
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_story_cursor(last["created_at"], last["id"])
+    # Rows come straight from our own table: encode them without revalidating
+    return FastJSONResponse(records(rows), headers=headers)
+
+# Postgres text search configuration per story language
+SEARCH_CONFIGS = {"en": "english", "sv": "swedish"}
+
+# Search stories
+@app.get("/api/stories/search", response_model=List[StorySearchResult])
+async def search_stories(
+    q: Optional[str] = None,
+    language: Optional[str] = None,
+    theme: Optional[str] = None,
+    setting: Optional[str] = None,
+    age_group: Optional[str] = None,
+    characters: Optional[List[str]] = Query(None),
+    user_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000)
+):
+    """Full-text search over public stories (plus the caller's own).
+
+    ``q`` accepts web-search syntax (quoted phrases, ``or``, ``-word``) and is
+    parsed with the stemming rules of the story language. ``theme``,
+    ``setting``, ``age_group`` and ``language`` are exact facets; every
+    ``characters`` value must appear in the story. Results are ranked by
+    relevance; ``X-Total-Count`` holds the number of matches and
+    ``X-Next-Offset`` the offset of the next page when there is one.
+    """
+    if language is not None and language not in SEARCH_CONFIGS:
+        raise HTTPException(status_code=400, detail=f"Unsupported language: {language}")
+
+    params = []
+    if user_id is not None:
+        params.append(user_id)
+        conditions = [f"(is_public OR user_id = ${len(params)})"]
+    else:
+        conditions = ["is_public"]
+
+    for column, value in (("language", language), ("theme", theme),
+                          ("setting", setting), ("age_group", age_group)):
+        if value is not None:
+            params.append(value)
+            conditions.append(f"{column} = ${len(params)}")
+
+    if characters:
+        params.append(characters)
+        conditions.append(f"characters @> ${len(params)}::text[]")
+
+    rank = "0::real"
+    if q and q.strip():
+        # Parse the query once per candidate language so stemming matches the
+        # configuration each story was indexed with
+        params.append(q)
+        configs = [SEARCH_CONFIGS[language]] if language else list(SEARCH_CONFIGS.values())
+        tsquery = " || ".join(
+            f"websearch_to_tsquery('{config}', ${len(params)})" for config in configs
+        )
+        conditions.append(f"search_vector @@ ({tsquery})")
+        rank = f"ts_rank_cd(search_vector, {tsquery}, 32)"
+
+    where = " AND ".join(conditions)
+    params.extend([limit, offset])
+    query = f"""
+        SELECT {STORY_SUMMARY_COLUMNS}, {rank} AS rank, count(*) OVER () AS total
+        FROM stories
+        WHERE {where}
+        ORDER BY rank DESC, created_at DESC, id DESC
+        LIMIT ${len(params) - 1} OFFSET ${len(params)}
+    """
+
+    try:
+        async with db.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    total = rows[0]["total"] if rows else 0
+    headers = {"X-Total-Count": str(total)}
+    if offset + len(rows) < total:
+        headers["X-Next-Offset"] = str(offset + len(rows))
+    return FastJSONResponse(records(rows, exclude=("total",)), headers=headers)
+
+# Serve a cached story body, or 304 if the client already has it. A
+# pre-compressed copy is sent as-is when the client accepts its encoding.
+def cached_story_response(entry, if_none_match: Optional[str], accept_encoding: Optional[str] = None):
+    encoding = choose_encoding(accept_encoding)
+    etag = weak_etag(entry.etag) if encoding in entry.encoded else entry.etag
+    headers = {"ETag": etag, "Cache-Control": entry.cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(if_none_match, entry.etag):
+        story_cache.stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    if encoding in entry.encoded:
+        headers["Content-Encoding"] = encoding
+        return Response(content=entry.encoded[encoding], media_type="application/json", headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 # Get a specific story
 @app.get("/api/stories/{story_id}", response_model=StoryResponse)
-async def get_story(story_id: int):
-    conn = get_db_connection()
+async def get_story(
+    story_id: int,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    # Stories are read far more often than written, so serve them from the
+    # in-memory cache without touching the database when possible
+    entry = story_cache.get(story_id)
+    if entry is None:
+        try:
+            async with db.acquire() as conn:
+                result = await conn.fetchrow(f"SELECT {STORY_COLUMNS} FROM stories WHERE id = $1", story_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if not result:
+            raise HTTPException(status_code=404, detail="Story not found")
+        body = dumps(dict(result))
+        entry = story_cache.put(story_id, body, result["is_public"])
+    return cached_story_response(entry, if_none_match, accept_encoding)
+
+# Paragraphs returned by /paragraphs when no range end is given, and the most per request
+PARAGRAPH_PAGE_SIZE = int(os.getenv("PARAGRAPH_PAGE_SIZE", "10"))
+PARAGRAPH_MAX_RANGE = int(os.getenv("PARAGRAPH_MAX_RANGE", "100"))
+
+# Get a range of a story's paragraphs
+@app.get("/api/stories/{story_id}/paragraphs", response_model=StoryParagraphRange)
+async def get_story_paragraphs(
+    story_id: int,
+    response: Response,
+    start: int = Query(0, ge=0, alias="from"),
+    end: Optional[int] = Query(None, ge=1, alias="to")
+):
+    """Paragraphs ``from`` (inclusive) to ``to`` (exclusive), counted from 0.
+
+    The totals let readers page through a long story without downloading
+    it whole; ``next_from`` is the ``from`` of the following page, or null
+    at the end of the story.
+    """
+    if end is None:
+        end = start + PARAGRAPH_PAGE_SIZE
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be greater than 'from'")
+    end = min(end, start + PARAGRAPH_MAX_RANGE)
+
     try:
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("SELECT * FROM stories WHERE id = %s", (story_id,))
-                result = cursor.fetchone()
-                if not result:
-                    raise HTTPException(status_code=404, detail="Story not found")
-                return result
+        async with db.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT s.title, s.language, s.age_group, s.is_public,
+                       s.paragraph_count, s.word_count AS total_words,
+                       p.position, p.content, p.word_count
+                FROM stories s
+                LEFT JOIN story_paragraphs p
+                  ON p.story_id = s.id AND p.position >= $2 AND p.position < $3
+                WHERE s.id = $1
+                ORDER BY p.position
+                """,
+                story_id, start, end
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Story not found")
+
+    story = rows[0]
+    total = story["paragraph_count"] or 0
+    end = min(end, max(total, start))
+    scope = "public" if story["is_public"] else "private"
+    response.headers["Cache-Control"] = f"{scope}, max-age={STORY_CACHE_MAX_AGE}"
+    return {
+        "story_id": story_id,
+        "title": story["title"],
+        "language": story["language"],
+        "age_group": story["age_group"],
+        "start": start,
+        "end": end,
+        "next_from": end if end < total else None,
+        "total_paragraphs": total,
+        "total_words": story["total_words"] or 0,
+        "paragraphs": [
+            {"position": row["position"], "content": row["content"], "word_count": row["word_count"]}
+            for row in rows if row["position"] is not None
+        ],
+    }
+
+# Prompt catalog version and reload counters
+@app.get("/api/story-prompts/stats")
+async def get_prompt_catalog_stats():
+    return prompt_catalog.snapshot()
+
+# Story read cache counters
+@app.get("/api/story-cache/stats")
+async def get_story_cache_stats():
+    return story_cache.snapshot()
 
 # Save a story
 @app.post("/api/saved-stories", response_model=SavedStoryResponse)
@@ -397,51 +836,159 @@ async def save_story(saved_story: SavedStoryCreate):
     
     print(f"Saving story: Story ID: {saved_story.story_id}, User ID: {user_id}")
     
-    conn = get_db_connection()
+    # One round-trip: the insert only happens if the story exists, a
+    # duplicate save inserts nothing, and the story row comes back with it
+    query = f"""
+    WITH story AS (
+        SELECT {STORY_COLUMNS} FROM stories WHERE id = $2
+    ), saved AS (
+        INSERT INTO saved_stories (user_id, story_id)
+        SELECT $1, id FROM story
+        ON CONFLICT (user_id, story_id) DO NOTHING
+        RETURNING id, created_at
+    )
+    SELECT story.*, saved.id AS saved_id, saved.created_at AS saved_at
+    FROM story LEFT JOIN saved ON true
+    """
     try:
-        with conn:
-            # First check if the story exists
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("SELECT * FROM stories WHERE id = %s", (saved_story.story_id,))
-                story = cursor.fetchone()
-                if not story:
-                    raise HTTPException(status_code=404, detail=f"Story not found with ID: {saved_story.story_id}")
-                
-                # Then check if it's already saved
-                cursor.execute(
-                    "SELECT * FROM saved_stories WHERE user_id = %s AND story_id = %s", 
-                    (user_id, saved_story.story_id)
-                )
-                existing = cursor.fetchone()
-                if existing:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Story already saved by this user"
-                    )
-                
-                # Save the story
-                cursor.execute(
-                    "INSERT INTO saved_stories (user_id, story_id) VALUES (%s, %s) RETURNING id, created_at", 
-                    (user_id, saved_story.story_id)
-                )
-                result = cursor.fetchone()
-                
-                # Return saved story with the related story
-                return {
-                    "id": result["id"],
-                    "user_id": user_id,
-                    "story_id": saved_story.story_id,
-                    "created_at": result["created_at"],
-                    "story": story
-                }
-    except HTTPException as e:
-        conn.rollback()
-        raise e
+        async with db.acquire() as conn:
+            row = await conn.fetchrow(query, user_id, saved_story.story_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Story not found with ID: {saved_story.story_id}")
+    if row["saved_id"] is None:
+        raise HTTPException(status_code=400, detail="Story already saved by this user")
+    
+    story = dict(row)
+    saved_id, saved_at = story.pop("saved_id"), story.pop("saved_at")
+    
+    # Return saved story with the related story
+    return {
+        "id": saved_id,
+        "user_id": user_id,
+        "story_id": saved_story.story_id,
+        "created_at": saved_at,
+        "story": story
+    }
+
+# List a user's saved stories
+@app.get("/api/saved-stories", response_model=List[SavedStorySummary])
+async def get_saved_stories(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """List the stories a user saved, most recently saved first.
+
+    Each item carries the story summary, fetched in the same query. When
+    more saves exist, pass the ``X-Next-Cursor`` header as ``cursor``.
+    """
+    params = [user_id]
+    conditions = ["ss.user_id = $1"]
+    if cursor:
+        params.extend(decode_story_cursor(cursor))
+        conditions.append(f"(ss.created_at, ss.id) < (${len(params) - 1}, ${len(params)})")
+    params.append(limit + 1)
+    
+    query = f"""
+    SELECT ss.id AS saved_id, ss.created_at AS saved_at,
+        s.id, s.title, s.theme, s.characters, s.setting, s.age_group, s.language,
+        s.is_public, s.user_id, s.created_at, left(s.content, 200) AS excerpt
+    FROM saved_stories ss
+    JOIN stories s ON s.id = ss.story_id
+    WHERE {" AND ".join(conditions)}
+    ORDER BY ss.created_at DESC, ss.id DESC
+    LIMIT ${len(params)}
+    """
+    try:
+        async with db.acquire() as conn:
+            rows = await conn.fetch(query, *params)
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+    
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_story_cursor(last["saved_at"], last["saved_id"])
+    
+    saved = []
+    for row, story in zip(rows, records(rows, exclude=("saved_id", "saved_at"))):
+        saved.append({
+            "id": row["saved_id"],
+            "user_id": user_id,
+            "story_id": story["id"],
+            "created_at": row["saved_at"],
+            "story": story
+        })
+    return FastJSONResponse(saved, headers=headers)
+
+# Pre-generated story pools and their demand
+@app.get("/api/pregeneration/stats")
+async def get_pregeneration_stats():
+    return pregeneration_pool.snapshot()
+
+# Generation cache counters
+@app.get("/api/generation-cache/stats")
+async def get_generation_cache_stats():
+    return generation_cache.snapshot()
+
+# Cache and queue counters exposed to Prometheus
+counter_callback(
+    "generation_singleflight_total", "Generations started (leaders) and joined (coalesced)",
+    lambda: {(event,): value for event, value in generation_flight.stats.items()},
+    ("role",)
+)
+counter_callback(
+    "generation_cache_events_total", "Generation cache lookups and stores by outcome",
+    lambda: {(event,): value for event, value in generation_cache.stats.items()},
+    ("event",)
+)
+counter_callback(
+    "story_cache_events_total", "Single-story read cache events by outcome",
+    lambda: {(event,): value for event, value in story_cache.stats.items()},
+    ("event",)
+)
+gauge_callback("story_cache_bytes", "Bytes held by the single-story read cache", lambda: {(): story_cache.size})
+counter_callback(
+    "pregeneration_events_total", "Pre-generated story hand-outs, misses, refills, expiries and drops",
+    lambda: {(event,): value for event, value in pregeneration_pool.stats.items()},
+    ("event",)
+)
+gauge_callback("pregenerated_stories", "Unserved pre-generated stories held by this process",
+               lambda: {(): pregeneration_pool.stored})
+gauge_callback("story_jobs_running", "Story jobs being generated by this process", lambda: {(): job_queue.running})
+
+# Prometheus metrics for this worker process
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(shared_metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Startup warm-up and shutdown drain
+STARTUP_WARM_STORIES = int(os.getenv("STARTUP_WARM_STORIES", "100"))
+STARTUP_WARM_GENERATIONS = int(os.getenv("STARTUP_WARM_GENERATIONS", "200"))
+LLM_WARM_CONNECTIONS = int(os.getenv("LLM_WARM_CONNECTIONS", "2"))
+# Seconds running generations get to finish when the worker stops
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "60"))
+
+# Set once startup warm-up finished, cleared when shutdown begins
+app.state.ready = False
+
+# Fill the single-story read cache with the newest public stories
+async def warm_story_cache(limit: int):
+    if limit <= 0:
+        return 0
+    async with db.acquire() as conn:
+        rows = await conn.fetch(
+            f"SELECT {STORY_COLUMNS} FROM stories WHERE is_public ORDER BY created_at DESC LIMIT $1",
+            limit
+        )
+    for row in reversed(rows):
+        body = dumps(dict(row))
+        story_cache.put(row["id"], body, row["is_public"])
+    return len(rows)
 
 @app.on_event("startup")
 async def startup_event():
@@ -451,17 +998,78 @@ async def startup_event():
         print("WARNING: No OpenAI API key found in environment variables!")
     else:
         print(f"OpenAI API key loaded, length: {len(api_key)} chars")
+    
+    # Open the shared LLM connection pool and a few keep-alive connections
+    await llm_client.start()
+    await llm_client.warm(LLM_WARM_CONNECTIONS)
         
-    # Test database connection
+    # Create the shared database pool with its minimum connections checked
     try:
-        conn = get_db_connection()
-        with conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT 1")
+        await db.init_pool()
+        await db.warm()
         print("Database connection successful")
     except Exception as e:
         print(f"Database connection error: {str(e)}")
+    
+    # Load the prompt catalog into memory and follow changes to it
+    await prompt_catalog.start()
+    
+    # Warm the read caches so the first requests are served from memory
+    try:
+        stories = await warm_story_cache(STARTUP_WARM_STORIES)
+        generations = await generation_cache.warm(STARTUP_WARM_GENERATIONS)
+        print(f"Caches warmed: {stories} stories, {generations} cached generations")
+    except Exception as e:
+        print(f"Cache warm-up failed: {str(e)}")
+    
+    # Start the story job workers for this process
+    job_queue.start()
+    
+    # Keep pre-generated stories ready for popular presets, using spare LLM capacity
+    pregeneration_pool.start(
+        complete_story,
+        is_preset=prompt_catalog.has_combo,
+        has_capacity=lambda: llm_client.has_spare_capacity(PREGEN_MAX_UTILIZATION)
+    )
+    # Share this worker's metrics with the others (multi-worker servers only)
+    shared_metrics.start()
+    app.state.ready = True
         
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Runs when the server stops"""
+    app.state.ready = False
+    # Let running generations finish before closing their connections
+    drain_deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT
+    # Speculative refills are not worth waiting for
+    await pregeneration_pool.stop()
+    await job_queue.stop(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+    await llm_client.drain(max(0.0, drain_deadline - time.monotonic()))
+    await prompt_catalog.stop()
+    await llm_client.close()
+    password_hasher.close()
+    await db.close_pool()
+    await shared_metrics.stop()
+
+# Liveness: the process and its event loop respond
+@app.get("/health/live")
+async def liveness_check():
+    return {"status": "alive"}
+
+# Readiness: warmed up, not shutting down and able to reach the database
+@app.get("/health/ready")
+async def readiness_check():
+    checks = {
+        "started": app.state.ready,
+        "database": await db.ping(),
+        "prompt_catalog": prompt_catalog.loaded,
+    }
+    ready = all(checks.values())
+    return TimedJSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": checks, "llm_circuit": llm_client.breaker.state},
+        status_code=200 if ready else 503
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -476,34 +1084,29 @@ async def health_check():
 
 @app.post("/api/register", response_model=UserResponse)
 async def register_user(user: UserCreate):
-    # Hash the password securely
-    salt = secrets.token_hex(16)
-    hashed_password = hashlib.sha256(f"{user.password}{salt}".encode()).hexdigest()
-    
-    conn = get_db_connection()
     try:
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        # Hash the password off the event loop
+        hashed_password = await password_hasher.hash(user.password)
+        
+        async with db.acquire() as conn:
+            async with conn.transaction():
                 # Check if email already exists
-                cursor.execute("SELECT id FROM users WHERE email = %s", (user.email,))
-                if cursor.fetchone():
+                if await conn.fetchval("SELECT id FROM users WHERE email = $1", user.email):
                     raise HTTPException(status_code=400, detail="Email already registered")
                 
                 # Check if username already exists
-                cursor.execute("SELECT id FROM users WHERE username = %s", (user.username,))
-                if cursor.fetchone():
+                if await conn.fetchval("SELECT id FROM users WHERE username = $1", user.username):
                     raise HTTPException(status_code=400, detail="Username already taken")
                 
                 # Create new user
-                cursor.execute(
+                new_user = await conn.fetchrow(
                     """
                     INSERT INTO users (username, email, password_hash) 
-                    VALUES (%s, %s, %s) 
+                    VALUES ($1, $2, $3) 
                     RETURNING id, username, email, created_at
                     """,
-                    (user.username, user.email, f"{salt}:{hashed_password}")
+                    user.username, user.email, hashed_password
                 )
-                new_user = cursor.fetchone()
                 
                 # Return the user without the password
                 return {
@@ -512,49 +1115,56 @@ async def register_user(user: UserCreate):
                     "email": new_user["email"],
                     "created_at": new_user["created_at"]
                 }
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 @app.post("/api/login")
 async def login_user(user_login: UserLogin):
-    conn = get_db_connection()
     try:
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Get user by email
-                cursor.execute("SELECT id, username, email, password_hash, created_at FROM users WHERE email = %s", 
-                              (user_login.email,))
-                user = cursor.fetchone()
-                
-                if not user:
-                    raise HTTPException(
-                        status_code=401, 
-                        detail="Invalid email or password"
-                    )
-                
-                # Verify password
-                salt, stored_hash = user["password_hash"].split(":")
-                computed_hash = hashlib.sha256(f"{user_login.password}{salt}".encode()).hexdigest()
-                
-                if computed_hash != stored_hash:
-                    raise HTTPException(
-                        status_code=401, 
-                        detail="Invalid email or password"
-                    )
-                
-                # Return user info without password
-                return {
-                    "id": user["id"],
-                    "username": user["username"],
-                    "email": user["email"],
-                    "created_at": user["created_at"]
-                }
+        async with db.acquire() as conn:
+            # Get user by email
+            user = await conn.fetchrow(
+                "SELECT id, username, email, password_hash, created_at FROM users WHERE email = $1", 
+                user_login.email
+            )
+        
+        if not user:
+            # Spend the same time as a wrong password, so response times do
+            # not reveal which emails have accounts
+            await password_hasher.verify(user_login.password, DUMMY_PASSWORD_HASH)
+            raise HTTPException(
+                status_code=401, 
+                detail="Invalid email or password"
+            )
+        
+        # Verify password
+        valid, needs_rehash = await password_hasher.verify(user_login.password, user["password_hash"])
+        
+        if not valid:
+            raise HTTPException(
+                status_code=401, 
+                detail="Invalid email or password"
+            )
+        
+        # Upgrade legacy or outdated hashes now that we know the password
+        if needs_rehash:
+            new_hash = await password_hasher.hash(user_login.password)
+            async with db.acquire() as conn:
+                await conn.execute(
+                    "UPDATE users SET password_hash = $1 WHERE id = $2 AND password_hash = $3",
+                    new_hash, user["id"], user["password_hash"]
+                )
+        
+        # Return user info without password
+        return {
+            "id": user["id"],
+            "username": user["username"],
+            "email": user["email"],
+            "created_at": user["created_at"]
+        }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
@@ -0,0 +1,358 @@
+import os
+import re
+import json
+import time
+import bisect
+import asyncio
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+# Minimal in-process metrics rendered in the Prometheus text format.
+# Values are kept per worker process. With several workers, each one
+# publishes snapshots to METRICS_DIR (set by app.serve), and /metrics serves
+# the samples of every worker with a ``worker`` label.
+METRICS_DIR = os.getenv("METRICS_DIR")
+# Seconds between snapshots of this worker's metrics in METRICS_DIR
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        return [
+            (self.name, _format_labels(self.labelnames, key), value)
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        for key, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, counts[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """Gauge or counter whose samples are read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, type: str, callback: Callable[[], Dict[LabelValues, float]],
+                 labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        return [
+            (self.name, _format_labels(self.labelnames, key), value)
+            for key, value in sorted(values.items())
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+    def snapshot(self) -> Dict[str, list]:
+        """Current samples of every metric, by metric name"""
+        return {name: metric.samples() for name, metric in self._metrics.items()}
+
+    def render_workers(self, snapshots: Dict[str, Dict[str, list]]) -> str:
+        """Render snapshots of several workers, each sample labelled with its worker"""
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for worker, samples in sorted(snapshots.items()):
+                worker_label = f'worker="{_escape_label_value(worker)}"'
+                for sample_name, labels, value in samples.get(name, ()):
+                    labels = "{" + worker_label + ("," + labels[1:] if labels else "}")
+                    lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class SharedMetrics:
+    """Shares metric snapshots between the worker processes of one server.
+
+    Every worker writes its samples to ``<directory>/worker-<pid>.json``
+    every ``interval`` seconds. Whichever worker answers a scrape renders
+    its live samples together with the latest snapshots of the others, so
+    counters do not appear to reset when another worker answers the next
+    scrape. Snapshots not refreshed for three intervals (a worker that
+    died) are ignored. Without a directory only this process is rendered.
+    """
+
+    def __init__(self, directory: Optional[str] = METRICS_DIR, interval: float = METRICS_PUBLISH_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.worker = str(os.getpid())
+        self._task: Optional[asyncio.Task] = None
+
+    def _path(self, worker: str) -> str:
+        return os.path.join(self.directory, f"worker-{worker}.json")
+
+    def publish(self):
+        """Write this worker's current samples for the other workers"""
+        path = self._path(self.worker)
+        with open(path + ".tmp", "w") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def _load_others(self) -> Dict[str, Dict[str, list]]:
+        snapshots = {}
+        oldest = time.time() - 3 * self.interval
+        for entry in os.scandir(self.directory):
+            match = re.fullmatch(r"worker-(\d+)\.json", entry.name)
+            if not match or match.group(1) == self.worker:
+                continue
+            try:
+                if entry.stat().st_mtime < oldest:
+                    continue
+                with open(entry.path) as f:
+                    snapshots[match.group(1)] = json.load(f)
+            except (OSError, ValueError):
+                # Removed or replaced while reading; it is picked up next scrape
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        if not self.directory:
+            return registry.render()
+        snapshots = self._load_others()
+        snapshots[self.worker] = registry.snapshot()
+        return registry.render_workers(snapshots)
+
+    async def _run(self):
+        while True:
+            try:
+                self.publish()
+            except OSError as e:
+                print(f"Publishing metrics failed: {type(e).__name__}: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start publishing snapshots (called from the startup hook)"""
+        if not self.directory or self._task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop publishing and withdraw this worker's snapshot"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            os.remove(self._path(self.worker))
+        except OSError:
+            pass
+
+
+# Metrics sharing for this worker process
+shared_metrics = SharedMetrics()
+
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    return registry.register(Counter(name, documentation, tuple(labelnames)))
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, tuple(labelnames), buckets))
+
+
+def gauge_callback(name: str, documentation: str, callback, labelnames=()) -> CallbackMetric:
+    return registry.register(CallbackMetric(name, documentation, "gauge", callback, tuple(labelnames)))
+
+
+def counter_callback(name: str, documentation: str, callback, labelnames=()) -> CallbackMetric:
+    return registry.register(CallbackMetric(name, documentation, "counter", callback, tuple(labelnames)))
+
+
+# Metrics shared across modules
+HTTP_REQUEST_DURATION = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+DB_ACQUIRE_DURATION = histogram(
+    "db_pool_acquire_seconds", "Time spent waiting for a pooled database connection", buckets=FAST_BUCKETS
+)
+DB_QUERY_DURATION = histogram(
+    "db_query_duration_seconds", "SQL statement latency", ("statement", "outcome")
+)
+LLM_TIME_TO_FIRST_BYTE = histogram(
+    "llm_time_to_first_byte_seconds", "Time until the completion API starts responding", ("mode",)
+)
+LLM_REQUEST_DURATION = histogram(
+    "llm_request_duration_seconds", "Total completion API call time", ("mode", "outcome")
+)
+JSON_SERIALIZATION_DURATION = histogram(
+    "json_serialization_seconds", "Time spent encoding JSON response bodies", buckets=FAST_BUCKETS
+)
+FALLBACK_STORIES = counter(
+    "fallback_stories_total", "Stories rendered offline because the LLM call failed or its circuit was open", ("language",)
+)
+
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+
+def statement_label(query: str) -> str:
+    """Low-cardinality label for a SQL statement, e.g. 'SELECT stories'"""
+    words = query.split(None, 1)
+    if not words:
+        return "unknown"
+    verb = words[0].upper()
+    if verb not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+        return verb
+    table = _TABLE_RE.search(query)
+    return f"{verb} {table.group(1).lower()}" if table else verb
+
+
+def record_query(record):
+    """asyncpg query logger feeding DB_QUERY_DURATION"""
+    DB_QUERY_DURATION.observe(
+        record.elapsed,
+        statement=statement_label(record.query),
+        outcome="error" if record.exception else "ok",
+    )
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template.
+
+    Implemented at the ASGI level so streaming responses are timed until
+    their last chunk and are not buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Unmatched paths share one label to keep cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"], route=route, status=status["code"],
+            )
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records encoding time"""
+
+    def render(self, content) -> bytes:
+        with JSON_SERIALIZATION_DURATION.time():
+            return super().render(content)
@@ -0,0 +1,283 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .schemas import StoryPrompt
+
+# Speculative pre-generation of stories for the catalog's preset combinations
+PREGEN_ENABLED = os.getenv("PREGEN_ENABLED", "true").lower() in ("1", "true", "yes")
+# Unserved stories held by this worker across all combinations
+PREGEN_MAX_STORIES = int(os.getenv("PREGEN_MAX_STORIES", "60"))
+# Upper bound for one combination's pool
+PREGEN_MAX_PER_COMBO = int(os.getenv("PREGEN_MAX_PER_COMBO", "5"))
+# A combination's pool holds the stories it is expected to need over this many seconds
+PREGEN_HORIZON = float(os.getenv("PREGEN_HORIZON", "600"))
+# Requests per hour below which a combination gets no pool
+PREGEN_MIN_RATE = float(os.getenv("PREGEN_MIN_RATE", "2"))
+# Half-life in seconds of the request counts that estimate demand
+PREGEN_HALF_LIFE = float(os.getenv("PREGEN_HALF_LIFE", "1800"))
+# Refills only start while the LLM limiter is below this share of its limit
+PREGEN_MAX_UTILIZATION = float(os.getenv("PREGEN_MAX_UTILIZATION", "0.5"))
+# Refill generations running at the same time
+PREGEN_CONCURRENCY = int(os.getenv("PREGEN_CONCURRENCY", "2"))
+# Seconds between scheduler passes (a hand-out also wakes the scheduler)
+PREGEN_INTERVAL = float(os.getenv("PREGEN_INTERVAL", "5"))
+# Pre-generated stories older than this are dropped unserved
+PREGEN_MAX_AGE = float(os.getenv("PREGEN_MAX_AGE", str(6 * 3600)))
+
+STORY_LENGTHS = ("short", "medium", "long")
+
+# Generates (title, content) for a prompt and raises when no real story could be made
+StoryGenerator = Callable[[StoryPrompt], Awaitable[Tuple[str, str]]]
+
+
+class ComboPool:
+    __slots__ = ("prompt", "stories", "demand", "demand_at", "refilling")
+
+    def __init__(self, prompt: StoryPrompt):
+        self.prompt = prompt
+        # (monotonic creation time, title, content), oldest first
+        self.stories = deque()
+        self.demand = 0.0
+        self.demand_at = time.monotonic()
+        self.refilling = 0
+
+    def decay(self, now: float, half_life: float):
+        self.demand *= 0.5 ** ((now - self.demand_at) / half_life)
+        self.demand_at = now
+
+    def rate(self, half_life: float) -> float:
+        """Requests per second implied by the decayed count (count / mean lifetime)"""
+        return self.demand * math.log(2) / half_life
+
+
+class PregenerationPool:
+    """Unserved stories generated ahead of demand for popular presets.
+
+    Requests for a catalog combination (no custom prompt or style) count
+    towards an exponentially decaying demand estimate for it. A scheduler
+    sizes each combination's pool to the stories expected over
+    ``horizon`` seconds, capped per combination and in total, and fills the
+    largest deficits first, but only while the LLM client has spare
+    capacity and its circuit is closed. ``take()`` hands out the oldest
+    story of a pool, each story at most once, and wakes the scheduler to
+    refill it. Once the generation cache holds every variant of a key,
+    ``forget()`` drops its pool so the key is no longer refilled.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = PREGEN_ENABLED,
+        max_stories: int = PREGEN_MAX_STORIES,
+        max_per_combo: int = PREGEN_MAX_PER_COMBO,
+        horizon: float = PREGEN_HORIZON,
+        min_rate: float = PREGEN_MIN_RATE,
+        half_life: float = PREGEN_HALF_LIFE,
+        max_utilization: float = PREGEN_MAX_UTILIZATION,
+        concurrency: int = PREGEN_CONCURRENCY,
+        interval: float = PREGEN_INTERVAL,
+        max_age: float = PREGEN_MAX_AGE,
+    ):
+        self.enabled = enabled and max_stories > 0
+        self.max_stories = max_stories
+        self.max_per_combo = max_per_combo
+        self.horizon = horizon
+        self.min_rate = min_rate / 3600.0
+        self.half_life = half_life
+        self.max_utilization = max_utilization
+        self.concurrency = max(1, concurrency)
+        self.interval = interval
+        self.max_age = max_age
+        self._pools: Dict[str, ComboPool] = {}
+        self._generate: Optional[StoryGenerator] = None
+        self._has_capacity: Callable[[], bool] = lambda: True
+        self._is_preset: Callable[[StoryPrompt], bool] = lambda prompt: False
+        self._scheduler: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._refills = set()
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0, "expired": 0, "dropped": 0}
+
+    @property
+    def stored(self) -> int:
+        return sum(len(pool.stories) for pool in self._pools.values())
+
+    @property
+    def refilling(self) -> int:
+        return len(self._refills)
+
+    def eligible(self, prompt: StoryPrompt) -> bool:
+        return (
+            self.enabled
+            and not prompt.custom_prompt
+            and not prompt.style
+            and prompt.story_length in STORY_LENGTHS
+            and self._is_preset(prompt)
+        )
+
+    def _expire(self, pool: ComboPool, now: float):
+        while pool.stories and now - pool.stories[0][0] > self.max_age:
+            pool.stories.popleft()
+            self.stats["expired"] += 1
+
+    def take(self, key: str, prompt: StoryPrompt) -> Optional[Tuple[str, str]]:
+        """Record a request for key and hand out a pre-generated story if one is ready"""
+        if not self.eligible(prompt):
+            return None
+        now = time.monotonic()
+        pool = self._pools.get(key)
+        if pool is None:
+            # Pooled stories are generated for no one in particular
+            pool = self._pools[key] = ComboPool(prompt.model_copy(update={"user_id": None}))
+        pool.decay(now, self.half_life)
+        pool.demand += 1
+
+        self._expire(pool, now)
+        if not pool.stories:
+            self.stats["misses"] += 1
+            self._wake()
+            return None
+        _, title, content = pool.stories.popleft()
+        self.stats["hits"] += 1
+        self._wake()
+        return title, content
+
+    def forget(self, key: str):
+        """Stop pooling key, e.g. because the generation cache now serves it"""
+        pool = self._pools.pop(key, None)
+        if pool is not None:
+            self.stats["dropped"] += len(pool.stories)
+
+    def _targets(self, now: float) -> Dict[str, int]:
+        """Pool size per key, highest demand first, within the total cap"""
+        wanted = []
+        for key, pool in self._pools.items():
+            pool.decay(now, self.half_life)
+            rate = pool.rate(self.half_life)
+            if rate >= self.min_rate:
+                wanted.append((rate, key))
+        targets = {}
+        budget = self.max_stories
+        for rate, key in sorted(wanted, reverse=True):
+            target = min(self.max_per_combo, math.ceil(rate * self.horizon), budget)
+            if target <= 0:
+                break
+            targets[key] = target
+            budget -= target
+        return targets
+
+    def _schedule(self):
+        now = time.monotonic()
+        for key, pool in list(self._pools.items()):
+            self._expire(pool, now)
+            # Forget combinations nobody asked for in a long time
+            pool.decay(now, self.half_life)
+            if not pool.stories and not pool.refilling and pool.demand < 0.01:
+                del self._pools[key]
+
+        targets = self._targets(now)
+        deficits = sorted(
+            ((target - len(self._pools[key].stories) - self._pools[key].refilling, key)
+             for key, target in targets.items()),
+            reverse=True,
+        )
+        for deficit, key in deficits:
+            for _ in range(deficit):
+                if (len(self._refills) >= self.concurrency
+                        or self.stored + len(self._refills) >= self.max_stories
+                        or not self._has_capacity()):
+                    return
+                self._start_refill(key)
+
+    def _start_refill(self, key: str):
+        pool = self._pools[key]
+        pool.refilling += 1
+        task = asyncio.get_running_loop().create_task(self._refill(pool))
+        self._refills.add(task)
+        task.add_done_callback(self._refills.discard)
+
+    async def _refill(self, pool: ComboPool):
+        try:
+            title, content = await self._generate(pool.prompt)
+            pool.stories.append((time.monotonic(), title, content))
+            self.stats["generated"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Story pre-generation failed: {type(e).__name__}: {str(e)}")
+        finally:
+            pool.refilling -= 1
+            self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                self._schedule()
+            except Exception as e:
+                print(f"Story pre-generation scheduling failed: {type(e).__name__}: {str(e)}")
+
+    def start(self, generate: StoryGenerator, is_preset: Callable[[StoryPrompt], bool],
+              has_capacity: Callable[[], bool]):
+        """Start the background scheduler (called from the startup hook)"""
+        self._generate = generate
+        self._is_preset = is_preset
+        self._has_capacity = has_capacity
+        if not self.enabled or self._scheduler is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._scheduler = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop scheduling and abandon refills in progress"""
+        tasks = [task for task in (self._scheduler, *self._refills) if task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._scheduler = None
+        self._wakeup = None
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        targets = self._targets(now)
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "stored": self.stored,
+            "refilling": self.refilling,
+            "max_stories": self.max_stories,
+            "combos": [
+                {
+                    "character_type": pool.prompt.character_type,
+                    "setting_type": pool.prompt.setting_type,
+                    "theme_type": pool.prompt.theme_type,
+                    "age_group": pool.prompt.age_group,
+                    "language": pool.prompt.language,
+                    "story_length": pool.prompt.story_length,
+                    "requests_per_hour": round(pool.rate(self.half_life) * 3600, 2),
+                    "target": targets.get(key, 0),
+                    "stored": len(pool.stories),
+                    "refilling": pool.refilling,
+                }
+                for key, pool in sorted(self._pools.items(), key=lambda item: -item[1].demand)
+            ],
+        }
+
+
+# Shared pool for this worker process
+pregeneration_pool = PregenerationPool()
@@ -0,0 +1,123 @@
+from functools import lru_cache
+from typing import List, Optional
+
+from .schemas import StoryPrompt
+
+# Prompt templates, one set per language. Placeholders {character},
+# {setting}, {theme} and {age_group} are filled per request; everything
+# else is resolved once per (language, age_group, story_length, style).
+# Adding a language means adding an entry here.
+TEMPLATES = {
+    "en": {
+        "age": {
+            "3-5": "very simple language suitable for preschoolers",
+            "6-8": "simple language suitable for early elementary school children",
+            "9-12": "language suitable for upper elementary school children",
+        },
+        "age_default": "simple language suitable for children",
+        "length": {
+            "short": "at least 1000 words",
+            "medium": "at least 1500 words",
+            "long": "at least 2500 words",
+        },
+        "length_default": "at least 1500 words",
+        "system": (
+            "You are a creative children's book author.\n"
+            "Write a LONG story in English with {age_language}.\n"
+            "The story should be {story_length} long.\n"
+            "The story should be about a {{character}} in a {{setting}} with the theme of {{theme}}.\n"
+            "The story should be entertaining, educational, and appropriate for children aged {{age_group}}.\n"
+            "Break the story into short paragraphs."
+        ),
+        "style": "The story should be in a {style} style.",
+        "user": "Write a story about a {character} in a {setting} with the theme of {theme}.",
+        "title": "The {character} in the {setting}",
+    },
+    "sv": {
+        "age": {
+            "3-5": "mycket enkelt språk som passar förskolebarn",
+            "6-8": "enkelt språk som passar barn i de lägre klasserna",
+            "9-12": "språk som passar barn i mellanstadiet",
+        },
+        "age_default": "enkelt språk som passar barn",
+        "length": {
+            "short": "minst 1000 ord",
+            "medium": "minst 1500 ord",
+            "long": "minst 2500 ord",
+        },
+        "length_default": "minst 1500 ord",
+        "system": (
+            "Du är en kreativ barnboksförfattare.\n"
+            "Skriv en LÅNG saga på svenska med {age_language}.\n"
+            "Sagan ska vara {story_length} lång.\n"
+            "Sagan ska handla om en {{character}} i en {{setting}} med temat {{theme}}.\n"
+            "Sagan ska vara underhållande, lärorik och lämplig för barn i åldern {{age_group}}.\n"
+            "Dela upp berättelsen i korta stycken."
+        ),
+        "style": "Sagan ska vara i en {style} stil.",
+        "user": "Skriv en saga om en {character} i en {setting} med temat {theme}.",
+        "title": "{character}en i {setting}en",
+    },
+}
+
+DEFAULT_LANGUAGE = "en"
+
+
+def template_set(language: Optional[str]) -> dict:
+    """Templates for a language code, falling back to English"""
+    return TEMPLATES.get((language or "").lower(), TEMPLATES[DEFAULT_LANGUAGE])
+
+
+def _escape(value: str) -> str:
+    return value.replace("{", "{{").replace("}", "}}")
+
+
+@lru_cache(maxsize=512)
+def system_template(language: str, age_group: str, story_length: str, style: Optional[str]) -> str:
+    """System message with everything but the story subject filled in"""
+    templates = template_set(language)
+    message = templates["system"].format(
+        age_language=templates["age"].get(age_group, templates["age_default"]),
+        story_length=templates["length"].get(story_length, templates["length_default"]),
+    )
+    if style:
+        message += "\n" + _escape(templates["style"].format(style=style))
+    return message
+
+
+def _subject(prompt: StoryPrompt) -> dict:
+    return {
+        "character": prompt.character_type,
+        "setting": prompt.setting_type,
+        "theme": prompt.theme_type,
+        "age_group": prompt.age_group,
+    }
+
+
+def render_messages(prompt: StoryPrompt) -> List[dict]:
+    """Chat messages for a story prompt"""
+    subject = _subject(prompt)
+    system_message = system_template(
+        (prompt.language or "").lower(), prompt.age_group, prompt.story_length, prompt.style
+    ).format_map(subject)
+
+    # Add custom prompt if provided
+    if prompt.custom_prompt:
+        system_message += f"\n{prompt.custom_prompt}"
+
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": template_set(prompt.language)["user"].format_map(subject)},
+    ]
+
+
+def render_title(prompt: StoryPrompt) -> str:
+    return template_set(prompt.language)["title"].format_map(_subject(prompt))
+
+
+# Pre-render the system templates for every known combination at import
+# time so the request path only does the final substitution
+for _language, _templates in TEMPLATES.items():
+    for _age_group in _templates["age"]:
+        for _story_length in _templates["length"]:
+            system_template(_language, _age_group, _story_length, None)
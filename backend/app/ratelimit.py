@@ -0,0 +1,225 @@
+import os
+import math
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from . import db
+from .metrics import counter
+from .schemas import StoryPrompt
+
+# Generation rate limits, charged in estimated LLM tokens rather than requests
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# 'memory' keeps buckets per worker process; 'postgres' shares them across workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Verified users, each on their own bucket
+RATE_LIMIT_USER_TOKENS_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_TOKENS_PER_MINUTE", "6000"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "12000"))
+# Anonymous callers, per client IP; larger since a school or office shares one address
+RATE_LIMIT_IP_TOKENS_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_TOKENS_PER_MINUTE", "60000"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "120000"))
+RATE_LIMIT_GLOBAL_TOKENS_PER_MINUTE = float(os.getenv("RATE_LIMIT_GLOBAL_TOKENS_PER_MINUTE", "300000"))
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "600000"))
+# In-memory buckets kept before the least recently used are dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+
+# Requested words per story_length (see prompts.TEMPLATES) and tokens per word
+STORY_LENGTH_WORDS = {"short": 1000, "medium": 1500, "long": 2500}
+TOKENS_PER_WORD = {"en": 1.35, "sv": 1.8}
+# System and user prompt tokens sent with every generation
+PROMPT_TOKENS = 250
+MAX_COMPLETION_TOKENS = 4000
+
+# Batches are charged up front to a separate bucket per caller, by default
+# large enough for a full batch (BATCH_MAX_ITEMS) of the longest stories
+RATE_LIMIT_BATCH_TOKENS_PER_MINUTE = float(os.getenv("RATE_LIMIT_BATCH_TOKENS_PER_MINUTE", "30000"))
+RATE_LIMIT_BATCH_BURST = float(os.getenv(
+    "RATE_LIMIT_BATCH_BURST",
+    str(int(os.getenv("BATCH_MAX_ITEMS", "50")) * (PROMPT_TOKENS + MAX_COMPLETION_TOKENS))
+))
+
+GLOBAL_KEY = "global"
+
+RATE_LIMITED = counter("rate_limited_total", "Generations rejected by the token budget", ("scope",))
+
+
+def estimate_tokens(prompt: StoryPrompt) -> int:
+    """Tokens a generation for this prompt is expected to consume"""
+    if prompt.mode == "instant":
+        # Rendered locally without the LLM
+        return 0
+    words = STORY_LENGTH_WORDS.get(prompt.story_length, STORY_LENGTH_WORDS["medium"])
+    per_word = TOKENS_PER_WORD.get((prompt.language or "").lower(), TOKENS_PER_WORD["en"])
+    return PROMPT_TOKENS + min(MAX_COMPLETION_TOKENS, int(words * per_word))
+
+
+class RateLimited(Exception):
+    """Raised when a bucket cannot cover the cost; retry_after is in seconds"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Generation budget exceeded ({scope}), retry in {math.ceil(retry_after)}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class CostTooLarge(Exception):
+    """Raised when one request costs more than a bucket can ever hold"""
+
+    def __init__(self, scope: str, cost: float, capacity: float):
+        super().__init__(
+            f"Request needs {math.ceil(cost)} tokens but at most {int(capacity)} "
+            f"fit in one request ({scope} budget)"
+        )
+        self.scope = scope
+        self.cost = cost
+        self.capacity = capacity
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 if they are now)"""
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+# (bucket key, scope label, tokens per second, capacity)
+BucketSpec = Tuple[str, str, float, float]
+
+
+class MemoryBuckets:
+    """Token buckets held in this process; fast, but per worker"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def _bucket(self, key: str, rate: float, capacity: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return bucket
+
+    async def take(self, specs: List[BucketSpec], cost: float):
+        now = time.monotonic()
+        buckets = []
+        for key, scope, rate, capacity in specs:
+            bucket = self._bucket(key, rate, capacity)
+            bucket.refill(now)
+            wait = bucket.wait_time(cost)
+            if wait > 0:
+                raise RateLimited(scope, wait)
+            buckets.append(bucket)
+        # Only charge once every bucket can pay
+        for bucket in buckets:
+            bucket.tokens -= cost
+
+
+class PostgresBuckets:
+    """Token buckets in the ``rate_limit_buckets`` table, shared by all workers.
+
+    Each bucket is refilled and charged by a single conditional upsert;
+    all buckets of one request are charged in one transaction, so a
+    rejection by the global bucket refunds the user bucket.
+    """
+
+    TAKE = """
+    INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at)
+    VALUES ($1, $3::float8 - $4::float8, clock_timestamp())
+    ON CONFLICT (key) DO UPDATE
+    SET tokens = LEAST($3, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at)::float8 * $2) - $4,
+        updated_at = clock_timestamp()
+    WHERE LEAST($3, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at)::float8 * $2) >= $4
+    RETURNING tokens
+    """
+
+    AVAILABLE = """
+    SELECT LEAST($3::float8, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at)::float8 * $2::float8)
+    FROM rate_limit_buckets WHERE key = $1
+    """
+
+    async def take(self, specs: List[BucketSpec], cost: float):
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                for key, scope, rate, capacity in specs:
+                    if await conn.fetchrow(self.TAKE, key, rate, capacity, cost) is None:
+                        available = await conn.fetchval(self.AVAILABLE, key, rate, capacity) or 0.0
+                        # Raising rolls back the charges already made
+                        raise RateLimited(scope, max(0.0, (cost - available) / rate))
+
+
+class GenerationRateLimiter:
+    """Charges generations against a per-caller bucket and a global bucket.
+
+    Verified users are charged on their own bucket and anonymous callers
+    (including unknown user ids) on their client IP's, which has larger
+    limits because many people may share an address. Batches use a
+    separate per-caller bucket sized for a full batch. A request costing
+    more than a bucket holds is refused outright.
+    """
+
+    def __init__(self, backend: str = RATE_LIMIT_BACKEND, enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.backend = backend
+        self._store = PostgresBuckets() if backend == "postgres" else MemoryBuckets()
+        # scope -> (tokens per second, capacity)
+        self.limits = {
+            "user": (RATE_LIMIT_USER_TOKENS_PER_MINUTE / 60.0, RATE_LIMIT_USER_BURST),
+            "ip": (RATE_LIMIT_IP_TOKENS_PER_MINUTE / 60.0, RATE_LIMIT_IP_BURST),
+            "batch": (RATE_LIMIT_BATCH_TOKENS_PER_MINUTE / 60.0, RATE_LIMIT_BATCH_BURST),
+            "global": (RATE_LIMIT_GLOBAL_TOKENS_PER_MINUTE / 60.0, RATE_LIMIT_GLOBAL_BURST),
+        }
+
+    def specs(self, caller: str, batch: bool = False) -> List[BucketSpec]:
+        """Buckets a request from caller is charged to"""
+        scope = "batch" if batch else caller.split(":", 1)[0]
+        key = f"batch:{caller}" if batch else caller
+        return [(key, scope, *self.limits[scope]), (GLOBAL_KEY, "global", *self.limits["global"])]
+
+    async def charge(self, caller: str, cost: float, batch: bool = False):
+        """Take cost tokens from the caller's bucket and the global bucket.
+
+        Raises CostTooLarge when cost exceeds a bucket's capacity and
+        RateLimited when a bucket cannot cover it yet.
+        """
+        if not self.enabled or cost <= 0:
+            return
+        specs = self.specs(caller, batch)
+        for _, scope, _, capacity in specs:
+            if cost > capacity:
+                RATE_LIMITED.inc(scope=scope)
+                raise CostTooLarge(scope, cost, capacity)
+        try:
+            await self._store.take(specs, cost)
+        except RateLimited as e:
+            RATE_LIMITED.inc(scope=e.scope)
+            raise
+        except Exception as e:
+            # Shared state unavailable: let the request through rather than fail it
+            print(f"Rate limit check failed, allowing request: {type(e).__name__}: {str(e)}")
+
+
+def caller_key(user_id: Optional[int], client_host: Optional[str]) -> str:
+    """Bucket key for a caller: the user when verified, otherwise the client IP"""
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{client_host or 'unknown'}"
+
+
+# Shared limiter for this worker process
+generation_limiter = GenerationRateLimiter()
@@ -0,0 +1,234 @@
+import time
+import random
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+# Generic protections for a flaky upstream: a circuit breaker, a retry
+# budget with jittered backoff, and an AIMD concurrency limiter. They hold
+# per-process state only and are not thread-safe (one event loop per worker).
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that is failing or too slow.
+
+    Outcomes from the last ``window`` seconds are kept. Once at least
+    ``min_calls`` were seen and the share of failures reaches
+    ``error_rate`` (or the share of calls slower than ``slow_call_seconds``
+    reaches ``slow_rate``), the breaker opens and ``allow()`` returns False
+    for ``open_seconds``. It then lets ``half_open_calls`` probe calls
+    through; if they succeed it closes again, otherwise it reopens.
+
+    ``allow()`` hands out a ticket naming the state the call was admitted
+    in; ``record()`` and ``cancel()`` take it back. Every state change
+    starts a new generation, and outcomes of calls admitted in an earlier
+    one are ignored, so a slow call from before the breaker opened cannot
+    count as a half-open probe.
+    """
+
+    def __init__(self, window: float = 30.0, min_calls: int = 10, error_rate: float = 0.5,
+                 slow_call_seconds: float = 45.0, slow_rate: float = 0.5,
+                 open_seconds: float = 30.0, half_open_calls: int = 2):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._generation = 0
+        self._probes = 0
+        self._probe_successes = 0
+        # (monotonic time, failed, slow)
+        self._outcomes = deque()
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def _set_state(self, state: str):
+        self.state = state
+        self._generation += 1
+
+    def allow(self) -> Optional[Tuple[str, int]]:
+        """A ticket if a call may go to the upstream right now, otherwise None"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.stats["rejected"] += 1
+                return None
+            self._set_state(HALF_OPEN)
+            self._probes = self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self.stats["rejected"] += 1
+                return None
+            self._probes += 1
+        return self.state, self._generation
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets probe calls through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def record(self, ticket: Tuple[str, int], success: bool, duration: float):
+        """Report the outcome of a call that allow() let through"""
+        if ticket[1] != self._generation:
+            # Admitted before the last state change
+            return
+        if self.state == HALF_OPEN:
+            if not success:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_calls:
+                self._set_state(CLOSED)
+                self._outcomes.clear()
+            return
+
+        now = time.monotonic()
+        self._outcomes.append((now, not success, duration >= self.slow_call_seconds))
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        failures = sum(1 for _, failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, _, is_slow in self._outcomes if is_slow)
+        if failures / calls >= self.error_rate or slow / calls >= self.slow_rate:
+            self._open()
+
+    def cancel(self, ticket: Tuple[str, int]):
+        """Report that a call allowed through was abandoned without an outcome"""
+        if ticket == (HALF_OPEN, self._generation) and self._probes > 0:
+            self._probes -= 1
+
+    def _open(self):
+        self._set_state(OPEN)
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats["opened"] += 1
+
+
+class RetryBudget:
+    """Caps retries to a fraction of recent requests.
+
+    Within the last ``window`` seconds, retries may not exceed
+    ``ratio`` times the number of first attempts plus ``min_per_second``
+    times the window, so an outage cannot multiply upstream traffic.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 0.5, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+        self.stats = {"retries": 0, "exhausted": 0}
+
+    def _trim(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_retry(self) -> bool:
+        """Take a retry from the budget if one is left"""
+        now = time.monotonic()
+        self._trim(now)
+        allowed = self.ratio * len(self._requests) + self.min_per_second * self.window
+        if len(self._retries) >= allowed:
+            self.stats["exhausted"] += 1
+            return False
+        self._retries.append(now)
+        self.stats["retries"] += 1
+        return True
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0,
+                  retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than a Retry-After hint"""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adjusted with additive increase / multiplicative decrease.
+
+    Every successful call raises the limit by ``1 / limit`` (about one
+    slot per round of calls); an overload signal (429, timeout, slow call)
+    multiplies it by ``backoff``, at most once per ``cooldown`` seconds so
+    a burst of failures from the same moment counts once. The limit stays
+    between ``min_limit`` and ``max_limit``.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial: Optional[int] = None,
+                 backoff: float = 0.5, cooldown: float = 1.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial if initial is not None else max_limit)
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.waiting = 0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            self.waiting += 1
+            try:
+                await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def release(self, overloaded: bool = False, success: bool = True):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            if overloaded:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+            elif success:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            free = int(self.limit) - self.in_flight
+            if free > 0:
+                condition.notify(free)
+
@@ -1,4 +1,5 @@
 from typing import List, Optional
+from uuid import UUID
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import datetime
 
@@ -52,6 +53,39 @@ class StoryResponse(StoryBase):
     class Config:
         from_attributes = True
 
+class StorySummary(BaseModel):
+    id: int
+    title: str
+    excerpt: str  # Opening of the story content
+    theme: Optional[str] = None
+    characters: Optional[List[str]] = None
+    setting: Optional[str] = None
+    age_group: Optional[str] = None
+    language: str = 'en'
+    is_public: bool = False
+    user_id: Optional[int] = None
+    created_at: datetime
+
+class StorySearchResult(StorySummary):
+    rank: float  # Full-text relevance, 0 when no query was given
+
+class StoryParagraph(BaseModel):
+    position: int  # 0-based index within the story
+    content: str
+    word_count: int
+
+class StoryParagraphRange(BaseModel):
+    story_id: int
+    title: str
+    language: str = 'en'
+    age_group: Optional[str] = None
+    start: int  # First paragraph returned
+    end: int  # One past the last paragraph returned
+    next_from: Optional[int] = None
+    total_paragraphs: int
+    total_words: int
+    paragraphs: List[StoryParagraph]
+
 # Story generation schemas
 class StoryPrompt(BaseModel):
     character_type: str
@@ -62,8 +96,23 @@ class StoryPrompt(BaseModel):
     story_length: str = 'medium'  # 'short', 'medium', 'long'
     custom_prompt: Optional[str] = None  # Optional custom instruction
     style: Optional[str] = None  # e.g., 'funny', 'scary', 'educational'
+    mode: str = Field('ai', pattern='^(ai|instant)$')  # 'instant' uses the offline generator
     user_id: Optional[int] = None  # Optional user ID for authentication
 
+class StoryBatchRequest(BaseModel):
+    prompts: List[StoryPrompt]
+    user_id: Optional[int] = None  # Owner of every story in the batch
+
+class StoryJobResponse(BaseModel):
+    id: UUID
+    status: str  # 'queued', 'running', 'done', 'failed'
+    error: Optional[str] = None
+    story_id: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    story: Optional[StoryResponse] = None  # Set once status is 'done'
+
 class StoryPromptResponse(StoryPrompt):
     id: int
     created_at: datetime
@@ -85,3 +134,10 @@ class SavedStoryResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+class SavedStorySummary(BaseModel):
+    id: int
+    user_id: int
+    story_id: int
+    created_at: datetime  # When the story was saved
+    story: StorySummary
@@ -0,0 +1,116 @@
+import os
+import hmac
+import base64
+import asyncio
+import hashlib
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# scrypt cost parameters for new hashes. Defaults take roughly 50 ms and
+# 16 MB per hash on current server CPUs.
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+# Threads hashing concurrently per worker; hashlib releases the GIL while
+# hashing, so this caps CPU and memory spent on logins
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+
+SCRYPT_PREFIX = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text.encode("ascii"))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+
+def hash_password_sync(password: str, n: int = PASSWORD_SCRYPT_N,
+                       r: int = PASSWORD_SCRYPT_R, p: int = PASSWORD_SCRYPT_P) -> str:
+    """Hash a password as ``scrypt$n$r$p$salt$key`` (blocking)"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return f"{SCRYPT_PREFIX}${n}${r}${p}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def verify_password_sync(password: str, stored: str) -> Tuple[bool, bool]:
+    """Check a password against a stored hash (blocking).
+
+    Returns ``(valid, needs_rehash)``. Hashes in the legacy ``salt:sha256``
+    format and scrypt hashes with outdated cost parameters verify normally
+    but report that they should be replaced.
+    """
+    if stored.startswith(SCRYPT_PREFIX + "$"):
+        try:
+            _, n, r, p, salt, key = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            expected = _b64decode(key)
+            computed = _scrypt(password, _b64decode(salt), n, r, p)
+        except ValueError:
+            return False, False
+        valid = hmac.compare_digest(computed, expected)
+        outdated = (n, r, p) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+        return valid, valid and outdated
+
+    # Legacy format: "<salt>:<sha256(password + salt)>"
+    if ":" not in stored:
+        return False, False
+    salt, stored_hash = stored.split(":", 1)
+    computed_hash = hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
+    valid = hmac.compare_digest(computed_hash, stored_hash)
+    return valid, valid
+
+
+# Verified when a login names no known user, so that the answer takes as
+# long as for a real account. The key is arbitrary: no password matches it.
+DUMMY_PASSWORD_HASH = (
+    f"{SCRYPT_PREFIX}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}"
+    f"${_b64encode(bytes(SALT_BYTES))}${_b64encode(bytes(KEY_BYTES))}"
+)
+
+
+class PasswordHasher:
+    """Runs password hashing on a dedicated thread pool.
+
+    A memory-hard KDF takes tens of milliseconds per call, which would
+    stall the event loop if done inline in an ``async def`` handler. The
+    pool size bounds how many hashes run at once; further logins wait
+    without blocking other requests.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), hash_password_sync, password)
+
+    async def verify(self, password: str, stored: str) -> Tuple[bool, bool]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), verify_password_sync, password, stored)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Shared hasher for this worker process
+password_hasher = PasswordHasher()
@@ -0,0 +1,196 @@
+"""Production server for the StoryTeller API.
+
+Runs uvicorn with several worker processes and splits the database
+connection budget between them, so that all workers (and replicas)
+together stay below the server's ``max_connections``:
+
+    python -m app.serve --port 8000
+
+Worker processes inherit the computed ``DB_POOL_MAX_SIZE`` /
+``DB_POOL_MIN_SIZE`` (and ``LLM_MAX_CONCURRENCY`` / ``PREGEN_MAX_STORIES``
+when ``LLM_TOTAL_CONCURRENCY`` / ``PREGEN_TOTAL_STORIES`` are set) through
+the environment. With more than one worker they also get a shared
+``METRICS_DIR``, so ``/metrics`` reports every worker whichever one
+answers the scrape.
+
+On SIGTERM/SIGINT each worker reports not ready on ``/health/ready`` at
+once, keeps serving for ``SHUTDOWN_READY_DELAY`` seconds so load balancers
+notice, and only then starts uvicorn's graceful shutdown.
+"""
+import os
+import sys
+import logging
+import math
+import shutil
+import asyncio
+import argparse
+import tempfile
+from typing import Optional
+
+import psycopg2
+import uvicorn
+from uvicorn.main import STARTUP_FAILURE
+from uvicorn.supervisors import Multiprocess
+
+# Worker processes; defaults to one per CPU since each runs its own event loop
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY")
+# Instances of this service sharing the database
+API_REPLICAS = int(os.getenv("API_REPLICAS", "1"))
+# Connections left for migrations, admin sessions and other services
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+# Upper bound for a worker's pool even when the database allows more
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+# Generations in flight across all workers of one replica (unset = per-worker limit only)
+LLM_TOTAL_CONCURRENCY = os.getenv("LLM_TOTAL_CONCURRENCY")
+# Pre-generated stories held per replica, split across workers (unset = per-worker cap only)
+PREGEN_TOTAL_STORIES = os.getenv("PREGEN_TOTAL_STORIES")
+# Seconds uvicorn waits for open requests (e.g. streamed stories) on shutdown
+GRACEFUL_SHUTDOWN_TIMEOUT = float(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "95"))
+# Seconds a stopping worker keeps serving while /health/ready already answers 503
+SHUTDOWN_READY_DELAY = float(os.getenv("SHUTDOWN_READY_DELAY", "0"))
+
+# Besides its pool, every worker holds one LISTEN connection for the prompt catalog
+EXTRA_CONNECTIONS_PER_WORKER = 1
+MIN_POOL_SIZE = 2
+
+
+class Server(uvicorn.Server):
+    """uvicorn server that fails readiness as soon as it is asked to stop.
+
+    uvicorn only runs the app's shutdown hook after its graceful drain, so
+    the flag is flipped from the signal handler instead.
+    """
+
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        self.exit_scheduled = False
+
+    def handle_exit(self, sig, frame):
+        from .main import app
+        app.state.ready = False
+        if SHUTDOWN_READY_DELAY > 0 and not self.exit_scheduled:
+            # A second signal during the delay stops right away
+            self.exit_scheduled = True
+            asyncio.get_event_loop().call_later(SHUTDOWN_READY_DELAY, self._exit_after_delay, sig, frame)
+            return
+        super().handle_exit(sig, frame)
+
+    def _exit_after_delay(self, sig, frame):
+        if not self.should_exit:
+            super().handle_exit(sig, frame)
+
+
+class Supervisor(Multiprocess):
+    """uvicorn's worker supervisor, but stopping all workers at once.
+
+    uvicorn signals each worker only after the previous one has exited, so
+    the others would keep reporting ready through its whole drain.
+    """
+
+    def shutdown(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logging.getLogger("uvicorn.error").info(f"Stopping parent process [{self.pid}]")
+
+
+def database_connection_limit(dsn: Optional[str]) -> Optional[int]:
+    """Connections available to regular users on the database server"""
+    if not dsn:
+        return None
+    try:
+        conn = psycopg2.connect(dsn, connect_timeout=5)
+    except psycopg2.Error as e:
+        print(f"Could not read max_connections ({str(e).strip()}); using configured pool sizes")
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT current_setting('max_connections')::int, "
+                           "current_setting('superuser_reserved_connections')::int")
+            max_connections, superuser_reserved = cursor.fetchone()
+        return max_connections - superuser_reserved
+    finally:
+        conn.close()
+
+
+def plan(workers: Optional[int], dsn: Optional[str]) -> dict:
+    """Choose the worker count and per-worker budgets"""
+    workers = workers or int(WEB_CONCURRENCY or os.cpu_count() or 1)
+    pool_max = DB_POOL_MAX_SIZE
+
+    limit = database_connection_limit(dsn)
+    if limit is not None:
+        budget = (limit - DB_RESERVED_CONNECTIONS) // max(1, API_REPLICAS)
+        per_worker = budget // workers - EXTRA_CONNECTIONS_PER_WORKER
+        if per_worker < MIN_POOL_SIZE:
+            # Fewer workers with usable pools beat many starved ones
+            workers = max(1, budget // (MIN_POOL_SIZE + EXTRA_CONNECTIONS_PER_WORKER))
+            per_worker = budget // workers - EXTRA_CONNECTIONS_PER_WORKER
+        pool_max = max(1, min(pool_max, per_worker))
+
+    result = {
+        "workers": workers,
+        "db_connection_limit": limit,
+        "DB_POOL_MAX_SIZE": pool_max,
+        "DB_POOL_MIN_SIZE": min(DB_POOL_MIN_SIZE, pool_max),
+    }
+    if LLM_TOTAL_CONCURRENCY:
+        result["LLM_MAX_CONCURRENCY"] = max(1, math.ceil(int(LLM_TOTAL_CONCURRENCY) / workers))
+    if PREGEN_TOTAL_STORIES:
+        result["PREGEN_MAX_STORIES"] = int(PREGEN_TOTAL_STORIES) // workers
+    if workers > 1 and os.getenv("METRICS_DIR"):
+        result["METRICS_DIR"] = os.getenv("METRICS_DIR")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, help="worker processes (default: WEB_CONCURRENCY or CPU count)")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--dry-run", action="store_true", help="print the plan and exit")
+    args = parser.parse_args()
+
+    settings = plan(args.workers, os.getenv("DATABASE_URL"))
+    print(f"Server plan: {settings}")
+    if args.dry_run:
+        return
+
+    # Workers share metric snapshots through a directory of this server's own
+    metrics_dir = None
+    if settings["workers"] > 1 and "METRICS_DIR" not in settings:
+        metrics_dir = settings["METRICS_DIR"] = tempfile.mkdtemp(prefix="storyteller-metrics-")
+
+    # Workers read their budgets from the environment when they import the app
+    for name, value in settings.items():
+        if name.isupper():
+            os.environ[name] = str(value)
+
+    config = uvicorn.Config(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=settings["workers"],
+        log_level=args.log_level,
+        proxy_headers=True,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+    )
+    # Same as uvicorn.run, but with our Server in every worker
+    server = Server(config)
+    try:
+        if config.workers > 1:
+            Supervisor(config, target=server.run, sockets=[config.bind_socket()]).run()
+        else:
+            server.run()
+            if not server.started:
+                sys.exit(STARTUP_FAILURE)
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
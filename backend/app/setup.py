@@ -2,70 +2,39 @@ import time
 import os
 import psycopg2
 
-def create_tables():
-    """Create database tables if they don't exist"""
-    commands = (
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(100) NOT NULL UNIQUE,
-            email VARCHAR(255) NOT NULL UNIQUE,
-            password_hash VARCHAR(255) NOT NULL,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS stories (
-            id SERIAL PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
-            content TEXT NOT NULL,
-            theme VARCHAR(100),
-            characters TEXT[],
-            setting VARCHAR(100),
-            age_group VARCHAR(50),
-            language VARCHAR(10),
-            user_id INTEGER REFERENCES users(id),
-            is_public BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS story_prompts (
-            id SERIAL PRIMARY KEY,
-            character_type VARCHAR(100) NOT NULL,
-            setting_type VARCHAR(100) NOT NULL,
-            theme_type VARCHAR(100) NOT NULL,
-            age_group VARCHAR(50) NOT NULL,
-            language VARCHAR(10) NOT NULL,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS saved_stories (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            story_id INTEGER REFERENCES stories(id),
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user_id, story_id)
-        )
-        """
-    )
-    
-    conn = psycopg2.connect(
-        os.environ.get("DATABASE_URL")
-    )
-    
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                for command in commands:
-                    cursor.execute(command)
-        print("Tables created successfully")
-    except Exception as e:
-        print(f"Error creating tables: {e}")
-    finally:
-        conn.close()
+# Seconds to wait for the database to accept connections before giving up
+DB_WAIT_TIMEOUT = float(os.getenv("DB_WAIT_TIMEOUT", "60"))
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+def wait_for_database(timeout: float = DB_WAIT_TIMEOUT):
+    """Poll until the database answers a query, instead of sleeping a fixed time"""
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        try:
+            conn = psycopg2.connect(os.environ.get("DATABASE_URL"), connect_timeout=3)
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            finally:
+                conn.close()
+            return
+        except psycopg2.OperationalError as e:
+            if time.monotonic() + delay > deadline:
+                raise RuntimeError(f"Database not ready after {timeout:.0f}s: {str(e).strip()}")
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+def run_migrations():
+    """Bring the schema up to date with the Alembic migrations in migrations/"""
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    command.upgrade(config, "head")
+    print("Database schema is up to date")
 
 def insert_initial_data():
     """Insert initial data into the database"""
@@ -108,7 +77,10 @@ def insert_initial_data():
         conn.close()
 
 if __name__ == "__main__":
-    # Wait a moment for the database to be ready
-    time.sleep(5)
-    create_tables()
+    try:
+        wait_for_database()
+        run_migrations()
+    except Exception as e:
+        print(f"Error preparing database: {e}")
+        raise SystemExit(1)
     insert_initial_data()
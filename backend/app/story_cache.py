@@ -0,0 +1,112 @@
+import os
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+from .compression import ENCODINGS, COMPRESSION_MIN_SIZE, compress
+
+# Story read cache configuration
+# Total bytes of serialized stories kept per worker
+STORY_CACHE_MAX_BYTES = int(os.getenv("STORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# max-age sent in Cache-Control for single-story responses
+STORY_CACHE_MAX_AGE = int(os.getenv("STORY_CACHE_MAX_AGE", "300"))
+# Keep compressed copies of cached bodies so hits are sent without recompressing
+STORY_CACHE_PRECOMPRESS = os.getenv("STORY_CACHE_PRECOMPRESS", "true").lower() in ("1", "true", "yes")
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the serialized response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CachedStory:
+    __slots__ = ("body", "etag", "is_public", "encoded")
+
+    def __init__(self, body: bytes, is_public: bool, precompress: bool = STORY_CACHE_PRECOMPRESS):
+        self.body = body
+        self.etag = make_etag(body)
+        self.is_public = is_public
+        # Content coding -> compressed body, built once when the story is cached
+        self.encoded = {}
+        if precompress and len(body) >= COMPRESSION_MIN_SIZE:
+            self.encoded = {encoding: compress(body, encoding) for encoding in ENCODINGS}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+    @property
+    def cache_control(self) -> str:
+        scope = "public" if self.is_public else "private"
+        return f"{scope}, max-age={STORY_CACHE_MAX_AGE}"
+
+
+class StoryCache:
+    """LRU cache of serialized single-story responses with a byte budget.
+
+    Stories range from a few hundred bytes to 15 KB and more, so the cache
+    is bounded by total body size (compressed copies included) rather than
+    entry count. Entries are
+    keyed by story id and must be invalidated by any code path that
+    changes a story.
+    """
+
+    def __init__(self, max_bytes: int = STORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "not_modified": 0}
+
+    def get(self, story_id: int) -> Optional[CachedStory]:
+        entry = self._entries.get(story_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(story_id)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, story_id: int, body: bytes, is_public: bool) -> CachedStory:
+        entry = CachedStory(body, is_public)
+        if entry.size > self.max_bytes:
+            return entry
+        self.invalidate(story_id)
+        self._entries[story_id] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+            self.stats["evictions"] += 1
+        return entry
+
+    def invalidate(self, story_id: int):
+        """Drop a story, e.g. after it was edited or deleted"""
+        entry = self._entries.pop(story_id, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+# Shared cache for this worker process
+story_cache = StoryCache()
@@ -0,0 +1,2 @@
+# Benchmarks for the StoryTeller backend. Run from the backend directory,
+# e.g. `python -m benchmarks.bench_password_hashing`.
@@ -0,0 +1,150 @@
+"""Measure response compression for typical single-story bodies.
+
+For story JSON bodies of about 8, 12 and 15 KB, reports the compressed size
+and the compress/decompress CPU time of gzip and brotli at several levels,
+so COMPRESSION_GZIP_LEVEL / COMPRESSION_BROTLI_QUALITY can be chosen
+against bandwidth. A pre-compressed story cache hit costs none of the
+compression time. Output is JSON.
+
+Bodies are synthetic prose unless ``--database-url`` is given, in which
+case the longest stories in that database are used.
+
+    python -m benchmarks.bench_compression --iterations 200
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas import StoryResponse  # noqa: E402
+from app.prompts import TEMPLATES  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TARGET_SIZES = (8 * 1024, 12 * 1024, 15 * 1024)
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 5, 11)
+
+
+def synthetic_story(target_bytes: int, seed: int) -> bytes:
+    """Serialized StoryResponse whose body is about target_bytes long"""
+    rng = random.Random(seed)
+    text = " ".join(
+        value for template in TEMPLATES["en"].values()
+        for value in (template.values() if isinstance(template, dict) else [template])
+    )
+    vocabulary = sorted({word.strip(".,{}:()'\"").lower() for word in text.split()} - {""})
+    names = ["dragon", "fox", "owl", "forest", "mountain", "castle", "friendship", "courage"]
+
+    paragraphs = []
+    story = None
+    while story is None or len(story) < target_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = [rng.choice(vocabulary if rng.random() < 0.85 else names) for _ in range(rng.randint(6, 16))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+        story = story_body("\n\n".join(paragraphs))
+    return story
+
+
+def story_body(content: str, **fields) -> bytes:
+    now = datetime(2024, 1, 1)
+    row = {
+        "id": 1, "title": "The Dragon in the Mountain", "content": content, "theme": "friendship",
+        "characters": ["dragon"], "setting": "mountain", "age_group": "6-8", "language": "en",
+        "is_public": True, "user_id": None, "created_at": now, "updated_at": now,
+    }
+    row.update(fields)
+    return StoryResponse(**row).model_dump_json().encode()
+
+
+def database_stories(dsn: str, count: int):
+    import psycopg2
+
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT id, title, content, theme, characters, setting, age_group, language, is_public,"
+            " user_id, created_at, updated_at FROM stories ORDER BY length(content) DESC LIMIT %s",
+            (count,)
+        )
+        columns = [d[0] for d in cur.description]
+        return [StoryResponse(**dict(zip(columns, row))).model_dump_json().encode() for row in cur.fetchall()]
+
+
+def time_call(fn, iterations: int) -> float:
+    """Median microseconds per call"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1e6, 1)
+
+
+def measure(body: bytes, iterations: int) -> list:
+    codecs = [
+        (f"gzip-{level}",
+         lambda data, level=level: gzip.compress(data, compresslevel=level, mtime=0),
+         gzip.decompress)
+        for level in GZIP_LEVELS
+    ]
+    if brotli is not None:
+        codecs += [
+            (f"br-{quality}", lambda data, quality=quality: brotli.compress(data, quality=quality), brotli.decompress)
+            for quality in BROTLI_QUALITIES
+        ]
+
+    results = []
+    for name, compress, decompress in codecs:
+        compressed = compress(body)
+        # Quality 11 is far slower; fewer rounds keep the run short
+        rounds = max(5, iterations // 20) if name == "br-11" else iterations
+        compress_us = time_call(lambda: compress(body), rounds)
+        results.append({
+            "codec": name,
+            "bytes": len(compressed),
+            "ratio": round(len(body) / len(compressed), 2),
+            "saved_pct": round(100 * (1 - len(compressed) / len(body)), 1),
+            "compress_us": compress_us,
+            "decompress_us": time_call(lambda: decompress(compressed), rounds),
+            # Single-core requests/sec if compression were the only work
+            "compress_per_sec": round(1e6 / compress_us) if compress_us else None,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--database-url", help="measure the longest stories from this database")
+    args = parser.parse_args()
+
+    if args.database_url:
+        bodies = database_stories(args.database_url, 3)
+    else:
+        bodies = [synthetic_story(size, seed) for seed, size in enumerate(TARGET_SIZES)]
+
+    report = {
+        "source": "database" if args.database_url else "synthetic",
+        "brotli_available": brotli is not None,
+        "bodies": [
+            {"identity_bytes": len(body), "codecs": measure(body, args.iterations)}
+            for body in bodies
+        ],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
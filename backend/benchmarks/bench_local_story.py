@@ -0,0 +1,94 @@
+"""Measure the offline story generator used for fallbacks and mode=instant.
+
+For every language, age group and story length, renders stories for the
+catalog's preset characters and reports per-story latency (median, p99,
+max), length in words and paragraphs, and variety: the share of distinct
+stories and of distinct paragraphs among all paragraphs rendered. Needs
+no network or database. Output is JSON.
+
+    python -m benchmarks.bench_local_story --stories 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas import StoryPrompt  # noqa: E402
+from app.local_story import generate_local_story, GRAMMAR, AGE_SENTENCES, LENGTH_EPISODES  # noqa: E402
+
+# The seed catalog from app/setup.py: (character, setting, theme) per language
+PRESETS = {
+    "en": [("Princess", "Castle", "Adventure"), ("Pirate", "Ship", "Treasure Hunt"),
+           ("Astronaut", "Space", "Discovery"), ("Wizard", "Magic School", "Learning"),
+           ("Dragon", "Mountain", "Friendship"), ("Robot", "Future City", "Technology")],
+    "sv": [("Prinsessa", "Slott", "Äventyr"), ("Pirat", "Skepp", "Skattjakt"),
+           ("Astronaut", "Rymden", "Upptäckt"), ("Trollkarl", "Magiskola", "Lärande"),
+           ("Drake", "Berg", "Vänskap"), ("Robot", "Framtidsstad", "Teknologi")],
+}
+
+# Stories slower than this would not be "instant"
+BUDGET_MS = 10.0
+
+
+def measure(language: str, age_group: str, story_length: str, stories: int) -> dict:
+    presets = PRESETS[language]
+    samples = []
+    words = []
+    paragraphs = []
+    contents = set()
+    distinct_paragraphs = set()
+    for index in range(stories):
+        character, setting, theme = presets[index % len(presets)]
+        prompt = StoryPrompt(character_type=character, setting_type=setting, theme_type=theme,
+                             age_group=age_group, language=language, story_length=story_length)
+        start = time.perf_counter()
+        _, content = generate_local_story(prompt)
+        samples.append(time.perf_counter() - start)
+
+        parts = content.split("\n\n")
+        words.append(len(content.split()))
+        paragraphs.append(len(parts))
+        contents.add(content)
+        distinct_paragraphs.update(parts)
+
+    samples.sort()
+    return {
+        "language": language,
+        "age_group": age_group,
+        "story_length": story_length,
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "words": round(statistics.mean(words)),
+        "paragraphs": round(statistics.mean(paragraphs)),
+        "distinct_stories_pct": round(100 * len(contents) / stories, 1),
+        "distinct_paragraphs_pct": round(100 * len(distinct_paragraphs) / sum(paragraphs), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=500, help="stories per combination")
+    args = parser.parse_args()
+
+    results = [
+        measure(language, age_group, story_length, args.stories)
+        for language in GRAMMAR
+        for age_group in AGE_SENTENCES
+        for story_length in LENGTH_EPISODES
+    ]
+    report = {
+        "stories_per_combination": args.stories,
+        "budget_ms": BUDGET_MS,
+        "within_budget": all(result["max_ms"] < BUDGET_MS for result in results),
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure login throughput for the configured password hashing cost.
+
+Reports single-core hashes/sec (one thread, so one verify per login) and
+the throughput of the async PasswordHasher pool, plus event loop stalls
+observed while the pool is saturated. Output is JSON.
+
+    python -m benchmarks.bench_password_hashing --seconds 5
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.security import (  # noqa: E402
+    PasswordHasher, hash_password_sync, verify_password_sync,
+    PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P, PASSWORD_HASH_WORKERS,
+)
+
+PASSWORD = "correct-horse-battery-1"
+
+
+def bench_single_core(seconds: float) -> dict:
+    stored = hash_password_sync(PASSWORD)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        verify_password_sync(PASSWORD, stored)
+        count += 1
+    elapsed = time.perf_counter() - start
+    return {"logins_per_sec": round(count / elapsed, 1), "ms_per_login": round(elapsed / count * 1000, 2)}
+
+
+async def bench_pool(seconds: float, workers: int) -> dict:
+    hasher = PasswordHasher(workers=workers)
+    stored = await hasher.hash(PASSWORD)
+    count = 0
+    max_stall = 0.0
+    deadline = time.perf_counter() + seconds
+
+    async def login_loop():
+        nonlocal count
+        while time.perf_counter() < deadline:
+            await hasher.verify(PASSWORD, stored)
+            count += 1
+
+    async def probe_loop():
+        # How late does a 10 ms sleep wake up while hashing is running?
+        nonlocal max_stall
+        while time.perf_counter() < deadline:
+            before = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_stall = max(max_stall, time.perf_counter() - before - 0.01)
+
+    start = time.perf_counter()
+    await asyncio.gather(probe_loop(), *[login_loop() for _ in range(workers * 2)])
+    elapsed = time.perf_counter() - start
+    hasher.close()
+    return {
+        "workers": workers,
+        "logins_per_sec": round(count / elapsed, 1),
+        "logins_per_sec_per_worker": round(count / elapsed / workers, 1),
+        "max_event_loop_stall_ms": round(max_stall * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+
+    result = {
+        "params": {"n": PASSWORD_SCRYPT_N, "r": PASSWORD_SCRYPT_R, "p": PASSWORD_SCRYPT_P},
+        "cpu_count": os.cpu_count(),
+        "single_core": bench_single_core(args.seconds),
+        "pool": asyncio.run(bench_pool(args.seconds, args.workers)),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Compare the story list response paths: pydantic + JSONResponse vs orjson.
+
+Inserts stories into a throwaway Postgres (or ``--database-url``, inside a
+transaction that is rolled back), fetches lists of 1, 100 and 10,000 rows
+in the full and summary projections, and times turning the fetched rows
+into a response body two ways:
+
+- ``pydantic``: the previous path. Rows become dicts, FastAPI validates
+  them against the route's response_model, runs jsonable_encoder and
+  encodes with the standard library (``serialize_response`` + JSONResponse).
+- ``orjson``: rows are mapped to dicts by position and encoded by
+  ``FastJSONResponse`` without validation.
+
+The two bodies are checked to decode to the same JSON. Fetch time is
+reported separately since both paths share it. Output is JSON.
+
+    python -m benchmarks.bench_serialization --sizes 1,100,10000 --iterations 20
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from contextlib import ExitStack
+from typing import List
+
+import asyncpg
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas import StoryPrompt, StoryResponse, StorySummary  # noqa: E402
+from app.serialization import FastJSONResponse, records  # noqa: E402
+from app.local_story import generate_local_story  # noqa: E402
+from .ephemeral_pg import ephemeral_postgres, prepare_schema  # noqa: E402
+
+# Projections and response models of GET /api/stories (see app/main.py)
+PROJECTIONS = {
+    "full": ("""
+        id, title, content, theme, characters, setting, age_group, language, is_public, user_id,
+        created_at, updated_at
+    """, List[StoryResponse]),
+    "summary": ("""
+        id, title, theme, characters, setting, age_group, language, is_public, user_id, created_at,
+        left(content, 200) AS excerpt
+    """, List[StorySummary]),
+}
+
+PRESETS = [("Dragon", "Mountain", "Friendship"), ("Pirate", "Ship", "Treasure Hunt"),
+           ("Robot", "Future City", "Technology"), ("Wizard", "Magic School", "Learning")]
+
+
+async def insert_stories(conn, count: int):
+    """Insert count locally generated public stories"""
+    rows = []
+    for index in range(count):
+        character, setting, theme = PRESETS[index % len(PRESETS)]
+        prompt = StoryPrompt(character_type=character, setting_type=setting, theme_type=theme,
+                             age_group="6-8", story_length="medium")
+        title, content = generate_local_story(prompt, seed=index)
+        rows.append((title, content, theme, [character], setting, "6-8", "en", True))
+    await conn.executemany(
+        "INSERT INTO stories (title, content, theme, characters, setting, age_group, language, is_public) "
+        "VALUES ($1, $2, $3, $4, $5, $6, $7, $8)",
+        rows
+    )
+
+
+async def pydantic_body(field, rows) -> bytes:
+    content = await serialize_response(field=field, response_content=[dict(row) for row in rows])
+    return JSONResponse(content).body
+
+
+async def orjson_body(field, rows) -> bytes:
+    return FastJSONResponse(records(rows)).body
+
+
+async def time_path(render, field, rows, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        body = await render(field, rows)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), body
+
+
+async def run(dsn: str, sizes: List[int], iterations: int):
+    conn = await asyncpg.connect(dsn)
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        # Inserted in this transaction, so they are the newest rows
+        await insert_stories(conn, max(sizes))
+        await conn.execute("ANALYZE stories")
+        results = []
+        for size in sizes:
+            # Fewer repetitions for the largest lists keeps the run short
+            repeat = max(3, iterations * 100 // max(size, 100))
+            for projection, (columns, model) in PROJECTIONS.items():
+                field = create_response_field(name=f"Response_{projection}", type_=model, mode="serialization")
+                query = f"SELECT {columns} FROM stories ORDER BY created_at DESC, id DESC LIMIT $1"
+
+                fetches = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    rows = await conn.fetch(query, size)
+                    fetches.append(time.perf_counter() - start)
+
+                current, current_body = await time_path(pydantic_body, field, rows, repeat)
+                fast, fast_body = await time_path(orjson_body, field, rows, repeat)
+                if json.loads(current_body) != json.loads(fast_body):
+                    raise RuntimeError(f"Bodies differ for {size} {projection} stories")
+
+                results.append({
+                    "stories": size,
+                    "projection": projection,
+                    "body_bytes": len(fast_body),
+                    "fetch_ms": round(statistics.median(fetches) * 1000, 3),
+                    "pydantic_ms": round(current * 1000, 3),
+                    "orjson_ms": round(fast * 1000, 3),
+                    "speedup": round(current / fast, 1),
+                })
+        return results
+    finally:
+        await transaction.rollback()
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,100,10000", help="comma-separated list sizes")
+    parser.add_argument("--iterations", type=int, default=20, help="repetitions for lists of up to 100 stories")
+    parser.add_argument("--database-url", help="use this database instead of an ephemeral one")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with ExitStack() as stack:
+        if args.database_url:
+            prepare_schema(args.database_url)
+            dsn = args.database_url
+        else:
+            dsn = stack.enter_context(ephemeral_postgres())
+        results = asyncio.run(run(dsn, sizes, args.iterations))
+
+    print(json.dumps({"iterations": args.iterations, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Serves ``POST /v1/chat/completions`` with configurable latency, token rate
+and error rate, in both streaming (SSE) and non-streaming mode. Point the
+API at it with ``OPENAI_BASE_URL=http://127.0.0.1:<port>``.
+
+    python -m benchmarks.fake_llm --port 8765 --latency 0.5 --token-rate 80
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "once upon a time there was a brave little dragon who lived on a tall mountain "
+    "every morning the dragon flew over the forest and said hello to the birds "
+    "one day a storm came and the dragon helped a lost fox find its way home "
+    "they became the best of friends and shared many adventures together"
+).split()
+
+
+def create_app(latency: float = 0.5, token_rate: float = 80.0, tokens: int = 400,
+               error_rate: float = 0.0, rate_limit_rate: float = 0.0) -> FastAPI:
+    """Build the fake completion server.
+
+    ``latency`` is the delay before the first token, ``token_rate`` the
+    tokens per second after that, ``tokens`` the length of each answer.
+    ``error_rate`` and ``rate_limit_rate`` are the fractions of calls that
+    fail with 500 and 429 respectively.
+    """
+    app = FastAPI()
+    app.state.calls = 0
+
+    def story_tokens():
+        rng = random.Random()
+        for i in range(tokens):
+            word = rng.choice(WORDS)
+            yield word + ("\n\n" if i % 60 == 59 else " ")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+
+        roll = random.random()
+        if roll < rate_limit_rate:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (fake)"}},
+                status_code=429, headers={"Retry-After": "1"}
+            )
+        if roll < rate_limit_rate + error_rate:
+            await asyncio.sleep(latency)
+            return JSONResponse({"error": {"message": "Internal error (fake)"}}, status_code=500)
+
+        await asyncio.sleep(latency)
+        model = body.get("model", "fake-model")
+
+        if body.get("stream"):
+            async def events():
+                interval = 1.0 / token_rate if token_rate > 0 else 0
+                for token in story_tokens():
+                    chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": token}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    if interval:
+                        await asyncio.sleep(interval)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        if token_rate > 0:
+            await asyncio.sleep(tokens / token_rate)
+        content = "".join(story_tokens()).strip()
+        return {
+            "id": f"fake-{time.time_ns()}",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": tokens, "total_tokens": tokens + 100},
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": app.state.calls}
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=80.0, help="tokens per second (0 = instant)")
+    parser.add_argument("--tokens", type=int, default=400, help="tokens per answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+
+
+def app_from_args(args) -> FastAPI:
+    return create_app(args.latency, args.token_rate, args.tokens, args.error_rate, args.rate_limit_rate)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(app_from_args(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
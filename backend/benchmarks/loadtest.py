@@ -0,0 +1,302 @@
+"""Mixed-workload load test for the StoryTeller API.
+
+Starts the fake completion server, a throwaway Postgres (or uses
+``--database-url``) and the FastAPI app under uvicorn, then drives a
+weighted mix of generate/list/get/save/login requests at each concurrency
+level and prints p50/p95/p99 latency and requests/sec as JSON.
+
+The API runs with RATE_LIMIT_ENABLED=false unless ``--api-env`` says
+otherwise. 429s from the generation budget are counted as
+``rate_limited`` and are not included in the latency, rps or error figures.
+
+    python -m benchmarks.loadtest --concurrency 1,8,32 --duration 20 \\
+        --mix generate=1,list=4,get=8,save=2,login=2 --output results.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List
+
+import httpx
+
+from .ephemeral_pg import BACKEND_DIR, ephemeral_postgres, free_port, prepare_schema
+from . import fake_llm
+
+DEFAULT_MIX = "generate=1,list=4,get=8,save=2,login=2"
+BENCH_PASSWORD = "benchmark-password-1"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@contextmanager
+def run_process(args: List[str], env: dict, health_url: str, timeout: float = 60.0):
+    """Run a server subprocess until the block exits, waiting for health_url first"""
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(args, cwd=BACKEND_DIR, env={**os.environ, **env},
+                               stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                log.seek(0)
+                raise RuntimeError(f"{' '.join(args[1:4])} exited early:\n{log.read().decode()[-2000:]}")
+            try:
+                if httpx.get(health_url, timeout=1.0).status_code < 500:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Timed out waiting for {health_url}")
+            time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+class Workload:
+    """Shared state for the request mix (seeded users, stories and prompts)"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.users: List[dict] = []
+        self.story_ids: List[int] = []
+        self.prompts: List[dict] = []
+
+    async def seed(self, users: int, stories: int):
+        response = await self.client.get("/api/story-prompts")
+        response.raise_for_status()
+        self.prompts = response.json()
+
+        run_id = f"{int(time.time())}{random.randint(0, 9999):04d}"
+        for i in range(users):
+            email = f"bench-{run_id}-{i}@example.com"
+            response = await self.client.post("/api/register", json={
+                "username": f"bench_{run_id}_{i}", "email": email, "password": BENCH_PASSWORD,
+            })
+            response.raise_for_status()
+            self.users.append({**response.json(), "email": email})
+
+        for _ in range(stories):
+            response = await self.generate()
+            response.raise_for_status()
+
+    def _prompt(self) -> dict:
+        preset = random.choice(self.prompts)
+        return {
+            "character_type": preset["character_type"],
+            "setting_type": preset["setting_type"],
+            "theme_type": preset["theme_type"],
+            "age_group": preset["age_group"],
+            "language": preset["language"],
+            "user_id": random.choice(self.users)["id"] if self.users else None,
+        }
+
+    async def generate(self):
+        response = await self.client.post("/api/generate-story", json=self._prompt())
+        if response.status_code == 200:
+            self.story_ids.append(response.json()["id"])
+        return response
+
+    async def list(self):
+        user = random.choice(self.users)
+        return await self.client.get("/api/stories", params={"user_id": user["id"], "limit": 20})
+
+    async def get(self):
+        return await self.client.get(f"/api/stories/{random.choice(self.story_ids)}")
+
+    async def save(self):
+        return await self.client.post("/api/saved-stories", json={
+            "story_id": random.choice(self.story_ids), "user_id": random.choice(self.users)["id"],
+        })
+
+    async def login(self):
+        user = random.choice(self.users)
+        return await self.client.post("/api/login", json={"email": user["email"], "password": BENCH_PASSWORD})
+
+
+# Operation name -> (Workload method, status codes counted as success)
+OPERATIONS = {
+    "generate": ("generate", {200}),
+    "list": ("list", {200}),
+    "get": ("get", {200, 304}),
+    "save": ("save", {200, 400}),  # 400 = already saved by this user
+    "login": ("login", {200}),
+}
+
+
+async def run_level(workload: Workload, mix: Dict[str, float], concurrency: int, duration: float) -> dict:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    rate_limited: Dict[str, int] = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+
+    async def user_loop():
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            method, ok_statuses = OPERATIONS[name]
+            start = time.perf_counter()
+            try:
+                response = await getattr(workload, method)()
+                if response.status_code == 429:
+                    # Refused by the generation budget before any work was done
+                    rate_limited[name] += 1
+                    continue
+                ok = response.status_code in ok_statuses
+            except httpx.HTTPError:
+                ok = False
+            samples[name].append(time.perf_counter() - start)
+            if not ok:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user_loop() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    operations = {}
+    for name in names:
+        latencies = sorted(samples[name])
+        operations[name] = {
+            "count": len(latencies),
+            "errors": errors[name],
+            "rate_limited": rate_limited[name],
+            "rps": round(len(latencies) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    all_latencies = sorted(value for values in samples.values() for value in values)
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(all_latencies),
+        "errors": sum(errors.values()),
+        "rate_limited": sum(rate_limited.values()),
+        "rps": round(len(all_latencies) / elapsed, 2),
+        "p50_ms": round(percentile(all_latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(all_latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 99) * 1000, 2),
+        "operations": operations,
+    }
+
+
+async def drive(api_url: str, args) -> List[dict]:
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=args.request_timeout) as client:
+        workload = Workload(client)
+        await workload.seed(args.users, args.stories)
+        results = []
+        for concurrency in args.concurrency:
+            if args.warmup > 0:
+                await run_level(workload, args.mix, concurrency, args.warmup)
+            results.append(await run_level(workload, args.mix, concurrency, args.duration))
+            print(f"concurrency={concurrency}: {results[-1]['rps']} req/s, p99 {results[-1]['p99_ms']} ms",
+                  file=sys.stderr)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=lambda s: [int(v) for v in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--users", type=int, default=20, help="users registered before the run")
+    parser.add_argument("--stories", type=int, default=20, help="stories generated before the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--database-url", help="use this database instead of an ephemeral one")
+    parser.add_argument("--api-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the API process (repeatable)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    fake_llm.add_arguments(parser)
+    args = parser.parse_args()
+
+    llm_port, api_port = free_port(), free_port()
+    with ExitStack() as stack:
+        if args.database_url:
+            prepare_schema(args.database_url)
+            database_url = args.database_url
+        else:
+            database_url = stack.enter_context(ephemeral_postgres())
+
+        stack.enter_context(run_process(
+            [sys.executable, "-m", "benchmarks.fake_llm", "--port", str(llm_port),
+             "--latency", str(args.latency), "--token-rate", str(args.token_rate),
+             "--tokens", str(args.tokens), "--error-rate", str(args.error_rate),
+             "--rate-limit-rate", str(args.rate_limit_rate)],
+            {}, f"http://127.0.0.1:{llm_port}/stats"
+        ))
+
+        api_env = {
+            "DATABASE_URL": database_url,
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}",
+            # A few synthetic users would exhaust their generation budget at once
+            "RATE_LIMIT_ENABLED": "false",
+        }
+        api_env.update(item.split("=", 1) for item in args.api_env)
+        stack.enter_context(run_process(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(api_port), "--workers", str(args.workers), "--log-level", "warning"],
+            api_env, f"http://127.0.0.1:{api_port}/health"
+        ))
+
+        levels = asyncio.run(drive(f"http://127.0.0.1:{api_port}", args))
+
+    report = {
+        "config": {
+            "mix": args.mix,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "fake_llm": {
+                "latency_s": args.latency, "token_rate": args.token_rate, "tokens": args.tokens,
+                "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate,
+            },
+            "api_env": dict(item.split("=", 1) for item in args.api_env),
+        },
+        "host": {"python": platform.python_version(), "cpu_count": os.cpu_count(), "platform": platform.platform()},
+        "levels": levels,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
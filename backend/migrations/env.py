@@ -0,0 +1,57 @@
+import os
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+# Migrations are plain SQL, so there is no model metadata to compare against
+target_metadata = None
+
+# Held while migrating so replicas starting at the same time run migrations one by one
+MIGRATION_LOCK_ID = 7_401_002
+
+
+def database_url() -> str:
+    url = config.get_main_option("sqlalchemy.url") or os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set")
+    # SQLAlchemy needs the driver-qualified scheme for old-style URLs
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def run_migrations_offline():
+    """Emit the migration SQL instead of running it (alembic upgrade --sql)"""
+    context.configure(url=database_url(), target_metadata=target_metadata, literal_binds=True,
+                      transaction_per_migration=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    engine = create_engine(database_url(), poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        connection.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK_ID})")
+        # The lock belongs to the session; commit so alembic starts from a clean transaction
+        connection.commit()
+        try:
+            # One transaction per revision, so CREATE INDEX CONCURRENTLY can run in
+            # an autocommit block without undoing earlier revisions
+            context.configure(connection=connection, target_metadata=target_metadata,
+                              transaction_per_migration=True)
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            connection.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_ID})")
+            connection.commit()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
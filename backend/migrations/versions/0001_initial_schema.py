@@ -0,0 +1,187 @@
+"""Initial schema
+
+Creates the tables, indexes and triggers that ``app/setup.py`` used to
+create directly. Every statement is idempotent, so databases created by
+the old setup script upgrade to this revision without changes.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(100) NOT NULL UNIQUE,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stories (
+        id SERIAL PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        content TEXT NOT NULL,
+        theme VARCHAR(100),
+        characters TEXT[],
+        setting VARCHAR(100),
+        age_group VARCHAR(50),
+        language VARCHAR(10),
+        user_id INTEGER REFERENCES users(id),
+        is_public BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS story_prompts (
+        id SERIAL PRIMARY KEY,
+        character_type VARCHAR(100) NOT NULL,
+        setting_type VARCHAR(100) NOT NULL,
+        theme_type VARCHAR(100) NOT NULL,
+        age_group VARCHAR(50) NOT NULL,
+        language VARCHAR(10) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS saved_stories (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id),
+        story_id INTEGER REFERENCES stories(id),
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(user_id, story_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_saved_stories_user_created
+    ON saved_stories (user_id, created_at DESC, id DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stories_user_created
+    ON stories (user_id, created_at DESC, id DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stories_public_created
+    ON stories (is_public, created_at DESC, id DESC)
+    """,
+    """
+    ALTER TABLE stories ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector(
+            CASE WHEN language = 'sv' THEN 'swedish'::regconfig ELSE 'english'::regconfig END,
+            coalesce(title, '')), 'A') ||
+        setweight(to_tsvector(
+            CASE WHEN language = 'sv' THEN 'swedish'::regconfig ELSE 'english'::regconfig END,
+            coalesce(theme, '') || ' ' || coalesce(setting, '')), 'B') ||
+        setweight(to_tsvector(
+            CASE WHEN language = 'sv' THEN 'swedish'::regconfig ELSE 'english'::regconfig END,
+            coalesce(content, '')), 'C')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stories_search
+    ON stories USING GIN (search_vector)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stories_characters
+    ON stories USING GIN (characters)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stories_facets
+    ON stories (language, age_group, theme, setting)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS generation_cache (
+        cache_key CHAR(64) NOT NULL,
+        variant SMALLINT NOT NULL,
+        story JSONB NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (cache_key, variant)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_generation_cache_last_used
+    ON generation_cache (last_used_at)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS story_jobs (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        prompt JSONB NOT NULL,
+        user_id INTEGER REFERENCES users(id),
+        story_id INTEGER REFERENCES stories(id),
+        error TEXT,
+        attempts SMALLINT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP WITH TIME ZONE,
+        finished_at TIMESTAMP WITH TIME ZONE
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_story_jobs_pending
+    ON story_jobs (created_at) WHERE status IN ('queued', 'running')
+    """,
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+        key VARCHAR(100) PRIMARY KEY,
+        tokens DOUBLE PRECISION NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS catalog_versions (
+        name VARCHAR(50) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    INSERT INTO catalog_versions (name) VALUES ('story_prompts')
+    ON CONFLICT (name) DO NOTHING
+    """,
+    """
+    CREATE OR REPLACE FUNCTION bump_story_prompts_version() RETURNS trigger AS $$
+    DECLARE
+        new_version BIGINT;
+    BEGIN
+        UPDATE catalog_versions SET version = version + 1
+        WHERE name = 'story_prompts'
+        RETURNING version INTO new_version;
+        PERFORM pg_notify('story_prompts_changed', new_version::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DROP TRIGGER IF EXISTS story_prompts_changed ON story_prompts
+    """,
+    """
+    CREATE TRIGGER story_prompts_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON story_prompts
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_story_prompts_version()
+    """
+)
+
+
+
+def upgrade():
+    for statement in STATEMENTS:
+        op.execute(statement)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS story_prompts_changed ON story_prompts")
+    op.execute("DROP FUNCTION IF EXISTS bump_story_prompts_version()")
+    for table in ("catalog_versions", "rate_limit_buckets", "story_jobs", "generation_cache",
+                  "saved_stories", "story_prompts", "stories", "users"):
+        op.execute(f"DROP TABLE IF EXISTS {table}")
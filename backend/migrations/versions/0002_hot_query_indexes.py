@@ -0,0 +1,53 @@
+"""Indexes for foreign keys and hot queries
+
+Built with CREATE INDEX CONCURRENTLY so they can be added to a live
+database without blocking writes. ``stories.user_id`` needs no index of
+its own: it leads ``idx_stories_user_created`` from the initial schema.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# name -> index definition
+INDEXES = {
+    # Joins from stories to their saves and the FK check when a story is deleted
+    "idx_saved_stories_story_id": "ON saved_stories (story_id)",
+    # FK checks when stories or users are deleted; most jobs have a story only once done
+    "idx_story_jobs_story_id": "ON story_jobs (story_id) WHERE story_id IS NOT NULL",
+    "idx_story_jobs_user_id": "ON story_jobs (user_id) WHERE user_id IS NOT NULL",
+    # Generation cache warm-up and TTL eviction filter on created_at
+    "idx_generation_cache_created": "ON generation_cache (created_at)",
+}
+
+
+def create_index_concurrently(name: str, definition: str):
+    """CREATE INDEX CONCURRENTLY, replacing an invalid index left by an interrupted build"""
+    context = op.get_context()
+    with context.autocommit_block():
+        # Offline (--sql) runs cannot inspect the database
+        invalid = not context.as_sql and op.get_bind().execute(
+            text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": name},
+        ).scalar()
+        if invalid:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
+
+def upgrade():
+    for name, definition in INDEXES.items():
+        create_index_concurrently(name, definition)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
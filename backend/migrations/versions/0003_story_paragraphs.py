@@ -0,0 +1,72 @@
+"""Store stories split into paragraphs
+
+Adds ``story_paragraphs`` (one row per non-empty line of a story, the
+same split the frontend renders) and per-story totals, and backfills
+both for existing stories so paragraph ranges can be read without
+loading the whole content.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS story_paragraphs (
+            story_id INTEGER NOT NULL REFERENCES stories(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            word_count INTEGER NOT NULL,
+            PRIMARY KEY (story_id, position)
+        )
+        """
+    )
+    op.execute("ALTER TABLE stories ADD COLUMN IF NOT EXISTS paragraph_count INTEGER")
+    op.execute("ALTER TABLE stories ADD COLUMN IF NOT EXISTS word_count INTEGER")
+
+    # Mirrors main.split_paragraphs: split on line breaks, trim, drop empty lines.
+    # Whitespace is spelled out since \s depends on the database's locale.
+    op.execute(
+        r"""
+        INSERT INTO story_paragraphs (story_id, position, content, word_count)
+        SELECT story_id,
+               row_number() OVER (PARTITION BY story_id ORDER BY n) - 1,
+               text,
+               array_length(regexp_split_to_array(text, '[ \t\n\r\f\v]+'), 1)
+        FROM (
+            SELECT s.id AS story_id, p.n, regexp_replace(p.text, '^[ \t\r\f\v]+|[ \t\r\f\v]+$', '', 'g') AS text
+            FROM stories s
+            CROSS JOIN LATERAL regexp_split_to_table(s.content, '\n') WITH ORDINALITY AS p(text, n)
+            WHERE s.paragraph_count IS NULL
+        ) lines
+        WHERE text <> ''
+        ON CONFLICT (story_id, position) DO NOTHING
+        """
+    )
+    op.execute(
+        """
+        UPDATE stories s
+        SET paragraph_count = COALESCE(totals.paragraphs, 0),
+            word_count = COALESCE(totals.words, 0)
+        FROM stories t
+        LEFT JOIN (
+            SELECT story_id, count(*) AS paragraphs, sum(word_count) AS words
+            FROM story_paragraphs GROUP BY story_id
+        ) totals ON totals.story_id = t.id
+        WHERE s.id = t.id AND s.paragraph_count IS NULL
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS story_paragraphs")
+    op.execute("ALTER TABLE stories DROP COLUMN IF EXISTS paragraph_count")
+    op.execute("ALTER TABLE stories DROP COLUMN IF EXISTS word_count")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# app.main reads these at import time; the tests never call the real API
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("PREGEN_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.main import decode_story_cursor, encode_story_cursor
+
+
+@pytest.mark.parametrize("created_at", [
+    datetime(2026, 10, 18, 12, 30, 5, 123456, tzinfo=timezone.utc),
+    datetime(2026, 1, 1, tzinfo=timezone(timedelta(hours=2))),
+    datetime(2026, 1, 1, 8, 0),
+])
+def test_cursor_round_trip(created_at):
+    cursor = encode_story_cursor(created_at, 4711)
+    # Safe in a query string without escaping
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_story_cursor(cursor) == (created_at, 4711)
+
+
+def b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor!",
+    "é",
+    b64(b"2026-10-18T12:30:05"),
+    b64(b"yesterday,12"),
+    b64(b"2026-10-18T12:30:05,twelve"),
+    b64(b"\xff\xfe,12"),
+])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_story_cursor(cursor)
+    assert raised.value.status_code == 400
+
+
+def test_stories_endpoint_rejects_bad_cursor():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    # No lifespan: the cursor is rejected before the database is touched
+    response = TestClient(app).get("/api/stories", params={"cursor": b64(b"yesterday,12")})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
@@ -0,0 +1,74 @@
+import itertools
+
+import pytest
+
+from app.local_story import (
+    AGE_SENTENCES, EPISODE, GRAMMAR, LENGTH_EPISODES, PLOT_END, PLOT_START, generate_local_story,
+)
+from app.main import split_paragraphs
+from app.schemas import StoryPrompt
+
+# A few catalog presets per language (see app/setup.py), including two-word nouns
+PRESETS = {
+    "en": [("Princess", "Castle", "Adventure"), ("Astronaut", "Space", "Discovery"),
+           ("Wizard", "Magic School", "Learning"), ("Robot", "Future City", "Technology")],
+    "sv": [("Prinsessa", "Slott", "Äventyr"), ("Astronaut", "Rymden", "Upptäckt"),
+           ("Trollkarl", "Magiskola", "Lärande"), ("Drake", "Berg", "Vänskap")],
+}
+
+
+def prompt(language, age_group, story_length, preset=0):
+    character, setting, theme = PRESETS[language][preset]
+    return StoryPrompt(character_type=character, setting_type=setting, theme_type=theme,
+                       age_group=age_group, language=language, story_length=story_length)
+
+
+@pytest.mark.parametrize("language,age_group,story_length",
+                         list(itertools.product(GRAMMAR, AGE_SENTENCES, LENGTH_EPISODES)))
+def test_renders_every_combination(language, age_group, story_length):
+    for preset in range(len(PRESETS[language])):
+        for seed in range(5):
+            title, content = generate_local_story(prompt(language, age_group, story_length, preset), seed=seed)
+
+            assert title.strip() and "\n" not in title
+            assert "{" not in title + content and "}" not in title + content
+            paragraphs = content.split("\n\n")
+            episodes = LENGTH_EPISODES[story_length]
+            assert len(paragraphs) == len(PLOT_START) + episodes * len(EPISODE) + len(PLOT_END) + 1
+            assert paragraphs[-1] == GRAMMAR[language]["the_end"]
+            assert all(paragraph.strip() == paragraph and paragraph for paragraph in paragraphs)
+            # Stored and served as the same paragraphs
+            assert [text for text, _ in split_paragraphs(content)] == paragraphs
+
+
+def test_older_listeners_get_longer_paragraphs():
+    def words(age_group):
+        contents = [generate_local_story(prompt("en", age_group, "medium"), seed=seed)[1] for seed in range(20)]
+        return sum(len(content.split()) for content in contents)
+
+    assert words("3-5") < words("6-8") < words("9-12")
+
+
+def test_seed_makes_stories_repeatable():
+    story = prompt("sv", "6-8", "long")
+    assert generate_local_story(story, seed=3) == generate_local_story(story, seed=3)
+    contents = {generate_local_story(story, seed=seed)[1] for seed in range(20)}
+    assert len(contents) == 20
+
+
+def test_uses_prompt_words():
+    title, content = generate_local_story(prompt("en", "6-8", "short", preset=2), seed=1)
+    assert "a wizard" in content.lower() and "magic school" in content.lower()
+    title, content = generate_local_story(prompt("sv", "6-8", "short", preset=3), seed=1)
+    # Neuter noun with its definite form
+    assert "ett berg" in content or "berget" in content
+
+
+def test_unknown_language_and_options_fall_back():
+    story = StoryPrompt(character_type="Dragon", setting_type="Mountain", theme_type="Friendship",
+                        age_group="adult", language="fi", story_length="epic")
+    title, content = generate_local_story(story, seed=1)
+    paragraphs = content.split("\n\n")
+    assert paragraphs[-1] == GRAMMAR["en"]["the_end"]
+    # Default of two episodes, as for a medium story
+    assert len(paragraphs) == len(PLOT_START) + 2 * len(EPISODE) + len(PLOT_END) + 1
@@ -0,0 +1,92 @@
+import os
+import importlib.util
+
+import pytest
+
+from app.main import split_paragraphs
+from app.local_story import generate_local_story
+from app.schemas import StoryPrompt
+
+MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "migrations", "versions", "0003_story_paragraphs.py")
+
+CONTENTS = [
+    "",
+    "One line without a break",
+    "First paragraph.\n\nSecond paragraph.\n\nThe end.",
+    "  padded  \n\t tabbed\t\n\n\n   \ntrailing newline\n",
+    "Windows\r\nline\r\nendings\r\n",
+    "several   spaces\tand\ttabs between words",
+    "Svenska: Det var en gång en drake.\n\nSlut.",
+    # No-break spaces are part of the text, whatever the database locale
+    "\u00a0indented\u00a0\n10\u00a0km away",
+]
+
+
+class RecordingOp:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql):
+        self.statements.append(sql)
+
+
+def backfill_statements():
+    """The SQL the 0003 migration runs on upgrade"""
+    spec = importlib.util.spec_from_file_location("migration_0003", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    migration.op = RecordingOp()
+    migration.upgrade()
+    return migration.op.statements
+
+
+@pytest.fixture
+def cursor():
+    psycopg2 = pytest.importorskip("psycopg2")
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        pytest.skip("DATABASE_URL is not set")
+    try:
+        conn = psycopg2.connect(dsn, connect_timeout=5)
+    except psycopg2.Error as e:
+        pytest.skip(f"database unavailable: {e}")
+    try:
+        with conn.cursor() as cursor:
+            # A scratch schema inside a transaction that is rolled back
+            cursor.execute("CREATE SCHEMA paragraphs_test")
+            cursor.execute("SET LOCAL search_path TO paragraphs_test")
+            yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_split_paragraphs():
+    assert split_paragraphs(CONTENTS[3]) == [("padded", 1), ("tabbed", 1), ("trailing newline", 2)]
+    assert split_paragraphs("") == []
+    assert split_paragraphs(CONTENTS[-1]) == [("\u00a0indented\u00a0", 1), ("10\u00a0km away", 2)]
+
+
+def test_backfill_matches_split_paragraphs(cursor):
+    contents = list(CONTENTS)
+    for language in ("en", "sv"):
+        prompt = StoryPrompt(character_type="Dragon", setting_type="Mountain", theme_type="Friendship",
+                             age_group="9-12", language=language, story_length="long")
+        contents.append(generate_local_story(prompt, seed=1)[1])
+
+    cursor.execute("CREATE TABLE stories (id SERIAL PRIMARY KEY, content TEXT NOT NULL)")
+    for content in contents:
+        cursor.execute("INSERT INTO stories (content) VALUES (%s)", (content,))
+    for sql in backfill_statements():
+        cursor.execute(sql)
+
+    for story_id, content in enumerate(contents, start=1):
+        cursor.execute(
+            "SELECT content, word_count FROM story_paragraphs WHERE story_id = %s ORDER BY position",
+            (story_id,)
+        )
+        paragraphs = split_paragraphs(content)
+        assert cursor.fetchall() == paragraphs
+        cursor.execute("SELECT paragraph_count, word_count FROM stories WHERE id = %s", (story_id,))
+        assert cursor.fetchone() == (len(paragraphs), sum(words for _, words in paragraphs))
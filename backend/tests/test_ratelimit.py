@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import main, ratelimit
+from app.ratelimit import (
+    CostTooLarge, GenerationRateLimiter, MemoryBuckets, RateLimited, TokenBucket,
+    caller_key, estimate_tokens,
+)
+from app.schemas import StoryPrompt
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def limiter(clock, monkeypatch):
+    limiter = GenerationRateLimiter(backend="memory", enabled=True)
+    # Tokens per second and capacity, small enough to reason about
+    limiter.limits = {
+        "user": (10.0, 1000.0),
+        "ip": (100.0, 5000.0),
+        "batch": (50.0, 4000.0),
+        "global": (1000.0, 8000.0),
+    }
+    monkeypatch.setattr(main, "generation_limiter", limiter)
+    return limiter
+
+
+def prompt(**fields):
+    values = dict(character_type="Dragon", setting_type="Mountain", theme_type="Friendship", age_group="6-8")
+    values.update(fields)
+    return StoryPrompt(**values)
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=10.0, capacity=100.0)
+    bucket.tokens = 0.0
+    bucket.refill(clock.now + 3)
+    assert bucket.tokens == pytest.approx(30.0)
+    assert bucket.wait_time(50.0) == pytest.approx(2.0)
+    assert bucket.wait_time(30.0) == 0.0
+    bucket.refill(clock.now + 60)
+    assert bucket.tokens == 100.0
+
+
+def test_memory_buckets_charge_all_or_nothing(clock):
+    async def scenario():
+        buckets = MemoryBuckets()
+        specs = [("user:1", "user", 10.0, 1000.0), ("global", "global", 10.0, 500.0)]
+        await buckets.take(specs, 400)
+        with pytest.raises(RateLimited) as raised:
+            await buckets.take(specs, 400)
+        assert raised.value.scope == "global"
+        assert raised.value.retry_after == pytest.approx(30.0)
+        # The user bucket was not charged for the rejected request
+        assert buckets._buckets["user:1"].tokens == pytest.approx(600.0)
+
+    asyncio.run(scenario())
+
+
+def test_estimate_tokens():
+    assert estimate_tokens(prompt(mode="instant")) == 0
+    assert estimate_tokens(prompt(story_length="short")) == 250 + 1350
+    assert estimate_tokens(prompt(story_length="long", language="sv")) == 250 + 4000
+
+
+def test_caller_key():
+    assert caller_key(7, "10.0.0.1") == "user:7"
+    assert caller_key(None, "10.0.0.1") == "ip:10.0.0.1"
+    assert caller_key(None, None) == "ip:unknown"
+
+
+def test_charge_uses_scope_of_caller(limiter):
+    assert [spec[:2] for spec in limiter.specs("user:7")] == [("user:7", "user"), ("global", "global")]
+    assert [spec[:2] for spec in limiter.specs("ip:10.0.0.1")] == [("ip:10.0.0.1", "ip"), ("global", "global")]
+    assert [spec[:2] for spec in limiter.specs("user:7", batch=True)] == [("batch:user:7", "batch"),
+                                                                          ("global", "global")]
+
+
+def test_charge_rejects_cost_above_capacity(limiter):
+    with pytest.raises(CostTooLarge) as raised:
+        asyncio.run(limiter.charge("user:7", 1500))
+    assert (raised.value.scope, raised.value.capacity) == ("user", 1000.0)
+    # The IP bucket is larger, so an anonymous caller may send it
+    asyncio.run(limiter.charge("ip:10.0.0.1", 1500))
+
+
+def test_disabled_limiter_allows_everything(limiter):
+    limiter.enabled = False
+    asyncio.run(limiter.charge("user:7", 10 ** 9))
+
+
+def request_from(host):
+    return SimpleNamespace(client=SimpleNamespace(host=host))
+
+
+def test_budget_answers_429_with_retry_after(limiter, clock):
+    async def scenario():
+        story = prompt(story_length="short")
+        # 1600 tokens per story against a 2000-token user bucket refilling 10/s
+        limiter.limits["user"] = (10.0, 2000.0)
+        await main.charge_generation_budget(request_from("10.0.0.1"), [story], 7)
+        with pytest.raises(HTTPException) as raised:
+            await main.charge_generation_budget(request_from("10.0.0.1"), [story], 7)
+        assert raised.value.status_code == 429
+        assert raised.value.headers["Retry-After"] == "120"
+
+        clock.now += 120
+        await main.charge_generation_budget(request_from("10.0.0.1"), [story], 7)
+
+    asyncio.run(scenario())
+
+
+def test_budget_answers_413_with_stories_that_fit(limiter):
+    async def scenario():
+        stories = [prompt(story_length="short")] * 3
+        with pytest.raises(HTTPException) as raised:
+            await main.charge_generation_budget(request_from("10.0.0.1"), stories, 7, batch=True)
+        assert raised.value.status_code == 413
+        # 4000-token batch bucket / 1600 tokens per story
+        assert raised.value.detail.endswith("send at most 2 stories like these per request")
+
+        await main.charge_generation_budget(request_from("10.0.0.1"), stories[:2], 7, batch=True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,204 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import resilience
+from app.llm import LLMClient
+from app.resilience import AdaptiveLimiter, CircuitBreaker, RetryBudget, CLOSED, OPEN, HALF_OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Only the breaker, budget and limiter see it; the event loop keeps real time
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def make_breaker(**kwargs):
+    options = dict(window=30, min_calls=4, error_rate=0.5, slow_call_seconds=10,
+                   slow_rate=0.5, open_seconds=30, half_open_calls=2)
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(breaker.allow(), False, 0.1)
+
+
+def test_breaker_opens_on_error_rate(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(breaker.allow(), False, 0.1)
+    # Below min_calls nothing happens yet
+    assert breaker.state == CLOSED
+    breaker.record(breaker.allow(), True, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+    assert breaker.stats == {"opened": 1, "rejected": 1}
+
+
+def test_breaker_opens_on_slow_calls(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(breaker.allow(), True, 12.0)
+    assert breaker.state == OPEN
+
+
+def test_breaker_forgets_outcomes_outside_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(breaker.allow(), False, 0.1)
+    clock.now += 31
+    breaker.record(breaker.allow(), False, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_half_open_closes_after_probes(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 29
+    assert breaker.allow() is None
+    assert breaker.retry_after == pytest.approx(1.0)
+
+    clock.now += 1
+    first, second = breaker.allow(), breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only half_open_calls probes at a time
+    assert breaker.allow() is None
+    breaker.record(first, True, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record(second, True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_half_open_failure_reopens(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 30
+    breaker.record(breaker.allow(), False, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.retry_after == pytest.approx(30.0)
+
+
+def test_breaker_ignores_outcomes_from_earlier_state(clock):
+    breaker = make_breaker()
+    stale = breaker.allow()
+    trip(breaker)
+    clock.now += 30
+    probe = breaker.allow()
+    # A call admitted while closed neither closes nor reopens the breaker
+    breaker.record(stale, True, 0.1)
+    breaker.record(stale, False, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.cancel(stale)
+    breaker.record(probe, True, 0.1)
+    breaker.record(breaker.allow(), True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_cancel_returns_probe(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 30
+    probes = [breaker.allow(), breaker.allow()]
+    assert breaker.allow() is None
+    breaker.cancel(probes[0])
+    assert breaker.allow() is not None
+
+
+def test_cancelled_while_queued_releases_probe(clock):
+    async def scenario():
+        client = LLMClient(max_concurrency=1, min_concurrency=1)
+        breaker = client.breaker = make_breaker(half_open_calls=1)
+        trip(breaker)
+        clock.now += 30
+        # The only slot is taken, so the probe queues in the limiter
+        await client.limiter.acquire()
+        task = asyncio.ensure_future(client._slot().__aenter__())
+        await asyncio.sleep(0)
+        assert breaker.state == HALF_OPEN and breaker.allow() is None
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.allow() is not None
+
+    asyncio.run(scenario())
+
+
+def test_retry_budget_is_exhausted(clock):
+    budget = RetryBudget(ratio=0.5, min_per_second=0.1, window=10)
+    for _ in range(4):
+        budget.record_request()
+    # 0.5 * 4 requests + 0.1/s * 10 s
+    assert [budget.try_retry() for _ in range(4)] == [True, True, True, False]
+    assert budget.stats == {"retries": 3, "exhausted": 1}
+
+    clock.now += 11
+    assert budget.try_retry()
+
+
+def test_limiter_additive_increase(clock):
+    async def scenario():
+        limiter = AdaptiveLimiter(max_limit=4, initial=2)
+        await limiter.acquire()
+        await limiter.release()
+        assert limiter.limit == pytest.approx(2.5)
+        for _ in range(20):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 4
+
+    asyncio.run(scenario())
+
+
+def test_limiter_backs_off_once_per_cooldown(clock):
+    async def scenario():
+        limiter = AdaptiveLimiter(max_limit=16, min_limit=2, backoff=0.5, cooldown=1.0)
+        for _ in range(3):
+            await limiter.acquire()
+        for _ in range(3):
+            await limiter.release(overloaded=True)
+        assert limiter.limit == 8
+        clock.now += 1
+        await limiter.acquire()
+        await limiter.release(overloaded=True)
+        assert limiter.limit == 4
+        for _ in range(3):
+            clock.now += 1
+            await limiter.acquire()
+            await limiter.release(overloaded=True)
+        assert limiter.limit == 2
+
+    asyncio.run(scenario())
+
+
+def test_limiter_queues_beyond_limit(clock):
+    async def scenario():
+        limiter = AdaptiveLimiter(max_limit=1)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert (limiter.in_flight, limiter.waiting) == (1, 1)
+        await limiter.release(success=False)
+        await waiter
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+        # A cancelled waiter leaves no trace
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+    asyncio.run(scenario())
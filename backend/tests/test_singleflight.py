@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return {"title": "Shared"}
+
+        waiters = [asyncio.ensure_future(flight.do("key", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flight.in_flight == 1
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert flight.stats == {"leaders": 1, "coalesced": 4}
+        assert flight.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_and_later_calls_run_separately():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work(value):
+            calls.append(value)
+            await asyncio.sleep(0)
+            return value
+
+        assert await asyncio.gather(flight.do("a", lambda: work(1)), flight.do("b", lambda: work(2))) == [1, 2]
+        # The first call finished, so the next one starts fresh
+        assert await flight.do("a", lambda: work(3)) == 3
+        assert calls == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def failing():
+            await release.wait()
+            raise RuntimeError("upstream down")
+
+        waiters = [asyncio.ensure_future(flight.do("key", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert [str(result) for result in results] == ["upstream down"] * 3
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        async def working():
+            return "ok"
+
+        assert await flight.do("key", working) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_cancel_the_work():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("key", work))
+        follower = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        release.set()
+        assert await follower == "done"
+
+    asyncio.run(scenario())
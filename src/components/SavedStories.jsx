@@ -2,7 +2,7 @@ import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { useLanguage } from '../contexts/LanguageContext'
 import { useUser } from '../contexts/UserContext'
-import { getStories } from '../services/api'
+import { getSavedStories } from '../services/api'
 
 const translations = {
   en: {
@@ -38,9 +38,9 @@ export default function SavedStories() {
       }
       
       try {
-        // Get stories created by the current user
-        const userStories = await getStories(user.id);
-        setStories(userStories || []);
+        // Saves and their story summaries come back in one request
+        const { saved } = await getSavedStories(user.id);
+        setStories((saved || []).map((item) => item.story));
       } catch (error) {
         console.error('Error fetching saved stories:', error);
         setError(error.message);
@@ -116,7 +116,7 @@ export default function SavedStories() {
               </p>
               <div className="h-32 bg-gray-100/20 backdrop-blur-sm rounded-lg mb-2 overflow-hidden">
                 <div className="p-2 text-xs text-gray-700 overflow-hidden line-clamp-5">
-                  {story.content.substring(0, 200)}...
+                  {story.excerpt}...
                 </div>
               </div>
               <div className="flex justify-between mt-2">
@@ -2,7 +2,7 @@ import { useState, useEffect } from 'react'
 import { useNavigate, useLocation } from 'react-router-dom'
 import { useLanguage } from '../contexts/LanguageContext'
 import { useUser } from '../contexts/UserContext'
-import { saveStory, getStoryById } from '../services/api'
+import { saveStory, getStoryParagraphs } from '../services/api'
 import AuthModal from './AuthModal'
 
 const translations = {
@@ -17,7 +17,8 @@ const translations = {
     errorSaving: 'Error saving story. Please try again.',
     loginRequired: 'You need to log in to save stories.',
     publicStory: "This is a public story. Log in to save your own stories.",
-    loginToSave: "Login to Save"
+    loginToSave: "Login to Save",
+    readMore: 'Read more'
   },
   sv: {
     title: 'Din berättelse',
@@ -30,7 +31,8 @@ const translations = {
     errorSaving: 'Kunde inte spara berättelsen. Försök igen.',
     loginRequired: 'Du måste logga in för att spara berättelser.',
     publicStory: "Detta är en offentlig berättelse. Logga in för att spara dina egna berättelser.",
-    loginToSave: "Logga in för att spara"
+    loginToSave: "Logga in för att spara",
+    readMore: 'Läs mer'
   }
 }
 
@@ -47,6 +49,7 @@ export default function StoryDisplay() {
   const [saved, setSaved] = useState(false)
   const [error, setError] = useState(null)
   const [showAuthModal, setShowAuthModal] = useState(false)
+  const [loadingMore, setLoadingMore] = useState(false)
   
   useEffect(() => {
     const loadStory = async () => {
@@ -57,10 +60,16 @@ export default function StoryDisplay() {
         const params = new URLSearchParams(location.search)
         const storyId = params.get('storyId')
         
-        // If storyId is in URL, get story from API
+        // If storyId is in URL, fetch the first page of paragraphs from the API
         if (storyId) {
-          const fetchedStory = await getStoryById(parseInt(storyId))
-          setStory(fetchedStory)
+          const page = await getStoryParagraphs(parseInt(storyId))
+          setStory({
+            id: page.story_id,
+            title: page.title,
+            age_group: page.age_group,
+            paragraphs: page.paragraphs.map(paragraph => paragraph.content),
+            nextFrom: page.next_from
+          })
         } else {
           // Otherwise, try to load from localStorage
           const storedStory = localStorage.getItem('generatedStory')
@@ -109,6 +118,25 @@ export default function StoryDisplay() {
     }
   }
   
+  const handleReadMore = async () => {
+    if (!story || story.nextFrom === null || story.nextFrom === undefined) return
+    
+    try {
+      setLoadingMore(true)
+      const page = await getStoryParagraphs(story.id, story.nextFrom)
+      setStory(current => ({
+        ...current,
+        paragraphs: [...current.paragraphs, ...page.paragraphs.map(paragraph => paragraph.content)],
+        nextFrom: page.next_from
+      }))
+    } catch (err) {
+      console.error('Failed to load more of the story:', err)
+      setError(t.errorLoading)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+  
   const handleCreateNew = () => {
     navigate('/create-story')
   }
@@ -206,11 +234,23 @@ export default function StoryDisplay() {
           </div>
           
           <div className="story-content prose max-w-none mb-8 whitespace-pre-line">
-            {story?.content.split('\n').map((paragraph, index) => (
+            {(story?.paragraphs || story?.content.split('\n')).map((paragraph, index) => (
               <p key={index} className="mb-4">{paragraph}</p>
             ))}
           </div>
           
+          {story?.nextFrom !== null && story?.nextFrom !== undefined && (
+            <div className="flex justify-center mb-8">
+              <button
+                onClick={handleReadMore}
+                disabled={loadingMore}
+                className="px-6 py-3 bg-primary text-white rounded-xl hover:bg-opacity-90 transition-colors duration-200"
+              >
+                {loadingMore ? '...' : t.readMore}
+              </button>
+            </div>
+          )}
+          
           <div className="flex flex-wrap justify-center gap-4 mt-8">
             <button
               onClick={handleCreateNew}
@@ -183,4 +183,56 @@ export const saveStory = async (storyId) => {
     console.error('Error saving story:', error);
     throw error;
   }
-}; 
\ No newline at end of file
+};
+
+/**
+ * Get the stories a user has saved, most recently saved first
+ * @param {number} userId - User ID
+ * @param {string} cursor - Optional cursor from a previous page
+ * @returns {Promise} - { saved: Array of saves with story summaries, nextCursor }
+ */
+export const getSavedStories = async (userId, cursor) => {
+  const params = new URLSearchParams({ user_id: userId });
+  if (cursor) params.append('cursor', cursor);
+  
+  try {
+    const response = await fetch(`${API_URL}/saved-stories?${params.toString()}`);
+    
+    if (!response.ok) {
+      throw new Error(`API error: ${response.status}`);
+    }
+    
+    return {
+      saved: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor')
+    };
+  } catch (error) {
+    console.error('Error fetching saved stories:', error);
+    throw error;
+  }
+};
+
+/**
+ * Get a range of a story's paragraphs
+ * @param {number} storyId - Story ID
+ * @param {number} from - First paragraph (0-based)
+ * @param {number} to - Optional end of the range (exclusive)
+ * @returns {Promise} - { title, paragraphs, next_from, total_paragraphs, total_words, ... }
+ */
+export const getStoryParagraphs = async (storyId, from = 0, to) => {
+  const params = new URLSearchParams({ from });
+  if (to !== undefined) params.append('to', to);
+  
+  try {
+    const response = await fetch(`${API_URL}/stories/${storyId}/paragraphs?${params.toString()}`);
+    
+    if (!response.ok) {
+      throw new Error(`API error: ${response.status}`);
+    }
+    
+    return await response.json();
+  } catch (error) {
+    console.error(`Error fetching paragraphs of story ${storyId}:`, error);
+    throw error;
+  }
+};